@@ -0,0 +1,258 @@
+"""
+Local stand-in for the generativelanguage API used by GoogleLLMService.
+
+Serves generateContent, streamGenerateContent (SSE), embedContent and
+batchEmbedContents under /v1beta/models/<model>:<method>, plus create/delete
+of /v1beta/cachedContents (referenced from generateContent via
+"cachedContent"), with configurable latency and 429 injection so benchmarks
+never spend API quota.
+
+Run standalone:
+    python benchmarks/mock_gemini.py --port 8085 --latency-ms 300 --error-rate 0.05
+then start the API with GOOGLE_API_BASE_URL=http://127.0.0.1:8085/v1beta/models
+and any non-empty GOOGLE_API_KEY.
+"""
+import re
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIM = 768
+ROUTE = re.compile(r"^/v1beta/models/(?P<model>[^:/]+):(?P<method>\w+)")
+CACHE_ROUTE = re.compile(r"^/v1beta/(?P<name>cachedContents(?:/[^/?]+)?)")
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM):
+    """
+    Deterministic pseudo-embedding: identical text maps to the same unit
+    vector, so search results are stable across runs.
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    values = [rng.gauss(0, 1) for _ in range(dim)]
+    norm = sum(v * v for v in values) ** 0.5
+    return [v / norm for v in values]
+
+
+def fake_text(prompt: str, words: int) -> str:
+    if "Return JSON" in prompt:
+        return json.dumps({"questions": ["Could you give an example?"], "confidence_score": 60})
+    if "Topic Name" in prompt or "title" in prompt.lower():
+        return "Synthetic Topic Name"
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+    vocabulary = ["policy", "request", "approval", "system", "team", "access", "review", "deadline", "process", "manager"]
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+
+class MockConfig:
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 10, embed_latency_ms: float = 10,
+                 error_rate: float = 0.0, retry_after: float = 1, response_words: int = 60, stream_chunks: int = 5,
+                 cache_min_tokens: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.embed_latency_ms = embed_latency_ms
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.response_words = response_words
+        self.stream_chunks = stream_chunks
+        self.cache_min_tokens = cache_min_tokens
+        self.caches = {}  # cachedContents/<id> -> {"model", "text", "tools"}
+        self.requests = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def count(self, throttled: bool):
+        with self._lock:
+            self.requests += 1
+            if throttled:
+                self.throttled += 1
+
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    config: MockConfig = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _sleep(self, base_ms: float):
+        delay = max(base_ms + random.uniform(-self.config.jitter_ms, self.config.jitter_ms), 0)
+        time.sleep(delay / 1000)
+
+    def do_POST(self):
+        match = ROUTE.match(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        cache_match = CACHE_ROUTE.match(self.path)
+        if cache_match and cache_match.group("name") == "cachedContents":
+            self.config.count(False)
+            self._create_cache(payload)
+            return
+        if not match:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found"}})
+            return
+
+        throttled = random.random() < self.config.error_rate
+        self.config.count(throttled)
+        if throttled:
+            self._send_json(
+                429,
+                {"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}},
+                {"Retry-After": str(self.config.retry_after)}
+            )
+            return
+
+        model, method = match.group("model"), match.group("method")
+        if payload.get("cachedContent"):
+            cache = self.config.caches.get(payload["cachedContent"])
+            if not cache:
+                self._send_json(404, {"error": {"code": 404, "message": "CachedContent not found", "status": "NOT_FOUND"}})
+                return
+            if cache["model"] != f"models/{model}":
+                self._send_json(400, {"error": {"code": 400, "message": "Model does not match cached content"}})
+                return
+            # Behave as if the cached prefix had been sent with the request
+            payload = {**payload, "cached_text": cache["text"]}
+
+        if method == "embedContent":
+            self._sleep(self.config.embed_latency_ms)
+            text = " ".join(part.get("text", "") for part in payload.get("content", {}).get("parts", []))
+            values = fake_embedding(text)[:payload.get("outputDimensionality")]
+            self._send_json(200, {"embedding": {"values": values}})
+        elif method == "batchEmbedContents":
+            self._sleep(self.config.embed_latency_ms)
+            embeddings = []
+            for request in payload.get("requests", []):
+                text = " ".join(part.get("text", "") for part in request.get("content", {}).get("parts", []))
+                embeddings.append({"values": fake_embedding(text)[:request.get("outputDimensionality")]})
+            self._send_json(200, {"embeddings": embeddings})
+        elif method == "generateContent":
+            self._sleep(self.config.latency_ms)
+            self._send_json(200, self._generation(payload, model))
+        elif method == "streamGenerateContent":
+            self._stream(payload, model)
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": f"Unknown method {method}"}})
+
+    def do_DELETE(self):
+        match = CACHE_ROUTE.match(self.path)
+        if not match or match.group("name") not in self.config.caches:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found"}})
+            return
+        self.config.caches.pop(match.group("name"), None)
+        self._send_json(200, {})
+
+    def _create_cache(self, payload: dict):
+        text = " ".join(part.get("text", "") for part in payload.get("systemInstruction", {}).get("parts", []))
+        text += " ".join(
+            part.get("text", "") for content in payload.get("contents", []) for part in content.get("parts", [])
+        )
+        if len(text) // 4 < self.config.cache_min_tokens:
+            self._send_json(400, {"error": {
+                "code": 400,
+                "message": f"Cached content is too small. min_total_token_count={self.config.cache_min_tokens}",
+                "status": "INVALID_ARGUMENT"
+            }})
+            return
+        name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+        self.config.caches[name] = {"model": payload.get("model"), "text": text, "tools": payload.get("tools")}
+        ttl = float(str(payload.get("ttl", "3600s")).rstrip("s"))
+        self._send_json(200, {
+            "name": name,
+            "model": payload.get("model"),
+            "displayName": payload.get("displayName", ""),
+            "expireTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + ttl)),
+            "usageMetadata": {"totalTokenCount": len(text) // 4},
+        })
+
+    def _generation(self, payload: dict, model: str, text: str = None):
+        cached = payload.get("cached_text", "")
+        prompt = cached + " ".join(
+            part.get("text", "") for content in payload.get("contents", []) for part in content.get("parts", [])
+        )
+        text = text if text is not None else fake_text(prompt, self.config.response_words)
+        usage = {
+            "promptTokenCount": len(prompt) // 4,
+            "candidatesTokenCount": len(text) // 4,
+        }
+        if cached:
+            usage["cachedContentTokenCount"] = len(cached) // 4
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": usage,
+            "modelVersion": model,
+        }
+
+    def _stream(self, payload: dict, model: str):
+        # Server-sent events, one chunk per slice of the full response
+        prompt = " ".join(
+            part.get("text", "") for content in payload.get("contents", []) for part in content.get("parts", [])
+        )
+        words = fake_text(prompt, self.config.response_words).split(" ")
+        chunks = max(1, self.config.stream_chunks)
+        size = max(1, len(words) // chunks)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i in range(0, len(words), size):
+            self._sleep(self.config.latency_ms / chunks)
+            body = self._generation(payload, model, " ".join(words[i:i + size]) + " ")
+            self.wfile.write(f"data: {json.dumps(body)}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+        self.close_connection = True
+
+
+def start_mock_server(config: MockConfig = None, host: str = "127.0.0.1", port: int = 0):
+    """
+    Starts the mock server on a background thread. Returns (server, base_url)
+    where base_url is suitable for GOOGLE_API_BASE_URL.
+    """
+    handler = type("ConfiguredMockGeminiHandler", (MockGeminiHandler,), {"config": config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1beta/models"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gemini API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--embed-latency-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1)
+    parser.add_argument("--cache-min-tokens", type=int, default=0, help="Reject smaller cachedContents")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency_ms=args.latency_ms,
+        embed_latency_ms=args.embed_latency_ms,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        cache_min_tokens=args.cache_min_tokens,
+    )
+    server, base_url = start_mock_server(config, args.host, args.port)
+    print(f"Mock Gemini API listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,188 @@
+"""
+Reproducible performance benchmarks for the Knowledge Buddy API.
+
+Starts the local Gemini stand-in (benchmarks/mock_gemini.py), runs the API
+in-process against a throwaway working directory (fresh SQLite + Chroma), seeds
+synthetic agents/topics/corpora and reports:
+
+  - /chat latency p50/p99 and throughput at a given concurrency
+  - ingestion throughput (docs/sec) through add_knowledge
+  - vector search latency vs. corpus size
+
+Usage (from the api directory):
+    python benchmarks/run_benchmarks.py --chat-requests 200 --concurrency 8 --corpus-sizes 100,1000,5000
+    python benchmarks/run_benchmarks.py --latency-ms 800 --error-rate 0.05 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from benchmarks.mock_gemini import MockConfig, start_mock_server, fake_embedding
+
+WORDS = ["invoice", "refund", "vpn", "laptop", "onboarding", "expense", "holiday", "payroll",
+         "security", "password", "contract", "travel", "badge", "printer", "benefits", "deadline"]
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 2) if samples else 0.0,
+        "throughput_per_sec": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + f" #{rng.getrandbits(32)}"
+
+
+def timed_calls(fn, items: list, concurrency: int):
+    """
+    Runs fn over items with a thread pool. Returns (latencies, elapsed, failures).
+    """
+    def run(item):
+        start = time.perf_counter()
+        ok = fn(item)
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(run, items))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for latency, ok in results if ok]
+    failures = sum(1 for _, ok in results if not ok)
+    return latencies, elapsed, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Knowledge Buddy benchmark suite")
+    parser.add_argument("--agents", type=int, default=3)
+    parser.add_argument("--topics-per-agent", type=int, default=5)
+    parser.add_argument("--docs-per-topic", type=int, default=10)
+    parser.add_argument("--chat-requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--corpus-sizes", default="100,1000,5000")
+    parser.add_argument("--search-queries", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=50, help="Mock generation latency")
+    parser.add_argument("--embed-latency-ms", type=float, default=10, help="Mock embedding latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock calls answered with 429")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    mock_config = MockConfig(
+        latency_ms=args.latency_ms,
+        embed_latency_ms=args.embed_latency_ms,
+        error_rate=args.error_rate,
+        retry_after=0.2,
+    )
+    server, base_url = start_mock_server(mock_config)
+
+    # Isolated working directory: main.py opens ./knowledge_buddy.db and ./chroma_db
+    workdir = tempfile.mkdtemp(prefix="kb-bench-")
+    os.chdir(workdir)
+    os.environ.update({
+        "GOOGLE_API_KEY": "benchmark",
+        "GOOGLE_API_BASE_URL": base_url,
+        "LLM_CACHE_ENABLED": "false",
+        "LLM_RATE_LIMITS": "gemini-2.5-pro=100000,gemini-2.5-flash=100000,text-embedding-004=100000",
+        "LLM_MAX_CONCURRENCY": str(max(args.concurrency, 8)),
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
+
+    from fastapi.testclient import TestClient
+    import main as api
+
+    # Entering the client runs the app's lifespan (DB init, service clients)
+    client = TestClient(api.app)
+    client.__enter__()
+    results = {"config": vars(args), "workdir": workdir}
+
+    # --- Seed agents and topics ---
+    agents = []
+    for i in range(args.agents):
+        agent = client.post("/agents", json={"name": f"Bench Agent {i}", "description": "Synthetic benchmark agent"}).json()
+        topics = [
+            client.post(f"/agents/{agent['id']}/topics", params={"name": f"Topic {i}-{j}"}).json()
+            for j in range(args.topics_per_agent)
+        ]
+        agents.append((agent, topics))
+
+    # --- Ingestion throughput ---
+    ingest_items = [
+        (agent["id"], topic["id"], synthetic_text(rng, 120))
+        for agent, topics in agents for topic in topics for _ in range(args.docs_per_topic)
+    ]
+
+    def ingest(item):
+        agent_id, topic_id, text = item
+        response = client.post(f"/agents/{agent_id}/topics/{topic_id}/knowledge", json={"text": text})
+        return response.status_code == 200
+
+    latencies, elapsed, failures = timed_calls(ingest, ingest_items, args.concurrency)
+    results["ingestion"] = {**summarize(latencies, elapsed), "failures": failures}
+
+    # --- /chat latency and throughput ---
+    chat_items = []
+    for i in range(args.chat_requests):
+        agent, _ = agents[i % len(agents)]
+        conversation = client.post("/conversations").json()
+        chat_items.append((agent["id"], conversation["id"], synthetic_text(rng, 12)))
+
+    def chat(item):
+        agent_id, conversation_id, message = item
+        response = client.post("/chat", json={"agent_id": agent_id, "message": message, "conversation_id": conversation_id})
+        return response.status_code == 200
+
+    latencies, elapsed, failures = timed_calls(chat, chat_items, args.concurrency)
+    results["chat"] = {**summarize(latencies, elapsed), "failures": failures}
+
+    # --- Search latency vs. corpus size ---
+    results["search"] = []
+    for size in [int(s) for s in args.corpus_sizes.split(",") if s.strip()]:
+        agent_id = f"bench-search-{size}"
+        for _ in range(size):
+            text = synthetic_text(rng, 80)
+            api.vector_store.add_document(agent_id, "bench-topic", text, fake_embedding(text))
+        queries = [fake_embedding(synthetic_text(rng, 10)) for _ in range(args.search_queries)]
+        latencies, elapsed, _ = timed_calls(lambda q: bool(api.vector_store.search(agent_id, q) is not None), queries, 1)
+        results["search"].append({"corpus_size": size, **summarize(latencies, elapsed)})
+
+    results["mock_server"] = {"requests": mock_config.requests, "throttled": mock_config.throttled}
+    client.__exit__(None, None, None)
+    server.shutdown()
+
+    print(f"Ingestion: {results['ingestion']}")
+    print(f"Chat:      {results['chat']}")
+    for row in results["search"]:
+        print(f"Search @ {row['corpus_size']:>6} docs: p50={row['p50_ms']}ms p99={row['p99_ms']}ms")
+    print(f"Mock API:  {results['mock_server']}")
+
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
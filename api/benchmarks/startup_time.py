@@ -0,0 +1,90 @@
+"""
+Measures API cold-start cost in fresh interpreters, as a new uvicorn worker
+would pay it:
+
+  - import: `import main` (module-level work only)
+  - lifespan: DB init and service client creation in the lifespan hook
+  - first request: a GET / after startup
+
+Also lists the slowest imports reported by `python -X importtime`.
+
+Usage (from the api directory):
+    python benchmarks/startup_time.py --runs 5
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import sys, time, json
+sys.path.insert(0, {api_dir!r})
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+t2 = time.perf_counter()
+client.__enter__()
+t3 = time.perf_counter()
+client.get("/")
+t4 = time.perf_counter()
+client.__exit__(None, None, None)
+print(json.dumps({{"import": t1 - t0, "lifespan": t3 - t2, "first_request": t4 - t3}}))
+"""
+
+
+def run_probe(workdir: str, env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(api_dir=API_DIR)],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(workdir: str, env: dict, top: int) -> list:
+    """
+    Returns (cumulative_us, module) for the modules imported directly by main,
+    slowest first.
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {API_DIR!r}); import main"],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # importtime indents nested imports by two spaces per level; main is level 0
+        if len(name) - len(name.lstrip(" ")) == 3:
+            rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Knowledge Buddy startup-time benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top-imports", type=int, default=10)
+    args = parser.parse_args()
+
+    # Fresh working directory so each run starts from an empty DB and index
+    workdir = tempfile.mkdtemp(prefix="kb-startup-")
+    env = {**os.environ, "LOG_LEVEL": "WARNING", "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.db")}
+
+    samples = [run_probe(workdir, env) for _ in range(args.runs)]
+    for phase in ("import", "lifespan", "first_request"):
+        values = sorted(sample[phase] for sample in samples)
+        print(f"{phase:>14}: median {values[len(values) // 2] * 1000:8.1f} ms  min {values[0] * 1000:8.1f} ms")
+
+    print("\nSlowest imports (cumulative):")
+    for cumulative_us, name in slowest_imports(workdir, env, args.top_imports):
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Recall-vs-latency tuning for an agent's vector index, measured on the
+agent's own stored vectors.
+
+Queries are a sample of the agent's documents (each query's own document is
+excluded from its results); ground truth is an exact float32 search. For each
+HNSW setting (M x ef_construction x ef_search) a scratch in-memory Chroma
+collection is built and queried, so the live collection is never modified.
+It also reports what reduced output dimensionality (truncated and
+re-normalized vectors, as produced by EMBEDDING_DIMENSIONS) and scalar
+quantization (NUMPY_INDEX_DTYPE) would cost in recall, with the vector memory
+each needs.
+
+Vectors are read through the vector store service (VECTOR_STORE_URL), which
+also applies --apply-ef-search; with --offline the Chroma directory is opened
+in-process instead, which is only safe while the API is stopped.
+
+Usage (from the api directory):
+    VECTOR_STORE_URL=http://127.0.0.1:8100 python benchmarks/tune_index.py --agent <agent_id>
+    python benchmarks/tune_index.py --agent <agent_id> --m 8,16,32 --ef-search 10,20,40,80 --dims 256,128 --offline
+    python benchmarks/tune_index.py --agent <agent_id> --apply-ef-search 40 --offline
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+
+import numpy as np
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from benchmarks.run_benchmarks import percentile
+
+
+def int_list(value: str) -> list:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def load_agent_vectors(store, agent_id: str):
+    documents = store.export_documents(agent_id)
+    return len(documents), np.asarray([doc["embedding"] for doc in documents], dtype=np.float32)
+
+
+def open_store(collection_name: str, embedding_info: dict, offline: bool):
+    """
+    The shared vector store service at VECTOR_STORE_URL, or with `offline`
+    the Chroma directory in-process (only safe while the API is stopped).
+    """
+    from vector_store import VectorStore, RemoteVectorStore
+
+    url = os.getenv("VECTOR_STORE_URL")
+    if url:
+        return RemoteVectorStore(url, embedding_info=embedding_info, collection_name=collection_name)
+    if not offline:
+        return None
+    # index_params={} leaves the live collection's parameters untouched
+    return VectorStore(embedding_info=embedding_info, collection_name=collection_name, index_params={})
+
+
+def exact_neighbors(matrix: np.ndarray, queries: list, k: int):
+    """
+    Top-k rows by L2 distance for each query row, excluding the row itself.
+    Returns (neighbors, per-query latencies).
+    """
+    norms = np.einsum("ij,ij->i", matrix, matrix)
+    neighbors, latencies = [], []
+    for row in queries:
+        start = time.perf_counter()
+        distances = norms - 2 * matrix @ matrix[row]
+        distances[row] = np.inf
+        top = np.argpartition(distances, k)[:k] if len(distances) > k else np.arange(len(distances))
+        neighbors.append(set(top[np.argsort(distances[top])].tolist()))
+        latencies.append(time.perf_counter() - start)
+    return neighbors, latencies
+
+
+def recall(found: list, truth: list) -> float:
+    return sum(len(f & t) for f, t in zip(found, truth)) / max(1, sum(len(t) for t in truth))
+
+
+def latency_summary(latencies: list) -> dict:
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def tune_hnsw(matrix: np.ndarray, queries: list, truth: list, k: int, m: int, ef_construction: int, ef_search: int):
+    # ef_search is read when Chroma loads an index, so each setting gets its own build
+    import chromadb
+
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(
+        name=f"tune-{uuid.uuid4().hex[:12]}",
+        metadata={"hnsw:M": m, "hnsw:construction_ef": ef_construction, "hnsw:search_ef": ef_search}
+    )
+    ids = [str(i) for i in range(len(matrix))]
+    start = time.perf_counter()
+    for i in range(0, len(ids), 1000):
+        collection.add(ids=ids[i:i + 1000], embeddings=matrix[i:i + 1000].tolist())
+    build_seconds = time.perf_counter() - start
+
+    found, latencies = [], []
+    for row in queries:
+        t0 = time.perf_counter()
+        result = collection.query(query_embeddings=[matrix[row].tolist()], n_results=min(k + 1, len(ids)))
+        latencies.append(time.perf_counter() - t0)
+        found.append(set([int(doc_id) for doc_id in result["ids"][0] if int(doc_id) != row][:k]))
+    client.delete_collection(collection.name)
+    return {
+        "M": m, "ef_construction": ef_construction, "ef_search": ef_search,
+        "recall": round(recall(found, truth), 4), **latency_summary(latencies),
+        "build_seconds": round(build_seconds, 2),
+        # Vectors plus roughly 2*M neighbour links per node on the base layer
+        "index_mb": round(matrix.shape[0] * (matrix.shape[1] * 4 + 2 * m * 4) / 2**20, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall-vs-latency tuning on an agent's own vectors")
+    parser.add_argument("--agent", required=True, help="Agent whose vectors are used")
+    parser.add_argument("--collection", help="Collection to read (default: the agent's embedding model's)")
+    parser.add_argument("--queries", type=int, default=200, help="Sampled documents used as queries")
+    parser.add_argument("--k", type=int, default=5, help="Results per query (recall@k)")
+    parser.add_argument("--m", type=int_list, default=[8, 16, 32])
+    parser.add_argument("--ef-construction", type=int_list, default=[100, 200])
+    parser.add_argument("--ef-search", type=int_list, default=[10, 20, 40, 80, 160])
+    parser.add_argument("--dims", type=int_list, default=[512, 256, 128], help="Truncated dimensionalities to evaluate")
+    parser.add_argument("--dtypes", default="float16,int8", help="Scalar quantization dtypes to evaluate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--apply-ef-search", type=int, help="Set ef_search on the agent's live collection and exit")
+    parser.add_argument("--offline", action="store_true",
+                        help="Open Chroma in-process (only while the API is stopped) when VECTOR_STORE_URL is not set")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    from models import Agent
+    from services.embeddings import create_embedding_provider
+    from vector_store import collection_name_for
+    from numpy_vector_store import quantize, dequantize
+
+    collection_name, embedding_info = args.collection, None
+    if not collection_name:
+        with SessionLocal() as db:
+            agent = db.query(Agent.embedding_model).filter(Agent.id == args.agent).first()
+        if not agent:
+            parser.error(f"agent {args.agent} not found")
+        provider = create_embedding_provider(None, agent.embedding_model)
+        collection_name, embedding_info = collection_name_for(provider), provider.info()
+    store = open_store(collection_name, embedding_info, args.offline)
+    if store is None:
+        parser.error("set VECTOR_STORE_URL to read through the vector store service, "
+                     "or pass --offline while the API is stopped")
+
+    if args.apply_ef_search:
+        store.set_search_ef(args.apply_ef_search)
+        print(f"{collection_name}: {store.index_params()} (takes effect when the API or vector service restarts)")
+        return
+
+    count, matrix = load_agent_vectors(store, args.agent)
+    if count <= args.k:
+        parser.error(f"agent {args.agent} has only {count} vectors in {collection_name}")
+    queries = random.Random(args.seed).sample(range(count), min(args.queries, count))
+    truth, exact_latencies = exact_neighbors(matrix, queries, args.k)
+    full_mb = matrix.nbytes / 2**20
+
+    results = {
+        "collection": collection_name,
+        "live_index_params": store.index_params(),
+        "documents": count,
+        "dimension": int(matrix.shape[1]),
+        "queries": len(queries),
+        "k": args.k,
+        "exact": {"recall": 1.0, **latency_summary(exact_latencies), "vectors_mb": round(full_mb, 2)},
+        "hnsw": [],
+        "dimensions": [],
+        "quantization": [],
+    }
+
+    for m in args.m:
+        for ef_construction in args.ef_construction:
+            for ef_search in args.ef_search:
+                results["hnsw"].append(tune_hnsw(matrix, queries, truth, args.k, m, ef_construction, ef_search))
+
+    # Only meaningful for models trained for truncation (e.g. text-embedding-004)
+    for dims in sorted((d for d in args.dims if d < matrix.shape[1]), reverse=True):
+        reduced = matrix[:, :dims]
+        reduced = reduced / np.maximum(np.linalg.norm(reduced, axis=1, keepdims=True), 1e-12)
+        found, latencies = exact_neighbors(reduced, queries, args.k)
+        results["dimensions"].append({
+            "dimensions": dims, "recall": round(recall(found, truth), 4), **latency_summary(latencies),
+            "vectors_mb": round(reduced.astype(np.float32).nbytes / 2**20, 2),
+        })
+
+    for dtype in [d.strip() for d in args.dtypes.split(",") if d.strip()]:
+        stored, scales = quantize(matrix, dtype)
+        found, latencies = exact_neighbors(dequantize(stored, scales), queries, args.k)
+        results["quantization"].append({
+            "dtype": dtype, "recall": round(recall(found, truth), 4), **latency_summary(latencies),
+            "vectors_mb": round((stored.nbytes + (scales.nbytes if scales is not None else 0)) / 2**20, 2),
+        })
+
+    print(f"{collection_name}: {count} vectors x {matrix.shape[1]}d, recall@{args.k} over {len(queries)} queries")
+    print(f"Live index: {results['live_index_params']}")
+    print(f"Exact:      p50={results['exact']['p50_ms']}ms  vectors={results['exact']['vectors_mb']}MB")
+    for row in results["hnsw"]:
+        print(f"HNSW M={row['M']:<3} efC={row['ef_construction']:<4} efS={row['ef_search']:<4} "
+              f"recall={row['recall']:.3f}  p50={row['p50_ms']}ms p99={row['p99_ms']}ms  ~{row['index_mb']}MB")
+    for row in results["dimensions"]:
+        print(f"Dims {row['dimensions']:<5} recall={row['recall']:.3f}  p50={row['p50_ms']}ms  vectors={row['vectors_mb']}MB")
+    for row in results["quantization"]:
+        print(f"{row['dtype']:<10} recall={row['recall']:.3f}  p50={row['p50_ms']}ms  vectors={row['vectors_mb']}MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
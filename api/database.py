@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+import logging
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -11,9 +13,106 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+logger = logging.getLogger(__name__)
+
+# Full-text indexes: table -> indexed text column (see ensure_fts_indexes)
+FTS_INDEXES = {"chat_messages": "content", "knowledge_gaps": "question_text"}
+fts_enabled = False
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def init_db():
+    """
+    Creates tables and applies the lightweight column/index migrations.
+    """
+    import models  # noqa: F401 - registers tables on Base
+
+    Base.metadata.create_all(bind=engine)
+    ensure_columns("conversations", {"summary": "TEXT", "summary_upto": "VARCHAR", "summary_upto_id": "VARCHAR"})
+    ensure_columns("agents", {"embedding_model": "VARCHAR", "embedding_target": "VARCHAR"})
+    ensure_columns("background_jobs", {"owner": "VARCHAR", "heartbeat_at": "VARCHAR"})
+    ensure_indexes()
+    ensure_fts_indexes()
+
+def ensure_columns(table_name: str, columns: dict):
+    """
+    Adds missing columns to an existing table. create_all() only creates new
+    tables, so columns added to a model later need this lightweight migration.
+    columns maps column name -> SQL type (e.g. {"summary": "TEXT"}).
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(table_name):
+        return
+    existing = {col["name"] for col in inspector.get_columns(table_name)}
+    with engine.begin() as conn:
+        for name, sql_type in columns.items():
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {sql_type}"))
+
+def ensure_indexes():
+    """
+    Creates indexes declared on models that are missing from existing tables.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def ensure_fts_indexes():
+    """
+    Creates an SQLite FTS5 index for each table in FTS_INDEXES, named
+    <table>_fts. Each index row holds the text and the source row's id
+    (UNINDEXED), and <table>_fts_keys maps ids to index rowids so the
+    triggers that keep the index in sync with inserts, updates and deletes
+    (including bulk deletes) find the row without scanning. Source rowids are
+    never used: VACUUM may renumber them on tables with text primary keys.
+    A newly created index is filled from the existing rows; indexes from the
+    earlier rowid-keyed layout are dropped and rebuilt.
+    """
+    global fts_enabled
+    try:
+        with engine.begin() as conn:
+            for table, column in FTS_INDEXES.items():
+                fts = f"{table}_fts"
+                keys = f"{fts}_keys"
+                definition = conn.execute(
+                    text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": fts}
+                ).scalar()
+                if definition and "UNINDEXED" not in definition:
+                    for trigger in ("insert", "delete", "update"):
+                        conn.execute(text(f"DROP TRIGGER IF EXISTS {fts}_{trigger}"))
+                    conn.execute(text(f"DROP TABLE {fts}"))
+                    definition = None
+                if not definition:
+                    conn.execute(text(f"DROP TABLE IF EXISTS {keys}"))
+                    conn.execute(text(
+                        f"CREATE VIRTUAL TABLE {fts} USING fts5({column}, id UNINDEXED, "
+                        f"tokenize='porter unicode61 remove_diacritics 2')"
+                    ))
+                    conn.execute(text(f"CREATE TABLE {keys} (id TEXT PRIMARY KEY, fts_rowid INTEGER NOT NULL)"))
+                    conn.execute(text(f"INSERT INTO {fts}({column}, id) SELECT {column}, id FROM {table}"))
+                    conn.execute(text(f"INSERT INTO {keys}(id, fts_rowid) SELECT id, rowid FROM {fts}"))
+
+                row = f"(SELECT fts_rowid FROM {keys} WHERE id = old.id)"
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN "
+                    f"INSERT INTO {fts}({column}, id) VALUES (new.{column}, new.id); "
+                    f"INSERT INTO {keys}(id, fts_rowid) VALUES (new.id, last_insert_rowid()); END"
+                ))
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN "
+                    f"DELETE FROM {fts} WHERE rowid = {row}; "
+                    f"DELETE FROM {keys} WHERE id = old.id; END"
+                ))
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column} ON {table} BEGIN "
+                    f"UPDATE {fts} SET {column} = new.{column} WHERE rowid = {row}; END"
+                ))
+        fts_enabled = True
+    except OperationalError as e:
+        # SQLite built without FTS5: everything else keeps working, search is unavailable
+        logger.warning("Full-text search disabled: %s", e)
@@ -0,0 +1,61 @@
+import threading
+
+from services.embeddings import create_embedding_provider
+from vector_store import collection_name_for, create_vector_store
+
+
+class EmbeddingSpace:
+    """
+    An embedding provider together with the collection holding its vectors.
+    """
+
+    def __init__(self, embedder, store):
+        self.embedder = embedder
+        self.store = store
+
+    @property
+    def spec(self) -> str:
+        return self.embedder.spec
+
+    def embed(self, texts: list) -> list:
+        return self.embedder.embed(texts)
+
+    def embed_one(self, text: str) -> list:
+        return self.embedder.embed_one(text)
+
+
+class EmbeddingSpaces:
+    """
+    Registry of embedding spaces by "provider:model" spec. The default space
+    (EMBEDDING_PROVIDER) is used for new agents; agents created under another
+    model keep using theirs until they are re-embedded.
+    """
+
+    def __init__(self, service, default_embedder, default_store):
+        self.service = service
+        self.default = EmbeddingSpace(default_embedder, default_store)
+        self._spaces = {self.default.spec: self.default}
+        self._lock = threading.Lock()
+
+    def get(self, spec: str = None) -> EmbeddingSpace:
+        if not spec:
+            return self.default
+        with self._lock:
+            if spec not in self._spaces:
+                embedder = create_embedding_provider(self.service, spec)
+                store = create_vector_store(
+                    embedding_info=embedder.info(),
+                    collection_name=collection_name_for(embedder)
+                )
+                self._spaces[spec] = EmbeddingSpace(embedder, store)
+            return self._spaces[spec]
+
+    def for_agent(self, embedding_model: str = None, embedding_target: str = None) -> list:
+        """
+        The agent's embedding space, followed by the target space while the
+        agent is being re-embedded into another model.
+        """
+        spaces = [self.get(embedding_model)]
+        if embedding_target:
+            spaces.append(self.get(embedding_target))
+        return spaces
@@ -1,37 +1,61 @@
-import pdfplumber
-import pytesseract
-from PIL import Image
 import io
+import os
+import logging
 from fastapi import UploadFile, HTTPException
 
+logger = logging.getLogger(__name__)
+
+# File extensions accepted by the bulk ingestion CLI, mapped to content types
+CONTENT_TYPES = {
+    ".txt": "text/plain",
+    ".md": "text/plain",
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+}
+SUPPORTED_TYPES = ["text/plain", "application/pdf", "image/png", "image/jpeg", "image/jpg"]
+
 async def extract_text_from_file(file: UploadFile) -> str:
     """
     Extracts text from an uploaded file based on its content type.
     Supports: text/plain, application/pdf, image/png, image/jpeg
     """
     content_type = file.content_type
+    if content_type not in SUPPORTED_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {content_type}")
     
     try:
-        if content_type == "text/plain":
-            content = await file.read()
-            return content.decode("utf-8")
-            
-        elif content_type == "application/pdf":
-            content = await file.read()
-            return extract_text_from_pdf(content)
-            
-        elif content_type in ["image/png", "image/jpeg", "image/jpg"]:
-            content = await file.read()
-            return extract_text_from_image(content)
-            
-        else:
-            raise HTTPException(status_code=400, detail=f"Unsupported file type: {content_type}")
+        content = await file.read()
+        return extract_text(content, content_type)
             
     except Exception as e:
-        print(f"Error extracting text: {e}")
+        logger.error("Error extracting text: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to process file: {str(e)}")
 
+def extract_text(content: bytes, content_type: str) -> str:
+    if content_type == "text/plain":
+        return content.decode("utf-8")
+    elif content_type == "application/pdf":
+        return extract_text_from_pdf(content)
+    elif content_type in ["image/png", "image/jpeg", "image/jpg"]:
+        return extract_text_from_image(content)
+    raise ValueError(f"Unsupported file type: {content_type}")
+
+def extract_text_from_path(path: str) -> str:
+    """
+    Extracts text from a file on disk, picking the parser from its extension.
+    Module-level so it can run in a process pool.
+    """
+    content_type = CONTENT_TYPES.get(os.path.splitext(path)[1].lower())
+    if not content_type:
+        raise ValueError(f"Unsupported file type: {path}")
+    with open(path, "rb") as f:
+        return extract_text(f.read(), content_type)
+
 def extract_text_from_pdf(file_bytes: bytes) -> str:
+    import pdfplumber  # imported on first use to keep startup fast
+
     text = ""
     with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
         for page in pdf.pages:
@@ -41,10 +65,14 @@ def extract_text_from_pdf(file_bytes: bytes) -> str:
     return text.strip()
 
 def extract_text_from_image(file_bytes: bytes) -> str:
+    # Raises rather than returning a placeholder, which would be stored as knowledge
     try:
+        import pytesseract
+        from PIL import Image
+
         image = Image.open(io.BytesIO(file_bytes))
         text = pytesseract.image_to_string(image)
         return text.strip()
     except Exception as e:
-        print(f"OCR Error: {e}")
-        return "[Error: Could not extract text from image. Ensure Tesseract is installed.]"
+        logger.error("OCR Error: %s", e)
+        raise ValueError("Could not extract text from image. Ensure Tesseract is installed.") from e
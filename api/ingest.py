@@ -0,0 +1,421 @@
+"""
+Offline bulk ingestion of documents into agents' knowledge.
+
+Takes either a directory for one agent (each first-level subdirectory becomes
+a topic; files directly inside go to --topic, or a topic named after the
+directory) or a CSV manifest with path,agent_id,topic columns. Topics are
+matched by id or name and created when missing.
+
+Text is extracted in a process pool (file_processing.extract_text_from_path),
+split into chunks and deduplicated: each chunk's id is derived from the agent
+and its text, so a chunk the agent already has, or that appears twice in the
+input, is stored once. Chunks are embedded in batches on a bounded thread pool
+at bulk priority (see services.admission) and written to every embedding space
+of the agent. Files are processed in groups; each group's checkpoint rows
+(ingested_files) and Topic.doc_count updates are committed in one transaction.
+Re-running the same command resumes an interrupted run, and files already
+ingested with the same contents are skipped.
+
+Vectors are written through the vector store service (VECTOR_STORE_URL); with
+--offline, Chroma is opened in-process instead, which is only safe while the
+API is stopped.
+
+Usage (from the api directory):
+    VECTOR_STORE_URL=http://localhost:8100 python ingest.py ../docs/finance --agent <agent_id>
+    python ingest.py --manifest onboarding.csv --concurrency 8 --workers 4 --offline
+"""
+import os
+import csv
+import sys
+import json
+import time
+import uuid
+import hashlib
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from database import SessionLocal, init_db
+from models import Agent, Topic, BackgroundJob, IngestedFile
+from llm_service import GoogleLLMService, LLMServiceError, OverloadedError, RateLimitedError
+from vector_store import collection_name_for, create_vector_store
+from embedding_spaces import EmbeddingSpaces
+from file_processing import CONTENT_TYPES, extract_text_from_path
+from services.admission import llm_priority
+from services.rate_limiter import backoff_delay
+from services.prompt_builder import count_tokens
+from services.logging_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_TOKENS = int(os.getenv("INGEST_CHUNK_TOKENS", 400))
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", 100))
+# Attempts for a bulk call that keeps being rate limited
+BULK_ATTEMPTS = int(os.getenv("INGEST_BULK_ATTEMPTS", 5))
+
+# Namespace for chunk ids (uuid5 of agent id + chunk text)
+CHUNK_NAMESPACE = uuid.UUID("5b0f6a8e-3c1d-4f2a-9e47-1d2c3b4a5f60")
+
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS) -> list:
+    """
+    Splits text into chunks of up to max_tokens, on paragraph boundaries where
+    possible; paragraphs longer than that are split on words.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for paragraph in (p.strip() for p in text.split("\n\n")):
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph)
+        if tokens > max_tokens:
+            words = paragraph.split()
+            step = max(1, len(words) * max_tokens // tokens)
+            pieces = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        else:
+            pieces = [paragraph]
+        for piece in pieces:
+            piece_tokens = count_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def chunk_id(agent_id: str, text: str) -> str:
+    normalized = " ".join(text.split()).lower()
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{agent_id}\n{normalized}"))
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def directory_entries(root: str, agent_id: str, topic: str = None) -> list:
+    """
+    (path, agent_id, topic) for every supported file under root. The topic is
+    the first-level subdirectory, or `topic` / the root's name for files
+    directly inside it.
+    """
+    root = os.path.abspath(root)
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        relative = os.path.relpath(dirpath, root)
+        file_topic = relative.split(os.sep)[0] if relative != "." else (topic or os.path.basename(root))
+        for filename in sorted(filenames):
+            entries.append((os.path.join(dirpath, filename), agent_id, file_topic))
+    return entries
+
+
+def manifest_entries(manifest_path: str) -> list:
+    """
+    (path, agent_id, topic) rows of a CSV manifest. Relative paths are
+    resolved against the manifest's directory.
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, newline="") as f:
+        reader = csv.DictReader(f)
+        missing = {"path", "agent_id", "topic"} - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"Manifest is missing columns: {', '.join(sorted(missing))}")
+        return [
+            (os.path.join(base, row["path"]), row["agent_id"].strip(), row["topic"].strip())
+            for row in reader if row.get("path")
+        ]
+
+
+def resolve_topic(db, agent_id: str, topic: str, cache: dict) -> str:
+    key = (agent_id, topic)
+    if key not in cache:
+        row = db.query(Topic.id).filter(Topic.agent_id == agent_id, Topic.id == topic).first() or \
+            db.query(Topic.id).filter(Topic.agent_id == agent_id, Topic.name == topic).order_by(Topic.id).first()
+        if row:
+            cache[key] = row.id
+        else:
+            new_topic = Topic(id=str(uuid.uuid4()), agent_id=agent_id, name=topic, doc_count=0)
+            db.add(new_topic)
+            db.commit()
+            cache[key] = new_topic.id
+    return cache[key]
+
+
+def run_bulk(fn, *args):
+    """
+    Calls fn at bulk priority, backing off while the call is being shed in
+    favour of interactive traffic, and retrying up to BULK_ATTEMPTS times
+    while it is rate limited. Other errors propagate.
+    """
+    attempt = 0
+    while True:
+        try:
+            with llm_priority("bulk"):
+                return fn(*args)
+        except OverloadedError as e:
+            time.sleep(e.retry_after)
+        except RateLimitedError:
+            attempt += 1
+            if attempt >= BULK_ATTEMPTS:
+                raise
+            time.sleep(backoff_delay(attempt))
+
+
+class Ingestion:
+    def __init__(self, spaces: EmbeddingSpaces, llm_service, concurrency: int, enrich: bool = False):
+        self.spaces = spaces
+        self.llm_service = llm_service
+        self.enrich = enrich
+        self.threads = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ingest")
+        self._known_ids = {}  # agent_id -> ids already in the agent's active space
+
+    def known_ids(self, agent_spaces: list, agent_id: str) -> set:
+        if agent_id not in self._known_ids:
+            self._known_ids[agent_id] = set(agent_spaces[0].store.document_ids(agent_id))
+        return self._known_ids[agent_id]
+
+    def embed(self, space, texts: list) -> list:
+        batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+        vectors = []
+        for result in self.threads.map(lambda batch: run_bulk(space.embed, batch), batches):
+            vectors.extend(result)
+        return vectors
+
+    def enrich_items(self, items: list) -> list:
+        """
+        Rewrites each chunk's text with the model. Raises LLMServiceError when
+        any chunk cannot be enriched.
+        """
+        enriched = self.threads.map(lambda item: run_bulk(self.llm_service.enrich_knowledge, item["raw_text"]), items)
+        return [{**item, "text": text} for item, text in zip(items, enriched)]
+
+    def write(self, agent_spaces: list, items: list):
+        """
+        Embeds and stores new chunks in each of the agent's spaces, returning
+        the number written.
+        """
+        if not items:
+            return 0
+        texts = [item["text"] for item in items]
+        for space in agent_spaces:
+            vectors = self.embed(space, texts)
+            space.store.add_documents([{**item, "embedding": vector} for item, vector in zip(items, vectors)])
+        return len(items)
+
+
+def ingest(entries: list, spaces: EmbeddingSpaces, llm_service, source: str,
+           workers: int = None, concurrency: int = 4, group_size: int = 32, enrich: bool = False) -> dict:
+    db = SessionLocal()
+    job = db.query(BackgroundJob).filter(
+        BackgroundJob.kind == "bulk_ingest",
+        BackgroundJob.target_id == source,
+        BackgroundJob.status.in_(["pending", "running"])
+    ).first()
+    if job:
+        logger.info("Resuming bulk ingestion job %s", job.id)
+    else:
+        job = BackgroundJob(
+            id=str(uuid.uuid4()), kind="bulk_ingest", target_id=source,
+            status="pending", created_at=datetime.utcnow().isoformat()
+        )
+        db.add(job)
+    job.status = "running"
+    db.commit()
+
+    stats = {"files": len(entries), "ingested": 0, "unchanged": 0, "unsupported": 0, "failed": 0,
+             "chunks": 0, "duplicate_chunks": 0}
+    ingestion = Ingestion(spaces, llm_service, concurrency, enrich=enrich)
+    topics, agents, pending = {}, {}, []
+    try:
+        # Resolve targets and drop files already ingested with the same contents
+        for path, agent_id, topic in entries:
+            if os.path.splitext(path)[1].lower() not in CONTENT_TYPES:
+                stats["unsupported"] += 1
+                continue
+            if agent_id not in agents:
+                agent = db.query(Agent.embedding_model, Agent.embedding_target).filter(Agent.id == agent_id).first()
+                if not agent:
+                    raise ValueError(f"Agent not found: {agent_id}")
+                agents[agent_id] = spaces.for_agent(agent.embedding_model, agent.embedding_target)
+            topic_id = resolve_topic(db, agent_id, topic, topics)
+            content_hash = file_hash(path)
+            record = db.query(IngestedFile).filter(
+                IngestedFile.agent_id == agent_id,
+                IngestedFile.topic_id == topic_id,
+                IngestedFile.content_hash == content_hash
+            ).order_by((IngestedFile.status == "done").desc()).first()
+            if record and record.status == "done":
+                stats["unchanged"] += 1
+                continue
+            if record and record.status in ("pending", "failed") and record.doc_ids:
+                # Chunks claimed by an interrupted or failed file stay claimed by it
+                ingestion.known_ids(agents[agent_id], agent_id).update(json.loads(record.doc_ids))
+            pending.append((path, agent_id, topic_id, content_hash, record))
+
+        mp_context = multiprocessing.get_context("spawn")  # the parent runs HTTP client threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as processes:
+            for start in range(0, len(pending), group_size):
+                group = pending[start:start + group_size]
+                texts = processes.map(_extract, [path for path, *_ in group])
+                ingest_group(db, job, ingestion, agents, group, texts, stats)
+                job.detail = json.dumps(stats)
+                db.commit()
+                logger.info("Bulk ingestion progress", extra={"job_id": job.id, **stats})
+
+        job.status = "completed"
+        job.finished_at = datetime.utcnow().isoformat()
+        job.detail = json.dumps(stats)
+        db.commit()
+        return {"job_id": job.id, **stats}
+    except Exception as e:
+        # The job stays "running" so the next run with the same source resumes it
+        db.rollback()
+        logger.exception("Bulk ingestion job %s stopped: %s", job.id, e)
+        raise
+    finally:
+        ingestion.threads.shutdown()
+        db.close()
+
+
+def _extract(path: str):
+    try:
+        return extract_text_from_path(path), None
+    except Exception as e:
+        return None, str(e)
+
+
+def ingest_group(db, job, ingestion: Ingestion, agents: dict, group: list, texts, stats: dict):
+    """
+    Ingests one group of files. Their chunk ids are checkpointed as pending
+    before any vector is written; once the vectors are stored, the files are
+    marked done and their topics' doc_count updated in one transaction. A
+    pending file seen again resumes with the chunk ids recorded for it, so
+    its chunks are counted exactly once. With enrichment, a file whose chunks
+    cannot be enriched is marked failed and resumed the same way next run.
+    """
+    writes = []  # (record, agent_id, topic_id, {chunk id: text}, resumed)
+    for (path, agent_id, topic_id, content_hash, record), (text, error) in zip(group, texts):
+        if record is None:
+            record = IngestedFile(
+                id=str(uuid.uuid4()), agent_id=agent_id, topic_id=topic_id,
+                path=path, content_hash=content_hash
+            )
+            db.add(record)
+        record.job_id = job.id
+        if error or not (text or "").strip():
+            record.status = "failed"
+            record.error = error or "No text extracted"
+            stats["failed"] += 1
+            continue
+
+        known = ingestion.known_ids(agents[agent_id], agent_id)
+        chunks = [(chunk_id(agent_id, chunk), chunk) for chunk in chunk_text(text)]
+        resumed = record.status in ("pending", "failed") and record.doc_ids is not None
+        if resumed:
+            claimed = set(json.loads(record.doc_ids))
+            known.update(claimed)
+        else:
+            claimed = set()
+            for doc_id, _ in chunks:
+                if doc_id in known:
+                    stats["duplicate_chunks"] += 1
+                else:
+                    claimed.add(doc_id)
+                    known.add(doc_id)
+            record.doc_ids = json.dumps(sorted(claimed))
+        record.status = "pending"
+        record.error = None
+        writes.append((record, agent_id, topic_id, {doc_id: chunk for doc_id, chunk in chunks if doc_id in claimed}, resumed))
+    db.commit()
+
+    items = {}  # agent_id -> chunks to store, embedded together
+    stored = []
+    for record, agent_id, topic_id, chunks, resumed in writes:
+        existing = set()
+        if resumed and chunks:
+            # Part of the file may have been stored before the interruption
+            found = agents[agent_id][0].store.get_documents_by_id(list(chunks))
+            existing = {doc["id"] for doc in found}
+        file_items = [
+            {"id": doc_id, "agent_id": agent_id, "topic_id": topic_id, "text": chunk, "raw_text": chunk}
+            for doc_id, chunk in chunks.items() if doc_id not in existing
+        ]
+        if ingestion.enrich and file_items:
+            try:
+                file_items = ingestion.enrich_items(file_items)
+            except LLMServiceError as e:
+                # The file keeps its claimed chunk ids, so a later run resumes it
+                record.status = "failed"
+                record.error = f"Enrichment failed: {e}"
+                stats["failed"] += 1
+                continue
+        items.setdefault(agent_id, []).extend(file_items)
+        stored.append((record, topic_id))
+    for agent_id, agent_items in items.items():
+        ingestion.write(agents[agent_id], agent_items)
+
+    for record, topic_id in stored:
+        count = len(json.loads(record.doc_ids))
+        db.query(Topic).filter(Topic.id == topic_id).update(
+            {Topic.doc_count: Topic.doc_count + count}, synchronize_session=False
+        )
+        record.status = "done"
+        stats["ingested"] += 1
+        stats["chunks"] += count
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest documents into agents' knowledge")
+    parser.add_argument("directory", nargs="?", help="Directory of documents for one agent")
+    parser.add_argument("--agent", help="Agent id for a directory")
+    parser.add_argument("--topic", help="Topic (id or name) for files directly inside the directory")
+    parser.add_argument("--manifest", help="CSV with path,agent_id,topic columns")
+    parser.add_argument("--workers", type=int, default=None, help="Text extraction processes (default: CPU count)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent embedding requests")
+    parser.add_argument("--group-size", type=int, default=32, help="Files per checkpointed transaction")
+    parser.add_argument("--enrich", action="store_true", help="Rewrite each chunk with the model before embedding (slow)")
+    parser.add_argument("--offline", action="store_true",
+                        help="Open Chroma in-process (only while the API is stopped) when VECTOR_STORE_URL is not set")
+    args = parser.parse_args()
+
+    if args.manifest:
+        entries = manifest_entries(args.manifest)
+        source = os.path.abspath(args.manifest)
+    elif args.directory and args.agent:
+        entries = directory_entries(args.directory, args.agent, args.topic)
+        source = f"{os.path.abspath(args.directory)}#{args.agent}"
+    else:
+        parser.error("give a directory with --agent, or --manifest")
+
+    load_dotenv()
+    if not os.getenv("VECTOR_STORE_URL") and not args.offline:
+        # A second process writing the Chroma directory next to a running API corrupts it
+        parser.error("set VECTOR_STORE_URL to ingest through the vector store service, "
+                     "or pass --offline while the API is stopped")
+    configure_logging()
+    init_db()
+    llm_service = GoogleLLMService()
+    store = create_vector_store(
+        embedding_info=llm_service.embedder.info(),
+        collection_name=collection_name_for(llm_service.embedder)
+    )
+    spaces = EmbeddingSpaces(llm_service, llm_service.embedder, store)
+
+    result = ingest(entries, spaces, llm_service, source, workers=args.workers,
+                    concurrency=args.concurrency, group_size=args.group_size, enrich=args.enrich)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,52 +2,291 @@ import os
 import requests
 import json
 import time
+import logging
+from contextlib import nullcontext
+
+from services.llm_cache import LLMCache
+from services.rate_limiter import get_limiter, backoff_delay, parse_retry_after, RateLimitTimeout
+from services.embeddings import create_embedding_provider
+from services.single_flight import SingleFlight
+from services.context_cache import ContextCache
+from services.admission import AdmissionController, AdmissionRejected, current_priority
+from services.metrics import (
+    span, LLM_REQUESTS, LLM_REQUEST_SECONDS, LLM_RETRIES, LLM_TOKENS, LLM_CACHE_LOOKUPS, LLM_COALESCED
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+
+# Helper methods whose output depends only on their input text, so repeated
+# calls can safely be served from the persistent cache.
+DEFAULT_CACHED_METHODS = "suggest_topic_name,enrich_knowledge,summarize_text,analyze_text,crystallize_knowledge"
+
+# Model used for each tier; override with LLM_MODEL_FAST / LLM_MODEL_PRO
+DEFAULT_MODEL_TIERS = {
+    "fast": "gemini-2.5-flash",
+    "pro": "gemini-2.5-pro",
+}
+
+# Tier used for each task type; override with LLM_TASK_TIERS="task=tier,..."
+DEFAULT_TASK_TIERS = {
+    "chat": "pro",
+    "conversation_title": "fast",
+    "suggest_topic_name": "fast",
+    "analyze_text": "fast",
+    "summarize_text": "fast",
+    "summarize_conversation": "fast",
+    "enrich_knowledge": "pro",
+    "crystallize_knowledge": "pro",
+}
+
+
+def _strip_json_fence(text: str) -> str:
+    return text.replace("```json", "").replace("```", "").strip()
+
+
+def _is_short_line(max_words: int):
+    def validate(text: str) -> bool:
+        text = text.strip()
+        return bool(text) and "\n" not in text and len(text) < 50 and len(text.split()) <= max_words
+    return validate
+
+
+def _is_analysis_json(text: str) -> bool:
+    try:
+        data = json.loads(_strip_json_fence(text))
+    except (ValueError, TypeError):
+        return False
+    return isinstance(data, dict) and isinstance(data.get("questions"), list)
+
+
+class LLMServiceError(Exception):
+    """Raised when an upstream model call fails."""
+
+
+class RateLimitedError(LLMServiceError):
+    """Raised when a call is still throttled after retries or its queue deadline passed."""
+
+
+class OverloadedError(LLMServiceError):
+    """Raised when admission control sheds a call; callers should retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: float = 30):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+RATE_LIMITED_REPLY = "I'm experiencing high demand right now. Please try again in a moment."
+
 
 class GoogleLLMService:
-    def __init__(self):
+    def __init__(self, base_url: str = None):
         self.api_key = os.getenv("GOOGLE_API_KEY")
-        self.base_url = "https://generativelanguage.googleapis.com/v1beta/models"
+        # Point at a local stand-in (e.g. benchmarks/mock_gemini.py) with GOOGLE_API_BASE_URL
+        self.base_url = (base_url or os.getenv("GOOGLE_API_BASE_URL", DEFAULT_BASE_URL)).rstrip("/")
+        # Non-model resources (e.g. cachedContents) live next to /models
+        self.api_root = self.base_url.rsplit("/models", 1)[0]
+        self.model_tiers = {
+            "fast": os.getenv("LLM_MODEL_FAST", DEFAULT_MODEL_TIERS["fast"]),
+            "pro": os.getenv("LLM_MODEL_PRO", DEFAULT_MODEL_TIERS["pro"]),
+        }
+        self.task_tiers = dict(DEFAULT_TASK_TIERS)
+        for entry in os.getenv("LLM_TASK_TIERS", "").split(","):
+            if "=" in entry:
+                task, tier = entry.split("=", 1)
+                self.task_tiers[task.strip()] = tier.strip()
+        # Retry on the pro tier when a fast-tier answer fails validation
+        self.escalate_on_invalid = os.getenv("LLM_ESCALATE_ON_INVALID", "true").lower() == "true"
+        self.model = self.model_tiers["pro"]
+        self.embedder = create_embedding_provider(self)
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", 5))
+        self.queue_timeout = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", 60))
+        self.request_timeout = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", 120))
+        # Identical concurrent requests (same model, method and payload) share one upstream call
+        self.single_flight = SingleFlight() if os.getenv("LLM_SINGLE_FLIGHT", "true").lower() == "true" else None
+        # Priority scheduling of upstream calls (interactive > training > bulk), see services/admission.py
+        self.admission = AdmissionController() if os.getenv("LLM_ADMISSION_ENABLED", "true").lower() == "true" else None
 
-    def get_embedding(self, text: str):
+        # Per-method opt-in for the generation cache
+        self.cache = None
+        self.cached_methods = set()
+        if os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true":
+            self.cache = LLMCache()
+            methods = os.getenv("LLM_CACHE_METHODS", DEFAULT_CACHED_METHODS)
+            self.cached_methods = {m.strip() for m in methods.split(",") if m.strip()}
+
+        # Provider-side caching of stable prompt prefixes (see generate_response)
+        self.context_cache = None
+        if os.getenv("CONTEXT_CACHE_ENABLED", "false").lower() == "true":
+            self.context_cache = ContextCache(self)
+
+    def model_for(self, task: str) -> str:
         """
-        Generates embeddings for the given text using text-embedding-004.
+        Resolves the model for a task type via its configured tier.
         """
-        if not self.api_key:
-            print("Warning: GOOGLE_API_KEY not set. Returning mock embedding.")
-            return [0.0] * 768
+        tier = self.task_tiers.get(task, "pro")
+        return self.model_tiers.get(tier, self.model)
 
-        url = f"{self.base_url}/text-embedding-004:embedContent?key={self.api_key}"
-        headers = {"Content-Type": "application/json"}
-        payload = {
-            "model": "models/text-embedding-004",
-            "content": {"parts": [{"text": text}]}
-        }
+    def cache_stats(self):
+        """
+        Returns hit/miss/eviction counters for the generation cache.
+        """
+        if not self.cache:
+            return {"enabled": False}
+        return {"enabled": True, "methods": sorted(self.cached_methods), **self.cache.stats()}
 
+    def _post(self, model: str, method: str, payload: dict, url: str = None, http_method: str = "post"):
+        """
+        Calls a model endpoint through the shared per-model rate limiter.
+        Retries 429/5xx responses with jittered backoff (honoring Retry-After)
+        until the queue deadline. Raises RateLimitedError if the call could not
+        get through in time and LLMServiceError for any other failure.
+        Callers in the same priority class sending a byte-identical request
+        while one is in flight wait for it (up to the queue deadline) and get
+        the same response, so a chat turn never waits behind a queued bulk
+        call. `url` overrides the default {base_url}/{model}:{method} endpoint
+        and `http_method` the verb (e.g. "delete", with payload None).
+        """
+        if not self.single_flight:
+            return self._post_upstream(model, method, payload, url, http_method)
+
+        key = SingleFlight.make_key(model, method, payload, url, http_method, current_priority())
         try:
-            response = requests.post(url, headers=headers, data=json.dumps(payload))
-            response.raise_for_status()
-            data = response.json()
-            return data["embedding"]["values"]
-        except Exception as e:
-            print(f"Error generating embedding: {e}")
-            return [0.0] * 768
+            data, shared = self.single_flight.do(
+                key, lambda: self._post_upstream(model, method, payload, url, http_method), timeout=self.queue_timeout
+            )
+        except TimeoutError as e:
+            raise RateLimitedError(f"{model}: {e}")
+        if shared:
+            LLM_COALESCED.inc(model=model, method=method)
+        return data
+
+    def _post_upstream(self, model: str, method: str, payload: dict, url: str = None, http_method: str = "post"):
+        # Admission is per upstream call, in the caller's priority class (llm_priority)
+        try:
+            with self.admission.slot() if self.admission else nullcontext():
+                return self._post_measured(model, method, payload, url, http_method)
+        except AdmissionRejected as e:
+            raise OverloadedError(str(e), retry_after=e.retry_after)
 
-    def generate_response(self, prompt: str, skills: list = None):
+    def _post_measured(self, model: str, method: str, payload: dict, url: str = None, http_method: str = "post"):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            with span("llm.request", model=model, method=method):
+                data = self._post_with_retries(model, method, payload, url, http_method)
+            outcome = "success"
+            self._record_usage(model, data)
+            return data
+        except RateLimitedError:
+            outcome = "rate_limited"
+            raise
+        finally:
+            LLM_REQUESTS.inc(model=model, method=method, outcome=outcome)
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, model=model, method=method)
+
+    def _post_with_retries(self, model: str, method: str, payload: dict, url: str = None, http_method: str = "post"):
+        url = f"{url or f'{self.base_url}/{model}:{method}'}?key={self.api_key}"
+        headers = {"Content-Type": "application/json"}
+        limiter = get_limiter(model)
+        deadline = time.monotonic() + self.queue_timeout
+
+        for attempt in range(self.max_retries):
+            try:
+                with limiter.slot(deadline):
+                    response = requests.request(
+                        http_method, url, headers=headers,
+                        data=json.dumps(payload) if payload is not None else None, timeout=self.request_timeout
+                    )
+            except RateLimitTimeout as e:
+                raise RateLimitedError(str(e))
+            except requests.exceptions.RequestException as e:
+                raise LLMServiceError(f"Request to {model} failed: {e}")
+
+            if response.status_code == 429 or response.status_code >= 500:
+                limiter.on_throttle()
+                delay = backoff_delay(attempt, parse_retry_after(response.headers.get("Retry-After")))
+                if attempt == self.max_retries - 1 or time.monotonic() + delay > deadline:
+                    break
+                LLM_RETRIES.inc(model=model, status=response.status_code)
+                logger.warning(
+                    "Upstream call throttled, retrying",
+                    extra={"model": model, "status": response.status_code, "delay": round(delay, 2), "attempt": attempt + 1}
+                )
+                time.sleep(delay)
+                continue
+
+            try:
+                response.raise_for_status()
+            except requests.exceptions.HTTPError as e:
+                raise LLMServiceError(f"HTTP Error from {model}: {e}")
+            limiter.on_success()
+            return response.json() if response.content else {}
+
+        raise RateLimitedError(f"{model} is rate limited")
+
+    def _record_usage(self, model: str, data: dict):
+        usage = data.get("usageMetadata") if isinstance(data, dict) else None
+        if not usage:
+            return
+        LLM_TOKENS.inc(usage.get("promptTokenCount", 0), model=model, kind="prompt")
+        LLM_TOKENS.inc(usage.get("candidatesTokenCount", 0), model=model, kind="completion")
+        if usage.get("cachedContentTokenCount"):
+            LLM_TOKENS.inc(usage["cachedContentTokenCount"], model=model, kind="cached")
+
+    def get_embedding(self, text: str):
         """
-        Generates a response using gemini-1.5-flash.
+        Generates an embedding for the given text with the configured provider
+        (remote text-embedding-004 by default, or a local CPU model).
+        Raises on failure rather than returning a zero vector, so failed
+        embeddings never get stored in the index.
+        """
+        return self.embedder.embed_one(text)
+
+    def get_embeddings(self, texts: list):
+        """
+        Batch version of get_embedding.
+        """
+        return self.embedder.embed(texts)
+
+    def generate_response(self, prompt: str, skills: list = None, task: str = "chat", validate=None,
+                          prefix: str = None, prefix_owner: str = None, propagate_errors: bool = False):
+        """
+        Generates a response with the model tier configured for `task`.
         Supports tool calling if skills are provided.
-        Includes retry logic for rate limiting (429 errors).
+        Rate limiting and retries are handled by the shared limiter in _post.
+        If `validate` rejects a fast-tier text answer, the call is retried once
+        on the pro tier. Tasks listed in LLM_CACHE_METHODS are served from /
+        stored in the generation cache.
+        `prefix` is a stable leading part of the prompt (e.g. an agent's persona
+        and instructions). With CONTEXT_CACHE_ENABLED it is cached provider-side
+        together with the tool declarations, per `prefix_owner`, and only
+        `prompt` is sent; otherwise it is simply prepended.
+        With propagate_errors, failures raise LLMServiceError (RateLimitedError
+        when rate limited) instead of returning a fallback message, for callers
+        that store the result.
         """
         if not self.api_key:
+            if propagate_errors:
+                raise LLMServiceError("GOOGLE_API_KEY not set")
             return "I'm sorry, I can't answer that right now because my brain (API Key) is missing."
 
-        url = f"{self.base_url}/gemini-2.5-pro:generateContent?key={self.api_key}"
-        headers = {"Content-Type": "application/json"}
-        
+        model = self.model_for(task)
+        full_prompt = f"{prefix}{prompt}" if prefix else prompt
+
+        cache_key = None
+        if self.cache and task in self.cached_methods and not skills:
+            cache_key = LLMCache.make_key(model, task, full_prompt)
+            cached = self.cache.get(cache_key)
+            LLM_CACHE_LOOKUPS.inc(task=task, result="hit" if cached is not None else "miss")
+            if cached is not None:
+                return cached
+
         # Base payload
         payload = {
             "contents": [{
-                "parts": [{"text": prompt}]
+                "parts": [{"text": full_prompt}]
             }]
         }
 
@@ -74,70 +313,93 @@ class GoogleLLMService:
             
             if tools:
                 payload["tools"] = [{"function_declarations": tools}]
-                print(f"DEBUG: Sending {len(tools)} tools to LLM:")
-                for tool in tools:
-                    print(f"  - {tool['name']}: {tool['description']}")
+                logger.debug("Sending tools to LLM", extra={"tools": [tool["name"] for tool in tools]})
 
-        # Retry logic for rate limiting
-        max_retries = 3
-        base_delay = 1  # Start with 1 second
-        
-        for attempt in range(max_retries):
+        cached_content = None
+        if prefix and prefix_owner and self.context_cache:
+            cached_content = self.context_cache.lookup(prefix_owner, model, prefix, payload.get("tools"))
+        if cached_content:
+            # Persona, instructions and tools come from the cache; only the turn is sent
+            cached_payload = {"cachedContent": cached_content, "contents": [{"parts": [{"text": prompt}]}]}
             try:
-                response = requests.post(url, headers=headers, data=json.dumps(payload))
-                
-                # Handle rate limiting
-                if response.status_code == 429:
-                    if attempt < max_retries - 1:
-                        delay = base_delay * (2 ** attempt)  # Exponential backoff: 1s, 2s, 4s
-                        print(f"Rate limited (429). Retrying in {delay} seconds... (Attempt {attempt + 1}/{max_retries})")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        return "I'm experiencing high demand right now. Please try again in a moment."
-                
-                response.raise_for_status()
-                data = response.json()
-                
-                # Check for Tool Calls
-                candidates = data.get("candidates", [])
-                if not candidates:
-                    return "I'm not sure what to say."
-                    
-                content = candidates[0].get("content", {})
-                parts = content.get("parts", [])
-                
-                if not parts:
-                     return "I'm not sure what to say."
-
-                # Look for function call in parts
-                for part in parts:
-                    if "functionCall" in part:
-                        fn_call = part["functionCall"]
-                        print(f"DEBUG: LLM called function: {fn_call['name']}")
-                        return {
-                            "tool_call": True,
-                            "name": fn_call["name"],
-                            "args": fn_call.get("args", {})
-                        }
-
-                # Normal text response
-                print("DEBUG: LLM returned text response (no function call)")
-                return parts[0]["text"]
-                
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 429 and attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt)
-                    print(f"Rate limited (429). Retrying in {delay} seconds... (Attempt {attempt + 1}/{max_retries})")
-                    time.sleep(delay)
-                    continue
-                print(f"HTTP Error generating response: {e}")
-                return "I encountered an error while thinking."
-            except Exception as e:
-                print(f"Error generating response: {e}")
-                return "I encountered an error while thinking."
+                result, ok = self._generate(model, cached_payload, propagate_errors=True)
+            except OverloadedError:
+                raise
+            except RateLimitedError as e:
+                if propagate_errors:
+                    raise
+                logger.warning("Rate limited: %s", e)
+                result, ok = RATE_LIMITED_REPLY, False
+            except LLMServiceError as e:
+                # e.g. the entry expired or was evicted provider-side
+                logger.warning("Cached content call failed, sending full prompt: %s", e)
+                self.context_cache.invalidate(prefix_owner)
+                cached_content = None
+        if not cached_content:
+            result, ok = self._generate(model, payload, propagate_errors=propagate_errors)
+
+        pro_model = self.model_tiers["pro"]
+        if ok and validate and isinstance(result, str) and model != pro_model and not validate(result):
+            if self.escalate_on_invalid:
+                logger.info("Output failed validation, escalating", extra={"task": task, "model": model, "escalated_to": pro_model})
+                result, ok = self._generate(pro_model, payload, propagate_errors=propagate_errors)
+
+        if propagate_errors and (not ok or not result):
+            raise LLMServiceError(f"No usable output for {task}")
+        if ok and cache_key and isinstance(result, str) and result:
+            self.cache.set(cache_key, task, result)
+        return result
+
+    def _generate(self, model: str, payload: dict, propagate_errors: bool = False):
+        """
+        Runs a single generateContent call. Returns (result, ok) where result
+        is response text, a tool-call dict, or a fallback message when ok is False.
+        With propagate_errors, upstream errors (including rate limiting) are
+        raised instead of turned into a fallback message.
+        """
+        try:
+            data = self._post(model, "generateContent", payload)
+        except OverloadedError:
+            # Shed calls surface as 503 + Retry-After rather than a canned answer
+            raise
+        except RateLimitedError as e:
+            if propagate_errors:
+                raise
+            logger.warning("Rate limited: %s", e)
+            return RATE_LIMITED_REPLY, False
+        except LLMServiceError as e:
+            if propagate_errors:
+                raise
+            logger.error("Error generating response: %s", e)
+            return "I encountered an error while thinking.", False
+        except Exception as e:
+            logger.error("Error generating response: %s", e)
+            return "I encountered an error while thinking.", False
+
+        # Check for Tool Calls
+        candidates = data.get("candidates", [])
+        if not candidates:
+            return "I'm not sure what to say.", False
+            
+        content = candidates[0].get("content", {})
+        parts = content.get("parts", [])
         
-        return "I'm experiencing high demand right now. Please try again in a moment."
+        if not parts:
+             return "I'm not sure what to say.", False
+
+        # Look for function call in parts
+        for part in parts:
+            if "functionCall" in part:
+                fn_call = part["functionCall"]
+                logger.debug("LLM called function", extra={"function": fn_call["name"]})
+                return {
+                    "tool_call": True,
+                    "name": fn_call["name"],
+                    "args": fn_call.get("args", {})
+                }, True
+
+        # Normal text response
+        return parts[0].get("text", ""), True
 
     def analyze_text(self, text: str):
         """
@@ -161,10 +423,9 @@ class GoogleLLMService:
             "confidence_score": 50
         }}
         """
-        response = self.generate_response(prompt)
+        response = self.generate_response(prompt, task="analyze_text", validate=_is_analysis_json)
         try:
-            cleaned = response.replace("```json", "").replace("```", "").strip()
-            return json.loads(cleaned)
+            return json.loads(_strip_json_fence(response))
         except:
             return {
                 "questions": ["Could you explain that in more detail?"],
@@ -180,7 +441,7 @@ class GoogleLLMService:
         
         Return ONLY the topic name. No quotes, no extra text.
         """
-        return self.generate_response(prompt).strip()
+        return self.generate_response(prompt, task="suggest_topic_name", validate=_is_short_line(6)).strip()
 
     def summarize_text(self, text: str):
         """
@@ -192,7 +453,7 @@ Text:
 {text}
 
 Return ONLY the summary. No extra formatting."""
-        return self.generate_response(prompt).strip()
+        return self.generate_response(prompt, task="summarize_text").strip()
 
     def enrich_knowledge(self, text: str):
         """
@@ -208,7 +469,8 @@ Raw text:
 {text}
 
 Return ONLY the enriched version. Make it clear, comprehensive, and well-explained."""
-        return self.generate_response(prompt).strip()
+        # Failures raise: the result is stored as the knowledge text
+        return self.generate_response(prompt, task="enrich_knowledge", propagate_errors=True).strip()
 
     def generate_conversation_title(self, first_message: str):
         """
@@ -219,7 +481,34 @@ Return ONLY the enriched version. Make it clear, comprehensive, and well-explain
 "{first_message}"
 
 Return ONLY the title, nothing else. Make it concise and informative."""
-        return self.generate_response(prompt).strip()
+        return self.generate_response(prompt, task="conversation_title", validate=_is_short_line(8)).strip()
+
+    def summarize_conversation(self, previous_summary: str, messages: list):
+        """
+        Folds older conversation messages into the running conversation summary.
+        """
+        transcript = "\n".join([f"{msg.role.upper()}: {msg.content}" for msg in messages])
+
+        prompt = f"""You maintain a running summary of a support conversation.
+
+Current summary:
+{previous_summary or "(none yet)"}
+
+New messages to fold in:
+{transcript}
+
+Update the summary so it captures the user's goals, facts established, answers given and any open questions.
+Omit raw tool output; keep only its conclusions. Keep it under 150 words.
+
+Return ONLY the updated summary."""
+        # Unlike generate_response, failures raise: a fallback message must never become the summary
+        if not self.api_key:
+            raise LLMServiceError("GOOGLE_API_KEY not set")
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        result, ok = self._generate(self.model_for("summarize_conversation"), payload, propagate_errors=True)
+        if not ok or not isinstance(result, str) or not result.strip():
+            raise LLMServiceError("Conversation summary unavailable")
+        return result.strip()
 
     def crystallize_knowledge(self, original_text: str, qa_pairs: list):
         """
@@ -241,4 +530,4 @@ Return ONLY the title, nothing else. Make it concise and informative."""
         3. Do not use conversational filler (e.g., "Here is the policy").
         4. Format as a clean text block suitable for a knowledge base.
         """
-        return self.generate_response(prompt)
+        return self.generate_response(prompt, task="crystallize_knowledge")
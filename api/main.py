@@ -1,16 +1,24 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Request, BackgroundTasks
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
-from sqlalchemy import desc
+from sqlalchemy.exc import IntegrityError
+import os
 import uuid
 import json
+import time
+import logging
+import threading
 from datetime import datetime
 from dotenv import load_dotenv
 
 # Database & Models
-from database import get_db, engine, Base
-from models import Agent, Topic, KnowledgeGap, ChatMessage, Conversation, AgentSkill
+import database
+from database import get_db, SessionLocal, init_db
+from models import Agent, Topic, KnowledgeGap, ChatMessage, Conversation, AgentSkill, BackgroundJob, IngestedFile
 
 # Schemas
 # Make sure FeedbackRequest is defined in your schemas.py file!
@@ -25,24 +33,85 @@ from schemas import (
     FeedbackRequest,
     SkillCreate,
     SkillResponse,
-    SkillUpdate
+    SkillUpdate,
+    AgentResponse,
+    ConversationResponse,
+    ConversationPage,
+    MessagePage,
+    TopicResponse,
+    TopicPage,
+    KnowledgeGapPage,
+    MessageSearchPage,
+    KnowledgeGapSearchPage
 )
 
 # Services
-from llm_service import GoogleLLMService
-from vector_store import VectorStore
+from llm_service import GoogleLLMService, LLMServiceError, RateLimitedError, OverloadedError
+from vector_store import collection_name_for, create_vector_store
+from embedding_spaces import EmbeddingSpaces
+from services.embeddings import legacy_embedding_spec
+from reembedding import run_reembed_job, resume_reembed_jobs
 from file_processing import extract_text_from_file
 from services.skill_runner import execute_python_skill
+from services.prompt_builder import PromptBuilder, count_tokens
+from services.rate_limiter import limiter_stats
+from services.admission import llm_priority
+from services.pagination import paginate, keyset_after
+from services.search import search
+from services.jobs import claim_job, claimable_job_ids, is_stale
+from services.snapshot import encode_snapshot, decode_snapshot
+from services.metrics import chat_stage, render_metrics, HTTP_REQUEST_SECONDS
+from services.logging_config import configure_logging
 
 # Load environment variables
 load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Service clients are created in the lifespan hook (per worker, after fork)
+# so importing this module stays cheap.
+llm_service = None
+vector_store = None
+embedding_spaces = None
+prompt_builder = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global llm_service, vector_store, embedding_spaces, prompt_builder
+    start = time.perf_counter()
+
+    # Create Tables (Safe to run, checks if exists)
+    init_db()
+    llm_service = GoogleLLMService()
+    vector_store = create_vector_store(
+        embedding_info=llm_service.embedder.info(),
+        collection_name=collection_name_for(llm_service.embedder)
+    )
+    embedding_spaces = EmbeddingSpaces(llm_service, llm_service.embedder, vector_store)
+    prompt_builder = PromptBuilder()
+
+    # Agents from before per-agent models were recorded keep the space their
+    # vectors were written in, not today's default (which may differ in dims)
+    with SessionLocal() as db:
+        db.query(Agent).filter(Agent.embedding_model.is_(None)).update(
+            {Agent.embedding_model: legacy_embedding_spec()}, synchronize_session=False
+        )
+        db.commit()
+    resume_reembed_jobs(embedding_spaces)
+    resume_delete_agent_jobs()
 
-# Create Tables (Safe to run, checks if exists)
-Base.metadata.create_all(bind=engine)
+    logger.info("Startup complete", extra={"startup_seconds": round(time.perf_counter() - start, 3)})
+    yield
 
-app = FastAPI()
-llm_service = GoogleLLMService()
-vector_store = VectorStore()
+app = FastAPI(lifespan=lifespan)
+
+# Upper bound on unsummarized messages loaded per chat turn
+HISTORY_FETCH_LIMIT = 50
+
+# Agents whose whole knowledge fits in this many tokens get it as an always-on
+# pack in the cached prompt prefix (0 disables; needs CONTEXT_CACHE_ENABLED)
+KNOWLEDGE_PACK_TOKENS = int(os.getenv("CONTEXT_CACHE_KNOWLEDGE_PACK_TOKENS", 0))
+knowledge_packs = {}  # agent_id -> (built_at, docs)
 
 # CORS Setup
 app.add_middleware(
@@ -53,24 +122,135 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (e.g. /agents/{agent_id}) to keep cardinality bounded
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route.path if route else "unmatched",
+            status=status
+        )
+
+@app.exception_handler(LLMServiceError)
+def llm_service_error_handler(request: Request, exc: LLMServiceError):
+    # Upstream model failures (e.g. embeddings) surface as 503 instead of storing bad data
+    headers = None
+    if isinstance(exc, OverloadedError):
+        headers = {"Retry-After": str(int(exc.retry_after))}
+    elif isinstance(exc, RateLimitedError):
+        headers = {"Retry-After": "30"}
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers=headers)
+
+# Roles stored on chat messages
+MESSAGE_ROLES = ("user", "agent")
+
+# Columns loaded by list endpoints (e.g. skips Conversation.summary)
+AGENT_LIST_COLUMNS = [Agent.id, Agent.name, Agent.description, Agent.status, Agent.color]
+CONVERSATION_LIST_COLUMNS = [Conversation.id, Conversation.title, Conversation.created_at, Conversation.updated_at]
+MESSAGE_COLUMNS = [
+    ChatMessage.id, ChatMessage.conversation_id, ChatMessage.agent_id,
+    ChatMessage.role, ChatMessage.content, ChatMessage.timestamp, ChatMessage.rating
+]
+TOPIC_COLUMNS = [Topic.id, Topic.agent_id, Topic.name, Topic.doc_count, Topic.status]
+GAP_COLUMNS = [KnowledgeGap.id, KnowledgeGap.agent_id, KnowledgeGap.question_text, KnowledgeGap.frequency, KnowledgeGap.status]
+
+def agent_spaces(db: Session, agent_id: str):
+    """
+    The agent's embedding space, followed by the target space while the
+    agent is being re-embedded into another model.
+    """
+    row = db.query(Agent.embedding_model, Agent.embedding_target).filter(Agent.id == agent_id).first()
+    if not row:
+        return embedding_spaces.for_agent()
+    return embedding_spaces.for_agent(row.embedding_model, row.embedding_target)
+
+def store_knowledge(db: Session, agent_id: str, topic_id: str, text: str, raw_text: str = None):
+    # Same id in every space, so the re-embedding job won't copy it again
+    doc_id = None
+    for space in agent_spaces(db, agent_id):
+        doc_id = space.store.add_documents([{
+            "id": doc_id,
+            "agent_id": agent_id,
+            "topic_id": topic_id,
+            "text": text,
+            "raw_text": raw_text,
+            "embedding": space.embed_one(text)
+        }])[0]
+    return doc_id
+
+def search_knowledge(spaces: list, embeddings: list, agent_id: str, n_results: int = 3):
+    if len(spaces) == 1:
+        return spaces[0].store.search(agent_id, embeddings[0], n_results)
+    # Dual-read while re-embedding: distances from two models aren't
+    # comparable, so results are merged by reciprocal rank
+    scores = {}
+    for space, embedding in zip(spaces, embeddings):
+        for rank, doc in enumerate(space.store.search(agent_id, embedding, n_results)):
+            scores[doc] = scores.get(doc, 0) + 1 / (60 + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:n_results]
+
+def knowledge_pack(db: Session, agent_id: str):
+    """
+    All of a small agent's documents, for the cached prompt prefix. Rebuilt
+    when this worker changes the agent's knowledge, or after the context
+    cache TTL for changes made elsewhere.
+    """
+    if not llm_service.context_cache or KNOWLEDGE_PACK_TOKENS <= 0:
+        return []
+    entry = knowledge_packs.get(agent_id)
+    if entry and time.time() - entry[0] < llm_service.context_cache.ttl_seconds:
+        return entry[1]
+
+    store = agent_spaces(db, agent_id)[0].store
+    doc_ids = store.document_ids(agent_id)
+    docs = [doc["text"] for doc in store.get_documents_by_id(doc_ids)] if doc_ids else []
+    if sum(count_tokens(doc) for doc in docs) > KNOWLEDGE_PACK_TOKENS:
+        docs = []
+    knowledge_packs[agent_id] = (time.time(), docs)
+    return docs
+
+def knowledge_changed(agent_id: str):
+    # The next turn rebuilds the pack, which in turn replaces the cached prefix
+    knowledge_packs.pop(agent_id, None)
+
+def keyset_page(query, columns, cursor, limit, descending=False):
+    try:
+        return paginate(query, columns, cursor=cursor, limit=limit, descending=descending)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/")
 def read_root():
     return {"message": "Knowledge Buddy API is running"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # --- AGENTS ---
 
-@app.get("/agents")
+@app.get("/agents", response_model=list[AgentResponse])
 def get_agents(db: Session = Depends(get_db)):
-    agents = db.query(Agent).all()
-    return agents
+    agents = db.query(*AGENT_LIST_COLUMNS).filter(Agent.status != "deleting").all()
+    return [agent._asdict() for agent in agents]
 
-@app.post("/agents")
+@app.post("/agents", response_model=AgentResponse)
 def create_agent(agent: AgentCreate, db: Session = Depends(get_db)):
     db_agent = Agent(
         id=str(uuid.uuid4()),
         name=agent.name,
         description=agent.description,
-        color=agent.color
+        color=agent.color,
+        embedding_model=embedding_spaces.default.spec
     )
     db.add(db_agent)
     db.commit()
@@ -111,23 +291,259 @@ def get_agent(agent_id: str, db: Session = Depends(get_db)):
     }
     return agent_data
 
-@app.delete("/agents/{agent_id}")
-def delete_agent(agent_id: str, db: Session = Depends(get_db)):
+@app.delete("/agents/{agent_id}", status_code=202)
+def delete_agent(agent_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     agent = db.query(Agent).filter(Agent.id == agent_id).first()
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
-    
-    # Delete topics (and their vector entries)
-    topics = db.query(Topic).filter(Topic.agent_id == agent_id).all()
-    for topic in topics:
-        vector_store.delete_documents(agent_id, topic.id)
-        db.delete(topic)
-        
-    db.delete(agent)
+
+    existing_job = db.query(BackgroundJob).filter(
+        BackgroundJob.kind == "delete_agent",
+        BackgroundJob.target_id == agent_id,
+        BackgroundJob.status.in_(["pending", "running"])
+    ).first()
+    if existing_job:
+        if is_stale(existing_job):
+            # Its worker died before finishing: run it again (the job is re-claimed)
+            background_tasks.add_task(run_delete_agent_job, existing_job.id, agent_id)
+            return {"status": "accepted", "job_id": existing_job.id, "message": "Agent deletion restarted"}
+        return {"status": "accepted", "job_id": existing_job.id, "message": "Agent deletion already in progress"}
+
+    # Hide the agent immediately; the heavy cleanup runs after the response is sent
+    agent.status = "deleting"
+    job = BackgroundJob(
+        id=str(uuid.uuid4()),
+        kind="delete_agent",
+        target_id=agent_id,
+        status="pending",
+        created_at=datetime.utcnow().isoformat()
+    )
+    db.add(job)
+    db.commit()
+
+    background_tasks.add_task(run_delete_agent_job, job.id, agent_id)
+    return {"status": "accepted", "job_id": job.id, "message": "Agent deletion started"}
+
+def run_delete_agent_job(job_id: str, agent_id: str):
+    """
+    Removes an agent and everything that references it: one vector delete by
+    agent_id, then set-based deletes of all child rows in one transaction.
+    """
+    db = SessionLocal()
+    try:
+        if not claim_job(db, job_id):
+            logger.info("Agent deletion job %s is owned by another worker", job_id)
+            return
+        job = db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+
+        for space in agent_spaces(db, agent_id):
+            space.store.delete_agent_documents(agent_id)
+        knowledge_changed(agent_id)
+        if llm_service.context_cache:
+            llm_service.context_cache.invalidate(agent_id)
+
+        counts = {}
+        for model in (ChatMessage, KnowledgeGap, AgentSkill, IngestedFile, Topic):
+            counts[model.__tablename__] = db.query(model).filter(
+                model.agent_id == agent_id
+            ).delete(synchronize_session=False)
+        db.query(Agent).filter(Agent.id == agent_id).delete(synchronize_session=False)
+
+        job.status = "completed"
+        job.detail = json.dumps(counts)
+        job.finished_at = datetime.utcnow().isoformat()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.exception("Agent deletion job %s failed: %s", job_id, e)
+        job = db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+        if job:
+            job.status = "failed"
+            job.detail = str(e)
+            job.finished_at = datetime.utcnow().isoformat()
+            db.commit()
+    finally:
+        db.close()
+
+def resume_delete_agent_jobs():
+    """
+    Restarts agent deletions interrupted by a shutdown (pending, or running
+    without a live owner). Called on startup; every step is idempotent.
+    """
+    with SessionLocal() as db:
+        jobs = db.query(BackgroundJob.id, BackgroundJob.target_id).filter(
+            BackgroundJob.id.in_(claimable_job_ids(db, "delete_agent"))
+        ).all()
+    for job_id, agent_id in jobs:
+        logger.info("Resuming agent deletion job %s", job_id)
+        threading.Thread(target=run_delete_agent_job, args=(job_id, agent_id), daemon=True).start()
+    return [job_id for job_id, _ in jobs]
+
+# --- JOBS ---
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, db: Session = Depends(get_db)):
+    job = db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "target_id": job.target_id,
+        "status": job.status,
+        "detail": job.detail,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at
+    }
+
+# --- RE-EMBEDDING ---
+
+@app.post("/agents/{agent_id}/reembed", status_code=202)
+def reembed_agent(agent_id: str, background_tasks: BackgroundTasks, target: str = None, db: Session = Depends(get_db)):
+    """
+    Rebuilds the agent's vectors with another embedding model (default: the
+    configured EMBEDDING_PROVIDER) and switches to it once complete.
+    """
+    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    if not agent or agent.status == "deleting":
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    try:
+        target_spec = embedding_spaces.get(target).spec
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if agent.embedding_target:
+        existing_job = db.query(BackgroundJob).filter(
+            BackgroundJob.kind == "reembed_agent",
+            BackgroundJob.target_id == agent_id,
+            BackgroundJob.status.in_(["pending", "running"])
+        ).first()
+        if existing_job:
+            return {"status": "accepted", "job_id": existing_job.id, "message": "Re-embedding already in progress"}
+    if target_spec == agent.embedding_model:
+        raise HTTPException(status_code=400, detail=f"Agent already uses {target_spec}")
+
+    # From here on new knowledge is written to both models
+    agent.embedding_target = target_spec
+    job = BackgroundJob(
+        id=str(uuid.uuid4()),
+        kind="reembed_agent",
+        target_id=agent_id,
+        status="pending",
+        detail=json.dumps({"source": agent.embedding_model, "target": target_spec}),
+        created_at=datetime.utcnow().isoformat()
+    )
+    db.add(job)
     db.commit()
-    return {"status": "success", "message": "Agent deleted"}
 
-    return {"status": "success", "message": "Agent deleted"}
+    background_tasks.add_task(run_reembed_job, job.id, embedding_spaces)
+    return {"status": "accepted", "job_id": job.id, "message": f"Re-embedding into {target_spec} started"}
+
+# --- SNAPSHOTS ---
+
+@app.get("/agents/{agent_id}/snapshot")
+def export_agent_snapshot(agent_id: str, db: Session = Depends(get_db)):
+    """
+    Binary snapshot of an agent's knowledge (topics, stored texts, embeddings
+    and skills) that can be imported elsewhere without any LLM calls.
+    """
+    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    if not agent or agent.status == "deleting":
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    topics = db.query(*TOPIC_COLUMNS).filter(Topic.agent_id == agent_id).all()
+    skills = db.query(AgentSkill).filter(AgentSkill.agent_id == agent_id).all()
+    space = agent_spaces(db, agent_id)[0]
+    snapshot = encode_snapshot(
+        agent={"id": agent.id, "name": agent.name, "description": agent.description, "color": agent.color},
+        topics=[{"id": t.id, "name": t.name, "doc_count": t.doc_count, "status": t.status} for t in topics],
+        skills=[
+            {"id": s.id, "name": s.name, "description": s.description, "code": s.code, "parameters": s.parameters}
+            for s in skills
+        ],
+        documents=space.store.export_documents(agent_id),
+        embedding_info=space.embedder.info()
+    )
+    return Response(
+        content=snapshot,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="agent-{agent_id}.kbsnap"'}
+    )
+
+@app.post("/agents/import")
+def import_agent_snapshot(file: UploadFile = File(...), as_copy: bool = Form(False), db: Session = Depends(get_db)):
+    """
+    Loads a snapshot with bulk inserts. IDs are kept so replicas stay
+    addressable by the same agent id, unless as_copy is set.
+    """
+    # Plain def: decoding, the bulk inserts and the vector write all block
+    try:
+        snapshot = decode_snapshot(file.file.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Vectors cannot be converted between embedding spaces without re-embedding
+    expected = llm_service.embedder.info()
+    recorded = snapshot["embedding"]
+    if any(recorded.get(key) != expected[key] for key in ("provider", "model", "dimension")):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Snapshot was embedded with {recorded.get('provider')}/{recorded.get('model')} "
+                   f"({recorded.get('dimension')}-d), this server uses {expected['provider']}/{expected['model']} "
+                   f"({expected['dimension']}-d)"
+        )
+
+    ids = {}
+    def new_id(old_id):
+        if not as_copy:
+            return old_id
+        return ids.setdefault(old_id, str(uuid.uuid4()))
+
+    agent_id = new_id(snapshot["agent"]["id"])
+    if db.query(Agent.id).filter(Agent.id == agent_id).first():
+        raise HTTPException(status_code=409, detail="Agent already exists (import with as_copy to duplicate it)")
+
+    store = embedding_spaces.default.store
+    # Ids are chosen up front so a failed import can remove exactly what it wrote
+    documents = [
+        {**doc, "id": str(uuid.uuid4()), "agent_id": agent_id, "topic_id": new_id(doc["topic_id"])}
+        for doc in snapshot["documents"]
+    ]
+    try:
+        db.bulk_insert_mappings(Agent, [{
+            **snapshot["agent"], "id": agent_id, "status": "active", "embedding_model": embedding_spaces.default.spec
+        }])
+        db.bulk_insert_mappings(Topic, [
+            {**topic, "id": new_id(topic["id"]), "agent_id": agent_id} for topic in snapshot["topics"]
+        ])
+        db.bulk_insert_mappings(AgentSkill, [
+            {**skill, "id": new_id(skill["id"]), "agent_id": agent_id} for skill in snapshot["skills"]
+        ])
+        db.flush()
+    except IntegrityError:
+        # Topic or skill ids (or a concurrent import) collide with existing rows
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Snapshot ids already exist (import with as_copy to duplicate it)")
+
+    try:
+        if documents:
+            store.add_documents(documents)
+        db.commit()
+    except Exception:
+        db.rollback()
+        try:
+            store.delete_documents_by_id(agent_id, [doc["id"] for doc in documents])
+        except Exception as e:
+            logger.warning("Could not remove vectors of failed import %s: %s", agent_id, e)
+        raise
+
+    return {
+        "status": "success",
+        "agent_id": agent_id,
+        "topics": len(snapshot["topics"]),
+        "skills": len(snapshot["skills"]),
+        "documents": len(snapshot["documents"])
+    }
 
 # --- SKILLS ---
 
@@ -253,7 +669,7 @@ def update_agent_skill(agent_id: str, skill_id: str, skill_update: SkillUpdate,
         parameters=params
     )
 
-@app.post("/conversations")
+@app.post("/conversations", response_model=ConversationResponse)
 def create_conversation(db: Session = Depends(get_db)):
     now = datetime.utcnow().isoformat()
     conversation = Conversation(
@@ -267,21 +683,27 @@ def create_conversation(db: Session = Depends(get_db)):
     db.refresh(conversation)
     return conversation
 
-@app.get("/conversations")
-def get_conversations(limit: int = 50, db: Session = Depends(get_db)):
-    conversations = db.query(Conversation).order_by(
-        Conversation.updated_at.desc()
-    ).limit(limit).all()
-    return conversations
+@app.get("/conversations", response_model=ConversationPage)
+def get_conversations(limit: int = 50, cursor: str = None, db: Session = Depends(get_db)):
+    # Most recently updated first
+    query = db.query(*CONVERSATION_LIST_COLUMNS)
+    rows, next_cursor = keyset_page(
+        query, [Conversation.updated_at, Conversation.id], cursor, limit, descending=True
+    )
+    return {"items": [row._asdict() for row in rows], "next_cursor": next_cursor}
 
-@app.get("/conversations/{conversation_id}/messages")
-def get_conversation_messages(conversation_id: str, db: Session = Depends(get_db)):
-    messages = db.query(ChatMessage).filter(
+@app.get("/conversations/{conversation_id}/messages", response_model=MessagePage)
+def get_conversation_messages(conversation_id: str, limit: int = 50, cursor: str = None, db: Session = Depends(get_db)):
+    # Pages walk backwards from the newest message; each page is returned chronologically
+    query = db.query(*MESSAGE_COLUMNS).filter(
         ChatMessage.conversation_id == conversation_id
-    ).order_by(ChatMessage.timestamp).all()
-    return messages
+    )
+    rows, next_cursor = keyset_page(
+        query, [ChatMessage.timestamp, ChatMessage.id], cursor, limit, descending=True
+    )
+    return {"items": [row._asdict() for row in reversed(rows)], "next_cursor": next_cursor}
 
-@app.patch("/conversations/{conversation_id}")
+@app.patch("/conversations/{conversation_id}", response_model=ConversationResponse)
 def update_conversation(conversation_id: str, title: str, db: Session = Depends(get_db)):
     conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
     if not conversation:
@@ -310,64 +732,102 @@ def delete_conversation(conversation_id: str, db: Session = Depends(get_db)):
 @app.post("/chat", response_model=ChatResponse)
 def chat(request: ChatRequest, db: Session = Depends(get_db)):
     agent = db.query(Agent).filter(Agent.id == request.agent_id).first()
-    if not agent:
+    if not agent or agent.status == "deleting":
         raise HTTPException(status_code=404, detail="Agent not found")
     
     try:
-        # 1. Get Embedding for User Message
-        user_embedding = llm_service.get_embedding(request.message)
+        # 1. Get Embedding for User Message (one per model while re-embedding)
+        spaces = agent_spaces(db, request.agent_id)
+        with chat_stage("embedding"):
+            user_embeddings = [space.embed_one(request.message) for space in spaces]
         
         # 2. Search Vector DB for Knowledge
-        context_docs = vector_store.search(request.agent_id, user_embedding)
-        context_text = "\n\n".join(context_docs) if context_docs else "No specific knowledge found."
+        with chat_stage("vector_search"):
+            context_docs = search_knowledge(spaces, user_embeddings, request.agent_id)
         
         # 3. FETCH CHAT HISTORY (Context Awareness)
-        history_text = ""
+        # Only messages after the rolling summary's (timestamp, id) cursor are sent raw
+        conversation = None
+        history_messages = []
+        backlog, backlog_complete = [], True
         if request.conversation_id:
-            # Get last 10 messages, newest first
-            recent_messages = db.query(ChatMessage).filter(
-                ChatMessage.conversation_id == request.conversation_id
-            ).order_by(desc(ChatMessage.timestamp)).limit(10).all()
-            
-            # Reverse to make them chronological (Old -> New)
-            recent_messages.reverse()
-            
-            history_text = "\n".join([f"{msg.role.upper()}: {msg.content}" for msg in recent_messages])
-
-        # 4. Construct Prompt (Summary First)
-        system_prompt = f"You are {agent.name}. {agent.description}"
-        
-        full_prompt = f"""{system_prompt}
+            with chat_stage("history_fetch"):
+                conversation = db.query(Conversation).filter(Conversation.id == request.conversation_id).first()
+                history_query = db.query(ChatMessage).filter(
+                    ChatMessage.conversation_id == request.conversation_id
+                )
+                cursor_columns = [ChatMessage.timestamp, ChatMessage.id]
+                if conversation and conversation.summary_upto:
+                    history_query = history_query.filter(keyset_after(
+                        cursor_columns, [conversation.summary_upto, conversation.summary_upto_id or ""]
+                    ))
+                history_messages = history_query.order_by(
+                    desc(ChatMessage.timestamp), desc(ChatMessage.id)
+                ).limit(HISTORY_FETCH_LIMIT).all()
+                
+                # Reverse to make them chronological (Old -> New)
+                history_messages.reverse()
 
-### INSTRUCTIONS:
-1. **BE CONCISE.** Start with a high-level summary (2-3 sentences max).
-2. Do NOT dump all the details immediately. 
-3. Only provide deep technical details if the user specifically asks for "details", "more info", or "full explanation".
-4. Use the provided Knowledge Base to answer.
-5. Use the Conversation History to understand follow-up questions (e.g., if user says "Tell me more about that").
-6. **CRITICAL**: If you cannot find the answer in the Knowledge Base below, you MUST respond with EXACTLY this phrase: "I don't have that information in my knowledge base." Do NOT guess or make up information.
+                # Unsummarized messages older than the fetched window are folded first,
+                # oldest first, at most HISTORY_FETCH_LIMIT per turn
+                if conversation and len(history_messages) == HISTORY_FETCH_LIMIT:
+                    first = history_messages[0]
+                    backlog = history_query.filter(
+                        keyset_after(cursor_columns, [first.timestamp, first.id], descending=True)
+                    ).order_by(ChatMessage.timestamp, ChatMessage.id).limit(HISTORY_FETCH_LIMIT + 1).all()
+                    backlog_complete = len(backlog) <= HISTORY_FETCH_LIMIT
+                    backlog = backlog[:HISTORY_FETCH_LIMIT]
 
-### KNOWLEDGE BASE (Reference Material):
-{context_text}
+        # 4. Construct Prompt within the token budget (Summary First)
+        system_prompt = f"You are {agent.name}. {agent.description}"
+        summary = conversation.summary if conversation else None
 
-### CONVERSATION HISTORY (Context):
-{history_text}
+        # Documents already in the always-on pack needn't be repeated in the turn
+        pack = knowledge_pack(db, request.agent_id)
+        if pack and context_docs:
+            context_docs = [doc for doc in context_docs if doc not in pack]
 
-### CURRENT USER MESSAGE:
-USER: {request.message}
-CONTEXT FROM UPLOADED FILE:
-{request.context_text if request.context_text else "None"}
+        history_budget = prompt_builder.history_budget(
+            context_docs, history_messages, summary, request.context_text, request.message, system_prompt
+        )
+        kept_messages, overflow = prompt_builder.split_history(history_messages, history_budget)
+        # Fold messages that no longer fit into the conversation summary, in order:
+        # the window's overflow only once every older message has been folded
+        to_fold = backlog + overflow if backlog_complete else backlog
+        if to_fold and conversation:
+            try:
+                with chat_stage("history_summary"):
+                    summary = llm_service.summarize_conversation(summary, to_fold)
+                conversation.summary = summary
+                conversation.summary_upto = to_fold[-1].timestamp
+                conversation.summary_upto_id = to_fold[-1].id
+            except LLMServiceError as e:
+                # Cursor unchanged: the messages are folded on a later turn
+                logger.error("Conversation summary failed: %s", e)
+        if overflow:
+            history_messages = kept_messages
 
-YOUR RESPONSE:"""
+        # Stable prefix (persona, instructions, pack) and this turn's part, so the
+        # prefix can be served from the provider's context cache
+        chat_prefix = prompt_builder.build_chat_prefix(system_prompt, pack)
+        turn_prompt = prompt_builder.build_chat_turn(
+            system_prompt,
+            context_docs or [],
+            summary,
+            history_messages,
+            request.message,
+            request.context_text
+        )
         
         # 5. Fetch Skills
         skills = db.query(AgentSkill).filter(AgentSkill.agent_id == request.agent_id).all()
-        print(f"DEBUG: Found {len(skills)} skills for agent {request.agent_id}")
-        for skill in skills:
-            print(f"  - {skill.name}: {skill.description}")
+        logger.debug("Loaded agent skills", extra={"agent_id": request.agent_id, "skills": [skill.name for skill in skills]})
 
         # 6. Generate Response (with potential tool calling)
-        response_payload = llm_service.generate_response(full_prompt, skills=skills)
+        with chat_stage("generation"):
+            response_payload = llm_service.generate_response(
+                turn_prompt, skills=skills, prefix=chat_prefix, prefix_owner=request.agent_id
+            )
         
         response_text = ""
         
@@ -381,7 +841,8 @@ YOUR RESPONSE:"""
             
             if skill_record:
                 # Execute Skill
-                execution_result = execute_python_skill(skill_record.code, tool_args)
+                with chat_stage("skill_execution"):
+                    execution_result = execute_python_skill(skill_record.code, tool_args)
                 response_text = f"⚙️ Executed Skill '{tool_name}':\n\n{execution_result}"
             else:
                 response_text = f"⚠️ Tried to call skill '{tool_name}' but it was not found."
@@ -415,20 +876,21 @@ YOUR RESPONSE:"""
         
         # 7. Update conversation timestamp & Auto-Title
         if request.conversation_id:
-            conversation = db.query(Conversation).filter(Conversation.id == request.conversation_id).first()
             if conversation:
                 conversation.updated_at = datetime.utcnow().isoformat()
                 
                 # Generate title if it's new
                 if conversation.title == "New Conversation":
                     try:
-                        title = llm_service.generate_conversation_title(request.message)
+                        with chat_stage("title_generation"):
+                            title = llm_service.generate_conversation_title(request.message)
                         if title and len(title) < 50: 
                             conversation.title = title
                     except Exception as e:
-                        print(f"Title generation failed: {e}")
+                        logger.error("Title generation failed: %s", e)
         
-        db.commit()
+        with chat_stage("db_commit"):
+            db.commit()
         
         # 8. Detect Knowledge Gap (Exact Match)
         # We instruct the LLM to use this exact phrase when it doesn't know
@@ -454,7 +916,8 @@ YOUR RESPONSE:"""
                     frequency=1
                 )
                 db.add(new_gap)
-            db.commit()
+            with chat_stage("db_commit"):
+                db.commit()
             
             # Replace the generic response with a more helpful one including ticket number
             response_text = f"""I don't have that information in my knowledge base yet.
@@ -463,8 +926,11 @@ I've created a ticket ({ticket_number}) and will reach out to the owner to updat
         
         return ChatResponse(response=response_text, source="ai")
 
+    except LLMServiceError:
+        # Handled by llm_service_error_handler (503)
+        raise
     except Exception as e:
-        print(f"Chat Endpoint Error: {str(e)}")
+        logger.exception("Chat Endpoint Error: %s", e)
         # Raise 500 so frontend knows something went wrong
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
@@ -480,12 +946,17 @@ def submit_feedback(message_id: str, request: FeedbackRequest, db: Session = Dep
 
 # --- TOPICS & KNOWLEDGE ---
 
-@app.get("/agents/{agent_id}/topics")
-def get_topics(agent_id: str, db: Session = Depends(get_db)):
-    return db.query(Topic).filter(Topic.agent_id == agent_id).all()
+@app.get("/agents/{agent_id}/topics", response_model=TopicPage)
+def get_topics(agent_id: str, limit: int = 50, cursor: str = None, db: Session = Depends(get_db)):
+    query = db.query(*TOPIC_COLUMNS).filter(Topic.agent_id == agent_id)
+    rows, next_cursor = keyset_page(query, [Topic.name, Topic.id], cursor, limit)
+    return {"items": [row._asdict() for row in rows], "next_cursor": next_cursor}
 
-@app.post("/agents/{agent_id}/topics")
+@app.post("/agents/{agent_id}/topics", response_model=TopicResponse)
 def create_topic(agent_id: str, name: str, db: Session = Depends(get_db)):
+    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    if not agent or agent.status == "deleting":
+        raise HTTPException(status_code=404, detail="Agent not found")
     db_topic = Topic(
         id=str(uuid.uuid4()),
         agent_id=agent_id,
@@ -504,14 +975,20 @@ def delete_topic(agent_id: str, topic_id: str, db: Session = Depends(get_db)):
     
     db.delete(topic)
     db.commit()
-    vector_store.delete_documents(agent_id, topic_id)
+    for space in agent_spaces(db, agent_id):
+        space.store.delete_documents(agent_id, topic_id)
+    knowledge_changed(agent_id)
     return {"status": "success", "message": "Topic deleted"}
 
 @app.post("/agents/{agent_id}/topics/{topic_id}/knowledge")
 def add_knowledge(agent_id: str, topic_id: str, request: KnowledgeRequest, db: Session = Depends(get_db)):
-    enriched_text = llm_service.enrich_knowledge(request.text)
-    embedding = llm_service.get_embedding(enriched_text)
-    vector_store.add_document(agent_id, topic_id, enriched_text, embedding, raw_text=request.text)
+    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    if not agent or agent.status == "deleting":
+        raise HTTPException(status_code=404, detail="Agent not found")
+    with llm_priority("bulk"):
+        enriched_text = llm_service.enrich_knowledge(request.text)
+        store_knowledge(db, agent_id, topic_id, enriched_text, raw_text=request.text)
+    knowledge_changed(agent_id)
     
     topic = db.query(Topic).filter(Topic.id == topic_id).first()
     if topic:
@@ -536,26 +1013,32 @@ def add_knowledge(agent_id: str, topic_id: str, request: KnowledgeRequest, db: S
 
 @app.get("/agents/{agent_id}/topics/{topic_id}/summary")
 def get_topic_summary(agent_id: str, topic_id: str, db: Session = Depends(get_db)):
-    docs = vector_store.get_documents(agent_id, topic_id)
+    docs = agent_spaces(db, agent_id)[0].store.get_documents(agent_id, topic_id)
     if not docs or len(docs) == 0:
         return {"summary": "I don't know anything about this topic yet. Please teach me!"}
     
     combined_text = "\n\n".join(docs)
-    summary = llm_service.summarize_text(combined_text)
+    with llm_priority("training"):
+        summary = llm_service.summarize_text(combined_text)
     return {"summary": summary}
 
 # --- APPRENTICE MODE ---
 
 @app.post("/agents/{agent_id}/topics/{topic_id}/training/analyze")
 def analyze_training_text(agent_id: str, topic_id: str, request: AnalyzeRequest):
-    analysis = llm_service.analyze_text(request.text)
+    with llm_priority("training"):
+        analysis = llm_service.analyze_text(request.text)
     return analysis
 
 @app.post("/agents/{agent_id}/topics/{topic_id}/training/finalize")
 def finalize_training(agent_id: str, topic_id: str, request: FinalizeRequest, db: Session = Depends(get_db)):
-    crystallized_text = llm_service.crystallize_knowledge(request.original_text, request.qa_pairs)
-    embedding = llm_service.get_embedding(crystallized_text)
-    vector_store.add_document(agent_id, topic_id, crystallized_text, embedding)
+    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    if not agent or agent.status == "deleting":
+        raise HTTPException(status_code=404, detail="Agent not found")
+    with llm_priority("training"):
+        crystallized_text = llm_service.crystallize_knowledge(request.original_text, request.qa_pairs)
+        store_knowledge(db, agent_id, topic_id, crystallized_text)
+    knowledge_changed(agent_id)
     
     topic = db.query(Topic).filter(Topic.id == topic_id).first()
     if topic:
@@ -566,14 +1049,20 @@ def finalize_training(agent_id: str, topic_id: str, request: FinalizeRequest, db
 
 # --- KNOWLEDGE GAPS ---
 
-@app.get("/agents/{agent_id}/gaps")
-def get_knowledge_gaps(agent_id: str, db: Session = Depends(get_db)):
-    return db.query(KnowledgeGap).filter(KnowledgeGap.agent_id == agent_id, KnowledgeGap.status == "open").all()
+@app.get("/agents/{agent_id}/gaps", response_model=KnowledgeGapPage)
+def get_knowledge_gaps(agent_id: str, limit: int = 50, cursor: str = None, db: Session = Depends(get_db)):
+    # Most frequently asked first
+    query = db.query(*GAP_COLUMNS).filter(KnowledgeGap.agent_id == agent_id, KnowledgeGap.status == "open")
+    rows, next_cursor = keyset_page(
+        query, [KnowledgeGap.frequency, KnowledgeGap.id], cursor, limit, descending=True
+    )
+    return {"items": [row._asdict() for row in rows], "next_cursor": next_cursor}
 
 @app.post("/agents/{agent_id}/gaps/resolve")
 def resolve_gap(agent_id: str, request: KnowledgeRequest, db: Session = Depends(get_db)):
     gap_text = request.text
-    suggested_name = llm_service.suggest_topic_name(gap_text)
+    with llm_priority("training"):
+        suggested_name = llm_service.suggest_topic_name(gap_text)
     
     existing_topic = db.query(Topic).filter(
         Topic.agent_id == agent_id, 
@@ -595,12 +1084,85 @@ def resolve_gap(agent_id: str, request: KnowledgeRequest, db: Session = Depends(
 
 # --- CHAT HISTORY (FOR TRAINING) ---
 
-@app.get("/agents/{agent_id}/chat/history")
-def get_chat_history(agent_id: str, limit: int = 50, db: Session = Depends(get_db)):
-    messages = db.query(ChatMessage).filter(
+@app.get("/agents/{agent_id}/chat/history", response_model=MessagePage)
+def get_chat_history(agent_id: str, limit: int = 50, cursor: str = None, db: Session = Depends(get_db)):
+    # Same paging scheme as conversation messages: newest page first, chronological within a page
+    query = db.query(*MESSAGE_COLUMNS).filter(
         ChatMessage.agent_id == agent_id
-    ).order_by(ChatMessage.timestamp.desc()).limit(limit).all()
-    return list(reversed(messages))
+    )
+    rows, next_cursor = keyset_page(
+        query, [ChatMessage.timestamp, ChatMessage.id], cursor, limit, descending=True
+    )
+    return {"items": [row._asdict() for row in reversed(rows)], "next_cursor": next_cursor}
+
+# --- SEARCH ---
+
+def ranked_search(db: Session, table: str, q: str, filters: dict, limit: int, cursor: str):
+    if not database.fts_enabled:
+        raise HTTPException(status_code=503, detail="Full-text search is unavailable (SQLite without FTS5)")
+    try:
+        hits, next_cursor = search(db, table, q, filters, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": hits, "next_cursor": next_cursor}
+
+@app.get("/search/messages", response_model=MessageSearchPage)
+def search_messages(
+    q: str,
+    agent_id: str = None,
+    conversation_id: str = None,
+    rating: int = None,
+    role: str = None,
+    limit: int = 20,
+    cursor: str = None,
+    db: Session = Depends(get_db)
+):
+    # e.g. ?q=vpn&agent_id=...&role=agent&rating=-1 for badly rated answers
+    if role is not None and role not in MESSAGE_ROLES:
+        raise HTTPException(status_code=422, detail=f"role must be one of: {', '.join(MESSAGE_ROLES)}")
+    filters = {"agent_id": agent_id, "conversation_id": conversation_id, "rating": rating, "role": role}
+    return ranked_search(db, "chat_messages", q, filters, limit, cursor)
+
+@app.get("/search/gaps", response_model=KnowledgeGapSearchPage)
+def search_gaps(
+    q: str,
+    agent_id: str = None,
+    status: str = None,
+    limit: int = 20,
+    cursor: str = None,
+    db: Session = Depends(get_db)
+):
+    filters = {"agent_id": agent_id, "status": status}
+    return ranked_search(db, "knowledge_gaps", q, filters, limit, cursor)
+
+# --- LLM CACHE ---
+
+@app.get("/llm/cache/stats")
+def get_llm_cache_stats():
+    return llm_service.cache_stats()
+
+@app.delete("/llm/cache")
+def clear_llm_cache(namespace: str = None):
+    if not llm_service.cache:
+        raise HTTPException(status_code=400, detail="LLM cache is disabled")
+    llm_service.cache.clear(namespace)
+    return {"status": "success", "message": "LLM cache cleared"}
+
+@app.get("/llm/context-cache/stats")
+def get_context_cache_stats():
+    if not llm_service.context_cache:
+        return {"enabled": False}
+    return {"enabled": True, **llm_service.context_cache.stats()}
+
+@app.get("/llm/rate-limits")
+def get_llm_rate_limits():
+    return limiter_stats()
+
+@app.get("/llm/admission")
+def get_llm_admission():
+    if not llm_service.admission:
+        return {"enabled": False}
+    return {"enabled": True, "classes": llm_service.admission.stats()}
 
 # --- FILE UPLOAD ---
 
@@ -612,6 +1174,10 @@ async def upload_file(
     topic_id: str = Form(None),
     db: Session = Depends(get_db)
 ):
+    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    if not agent or agent.status == "deleting":
+        raise HTTPException(status_code=404, detail="Agent not found")
+
     # 1. Extract Text
     text = await extract_text_from_file(file)
     
@@ -623,10 +1189,13 @@ async def upload_file(
         if not topic_id:
             raise HTTPException(status_code=400, detail="Topic ID required for training upload.")
             
-        # Enrich and Store
-        enriched_text = llm_service.enrich_knowledge(text)
-        embedding = llm_service.get_embedding(enriched_text)
-        vector_store.add_document(agent_id, topic_id, enriched_text, embedding, raw_text=text)
+        # Enrich and Store, off the event loop: bulk calls may queue behind chat traffic
+        def ingest():
+            with llm_priority("bulk"):
+                enriched_text = llm_service.enrich_knowledge(text)
+                store_knowledge(db, agent_id, topic_id, enriched_text, raw_text=text)
+        await run_in_threadpool(ingest)
+        knowledge_changed(agent_id)
         
         # Update Topic Count
         topic = db.query(Topic).filter(Topic.id == topic_id).first()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Index
 from database import Base
 
 class Agent(Base):
@@ -9,6 +9,8 @@ class Agent(Base):
     description = Column(Text)
     status = Column(String, default="active") # active, training, idle
     color = Column(String, default="bg-blue-500")
+    embedding_model = Column(String, nullable=True)  # "provider:model" of the agent's vectors
+    embedding_target = Column(String, nullable=True)  # Set while re-embedding into another model
 
 class KnowledgeGap(Base):
     __tablename__ = "knowledge_gaps"
@@ -19,6 +21,10 @@ class KnowledgeGap(Base):
     frequency = Column(Integer, default=1)
     status = Column(String, default="open")
 
+    __table_args__ = (
+        Index("ix_knowledge_gaps_agent_status_freq_id", "agent_id", "status", "frequency", "id"),
+    )
+
 class Topic(Base):
     __tablename__ = "topics"
 
@@ -28,6 +34,10 @@ class Topic(Base):
     doc_count = Column(Integer, default=0)
     status = Column(String, default="active")
 
+    __table_args__ = (
+        Index("ix_topics_agent_name_id", "agent_id", "name", "id"),
+    )
+
 class Conversation(Base):
     __tablename__ = "conversations"
 
@@ -35,6 +45,14 @@ class Conversation(Base):
     title = Column(String, default="New Conversation")
     created_at = Column(String)  # ISO format timestamp
     updated_at = Column(String)  # ISO format timestamp
+    summary = Column(Text, nullable=True)  # Rolling summary of older history
+    summary_upto = Column(String, nullable=True)  # Timestamp of last summarized message
+    summary_upto_id = Column(String, nullable=True)  # Its id: (summary_upto, summary_upto_id) is the fold cursor
+
+    __table_args__ = (
+        # Keyset pagination: most recently updated first
+        Index("ix_conversations_updated_at_id", "updated_at", "id"),
+    )
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
@@ -47,6 +65,12 @@ class ChatMessage(Base):
     timestamp = Column(String)
     rating = Column(Integer, default=0)
 
+    __table_args__ = (
+        # Keyset pagination over a conversation / an agent's history
+        Index("ix_chat_messages_conversation_ts_id", "conversation_id", "timestamp", "id"),
+        Index("ix_chat_messages_agent_ts_id", "agent_id", "timestamp", "id"),
+    )
+
 class AgentSkill(Base):
     __tablename__ = "agent_skills"
 
@@ -56,3 +80,33 @@ class AgentSkill(Base):
     description = Column(Text)
     code = Column(Text)
     parameters = Column(Text) # Storing JSON as text for simplicity in SQLite
+
+class BackgroundJob(Base):
+    __tablename__ = "background_jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    kind = Column(String)  # e.g. delete_agent, reembed_agent
+    target_id = Column(String, index=True)
+    status = Column(String, default="pending")  # pending, running, completed, failed
+    detail = Column(Text, nullable=True)  # JSON result or error message
+    created_at = Column(String)  # ISO format timestamp
+    finished_at = Column(String, nullable=True)
+    owner = Column(String, nullable=True)  # worker holding the job (services/jobs.py)
+    heartbeat_at = Column(String, nullable=True)  # owner's last lease renewal
+
+class IngestedFile(Base):
+    __tablename__ = "ingested_files"
+
+    id = Column(String, primary_key=True, index=True)
+    job_id = Column(String, index=True)  # The bulk_ingest BackgroundJob that processed it
+    agent_id = Column(String, ForeignKey("agents.id"))
+    topic_id = Column(String, ForeignKey("topics.id"))
+    path = Column(String)
+    content_hash = Column(String)  # sha256 of the file's bytes
+    status = Column(String, default="pending")  # pending (vectors being written), done, failed
+    doc_ids = Column(Text, nullable=True)  # JSON list of the chunk ids counted in Topic.doc_count
+    error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_ingested_files_agent_topic_hash", "agent_id", "topic_id", "content_hash"),
+    )
@@ -0,0 +1,389 @@
+import os
+import json
+import shutil
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from vector_store import VectorStore
+
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+
+
+def quantize(vectors: np.ndarray, dtype: str):
+    """
+    Converts float32 rows to the storage dtype. int8 is scalar-quantized
+    with a per-row scale, returned alongside (None for other dtypes).
+    """
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vectors.astype(dtype), None
+
+
+def dequantize(stored: np.ndarray, scales: np.ndarray = None) -> np.ndarray:
+    if scales is not None:
+        return stored.astype(np.float32) * scales[:, None]
+    return np.asarray(stored, dtype=np.float32)
+
+
+@contextmanager
+def _file_lock(path: str):
+    """
+    Exclusive lock on `path` shared by every process using the index
+    directory (API workers, the vector service). A no-op where fcntl is
+    unavailable, leaving only the in-process lock.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class AgentIndex:
+    """
+    One agent's vectors as a contiguous matrix in a memory-mapped file, plus a
+    JSON sidecar with document text and metadata. Rows are append-only;
+    deletes are tombstoned and the file is compacted once half of it is dead.
+    int8 rows are stored with a per-row float32 scale.
+
+    meta.json is the commit point: it is replaced atomically after vectors
+    are appended, rows past its count (left by an interrupted append) are
+    truncated before the next one, and compaction writes a new generation of
+    files before switching meta.json to it. Writers hold a file lock and
+    re-read meta.json first, so several processes can share the directory;
+    searches reload it when another process has changed it.
+    """
+
+    # Rows converted to float32 at a time when searching float16/int8 matrices
+    SEARCH_BLOCK_ROWS = 1024
+
+    def __init__(self, path: str, dtype: str = "float32"):
+        self.path = path
+        self.dtype = dtype
+        self.meta_path = os.path.join(path, "meta.json")
+        self.lock_path = os.path.join(path, ".lock")
+        self.lock = threading.RLock()
+        self._lock_depth = 0  # flock is not re-entrant; nested locked() calls reuse the outer one
+        self._matrix = None
+        self._scales = None
+        self._norms = None
+        self._meta_stamp = None
+        self.meta = {"dim": None, "dtype": dtype, "generation": 0, "docs": []}
+        self._reload()
+
+    def _files(self, generation: int):
+        suffix = f"-{generation}" if generation else ""  # generation 0 keeps the original names
+        return (os.path.join(self.path, f"vectors{suffix}.bin"), os.path.join(self.path, f"scales{suffix}.bin"))
+
+    @property
+    def vectors_path(self) -> str:
+        return self._files(self.meta.get("generation", 0))[0]
+
+    @property
+    def scales_path(self) -> str:
+        return self._files(self.meta.get("generation", 0))[1]
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _reload(self):
+        """Re-reads meta.json if another process (or a drop) changed it."""
+        stamp = self._stamp()
+        if stamp == self._meta_stamp:
+            return
+        if stamp is None:
+            self.meta = {"dim": None, "dtype": self.dtype, "generation": 0, "docs": []}
+        else:
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+            self.dtype = self.meta["dtype"]
+        self._meta_stamp = stamp
+        self._invalidate()
+
+    @contextmanager
+    def locked(self):
+        """Exclusive access across threads and processes, with fresh metadata."""
+        with self.lock:
+            if self._lock_depth:
+                yield
+                return
+            os.makedirs(self.path, exist_ok=True)
+            with _file_lock(self.lock_path):
+                self._lock_depth += 1
+                try:
+                    self._reload()
+                    yield
+                finally:
+                    self._lock_depth -= 1
+
+    @property
+    def count(self) -> int:
+        return len(self.meta["docs"])
+
+    @property
+    def live_count(self) -> int:
+        return sum(1 for doc in self.meta["docs"] if doc["alive"])
+
+    def _save_meta(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+        self._meta_stamp = self._stamp()
+
+    def _invalidate(self):
+        self._matrix = None
+        self._scales = None
+        self._norms = None
+
+    @staticmethod
+    def _append(path: str, data: np.ndarray, keep_bytes: int):
+        # Drop bytes of an append that never reached meta.json
+        with open(path, "ab") as f:
+            f.truncate(keep_bytes)
+            f.write(data.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add(self, docs: list, vectors: list):
+        with self.locked():
+            matrix = np.asarray(vectors, dtype=np.float32)
+            if self.meta["dim"] is None:
+                self.meta["dim"] = int(matrix.shape[1])
+            elif matrix.shape[1] != self.meta["dim"]:
+                raise ValueError(f"Expected a {self.meta['dim']}-d embedding, got {matrix.shape[1]}")
+
+            stored, scales = quantize(matrix, self.dtype)
+            self._append(self.vectors_path, stored, self.count * self.meta["dim"] * stored.itemsize)
+            if scales is not None:
+                self._append(self.scales_path, scales, self.count * scales.itemsize)
+
+            self.meta["docs"].extend(docs)
+            self._save_meta()
+            self._invalidate()
+
+    def _load(self):
+        if self._matrix is None and self.count:
+            shape = (self.count, self.meta["dim"])
+            self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=shape)
+            if self.dtype == "int8":
+                self._scales = np.fromfile(self.scales_path, dtype=np.float32, count=self.count)
+            self._norms = np.concatenate([
+                np.einsum("ij,ij->i", block, block) for block in self._dense_blocks()
+            ])
+        return self._matrix
+
+    def _dense_blocks(self):
+        """The matrix as float32 blocks, without materializing all of it."""
+        if self.dtype == "float32":
+            yield np.asarray(self._matrix)
+            return
+        for start in range(0, self.count, self.SEARCH_BLOCK_ROWS):
+            end = start + self.SEARCH_BLOCK_ROWS
+            scales = self._scales[start:end] if self.dtype == "int8" else None
+            yield dequantize(self._matrix[start:end], scales)
+
+    def _dot(self, q: np.ndarray) -> np.ndarray:
+        """matrix @ q on the stored rows; int8 rows are scaled after the product."""
+        if self.dtype == "float32":
+            return np.asarray(self._matrix) @ q
+        products = np.concatenate([
+            self._matrix[start:start + self.SEARCH_BLOCK_ROWS].astype(np.float32) @ q
+            for start in range(0, self.count, self.SEARCH_BLOCK_ROWS)
+        ])
+        return products * self._scales if self.dtype == "int8" else products
+
+    def search(self, query: list, n_results: int) -> list:
+        """
+        Exact top-k by L2 distance (Chroma's default), via one matrix-vector product.
+        """
+        with self.lock:
+            self._reload()
+            if not self.live_count:
+                return []
+            self._load()
+            q = np.asarray(query, dtype=np.float32)
+            # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2 ; the last term is constant per query
+            distances = self._norms - 2 * self._dot(q)
+            alive = np.fromiter((doc["alive"] for doc in self.meta["docs"]), dtype=bool, count=self.count)
+            distances[~alive] = np.inf
+
+            k = min(n_results, int(alive.sum()))
+            top = np.argpartition(distances, k - 1)[:k]
+            top = top[np.argsort(distances[top])]
+            return [self.meta["docs"][i]["document"] for i in top]
+
+    def delete(self, topic_id: str = None, doc_ids: set = None):
+        with self.locked():
+            for doc in self.meta["docs"]:
+                if doc_ids is not None:
+                    if doc["id"] in doc_ids:
+                        doc["alive"] = False
+                elif topic_id is None or doc["topic_id"] == topic_id:
+                    doc["alive"] = False
+            if self.live_count == 0:
+                self.drop()
+            elif self.live_count * 2 < self.count:
+                self._compact()
+            else:
+                self._save_meta()
+
+    def _compact(self):
+        # Called with the lock held; the new generation becomes visible with meta.json
+        self._load()
+        keep = np.array([i for i, doc in enumerate(self.meta["docs"]) if doc["alive"]], dtype=np.int64)
+        old_files = (self.vectors_path, self.scales_path)
+        generation = self.meta.get("generation", 0) + 1
+        vectors_path, scales_path = self._files(generation)
+        for path in (vectors_path, scales_path):
+            if os.path.exists(path):
+                os.remove(path)  # leftovers of an interrupted compaction
+        self._append(vectors_path, np.asarray(self._matrix[keep]), 0)
+        if self.dtype == "int8":
+            self._append(scales_path, self._scales[keep], 0)
+
+        self.meta["docs"] = [self.meta["docs"][i] for i in keep]
+        self.meta["generation"] = generation
+        self._invalidate()
+        self._save_meta()
+        for path in old_files:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def drop(self):
+        with self.locked():
+            self._invalidate()
+            self.meta = {"dim": None, "dtype": self.dtype, "generation": 0, "docs": []}
+            # Remove meta.json first so no reader sees it without its vectors
+            if os.path.exists(self.meta_path):
+                os.remove(self.meta_path)
+            self._meta_stamp = None
+            if os.path.isdir(self.path):
+                for name in os.listdir(self.path):
+                    if name != os.path.basename(self.lock_path):
+                        target = os.path.join(self.path, name)
+                        if os.path.isdir(target):
+                            shutil.rmtree(target, ignore_errors=True)
+                        else:
+                            os.remove(target)
+
+
+class NumpyVectorStore:
+    """
+    VectorStore backend for small agents: exact search over per-agent
+    memory-mapped matrices. Chroma stays the source of truth (every write
+    goes to both), and agents above `max_exact_docs` are searched with
+    Chroma's HNSW index instead. Indexes for agents that already have data
+    in Chroma are built lazily on first search.
+    """
+
+    def __init__(self, ann_store: VectorStore, path: str = None, dtype: str = None, max_exact_docs: int = None):
+        self.ann_store = ann_store
+        self.path = path or os.getenv("NUMPY_INDEX_PATH", "./vector_index")
+        self.dtype = dtype or os.getenv("NUMPY_INDEX_DTYPE", "float32")
+        if self.dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"NUMPY_INDEX_DTYPE must be one of {SUPPORTED_DTYPES}")
+        self.max_exact_docs = max_exact_docs or int(os.getenv("NUMPY_INDEX_MAX_DOCS", 5000))
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _index(self, agent_id: str) -> AgentIndex:
+        with self._lock:
+            if agent_id not in self._indexes:
+                self._indexes[agent_id] = AgentIndex(os.path.join(self.path, agent_id), self.dtype)
+            return self._indexes[agent_id]
+
+    def _ensure_built(self, agent_id: str, index: AgentIndex):
+        # Backfill from Chroma the first time we see an agent with existing data
+        marker = os.path.join(index.path, ".built")
+        if os.path.exists(marker):
+            return
+        with index.locked():
+            if os.path.exists(marker):
+                return
+            index.drop()
+            results = self.ann_store.collection.get(
+                where={"agent_id": agent_id}, include=["documents", "metadatas", "embeddings"]
+            )
+            if results["ids"]:
+                docs = [
+                    {"id": doc_id, "topic_id": meta.get("topic_id"), "document": document, "alive": True}
+                    for doc_id, document, meta in zip(results["ids"], results["documents"], results["metadatas"])
+                ]
+                index.add(docs, results["embeddings"])
+            os.makedirs(index.path, exist_ok=True)
+            open(marker, "w").close()
+
+    def add_document(self, agent_id: str, topic_id: str, text: str, embedding: list, raw_text: str = None):
+        index = self._index(agent_id)
+        # Backfill before writing so the new document isn't picked up twice
+        self._ensure_built(agent_id, index)
+        doc_id = self.ann_store.add_document(agent_id, topic_id, text, embedding, raw_text=raw_text)
+        index.add([{"id": doc_id, "topic_id": topic_id, "document": text, "alive": True}], [embedding])
+        return doc_id
+
+    def add_documents(self, items: list):
+        for agent_id in {item["agent_id"] for item in items}:
+            self._ensure_built(agent_id, self._index(agent_id))
+        doc_ids = self.ann_store.add_documents(items)
+        by_agent = {}
+        for doc_id, item in zip(doc_ids, items):
+            by_agent.setdefault(item["agent_id"], []).append((doc_id, item))
+        for agent_id, rows in by_agent.items():
+            self._index(agent_id).add(
+                [{"id": doc_id, "topic_id": item["topic_id"], "document": item["text"], "alive": True} for doc_id, item in rows],
+                [item["embedding"] for _, item in rows]
+            )
+        return doc_ids
+
+    def search(self, agent_id: str, query_embedding: list, n_results: int = 3):
+        index = self._index(agent_id)
+        self._ensure_built(agent_id, index)
+        if index.live_count > self.max_exact_docs:
+            return self.ann_store.search(agent_id, query_embedding, n_results)
+        return index.search(query_embedding, n_results)
+
+    def delete_documents(self, agent_id: str, topic_id: str):
+        self.ann_store.delete_documents(agent_id, topic_id)
+        self._index(agent_id).delete(topic_id)
+
+    def delete_documents_by_id(self, agent_id: str, doc_ids: list):
+        self.ann_store.delete_documents_by_id(agent_id, doc_ids)
+        self._index(agent_id).delete(doc_ids=set(doc_ids))
+
+    def delete_agent_documents(self, agent_id: str):
+        self.ann_store.delete_agent_documents(agent_id)
+        index = self._index(agent_id)
+        index.drop()
+        with self._lock:
+            self._indexes.pop(agent_id, None)
+
+    def get_documents(self, agent_id: str, topic_id: str):
+        return self.ann_store.get_documents(agent_id, topic_id)
+
+    def __getattr__(self, name):
+        # Anything not specialised here (collection, dimension, ...) comes from Chroma
+        if name == "ann_store":
+            raise AttributeError(name)
+        return getattr(self.ann_store, name)
+
@@ -0,0 +1,158 @@
+"""
+Re-embedding of an agent's knowledge into another embedding model.
+
+The job copies the agent's stored texts from its current collection (the
+source) into the target model's collection (the shadow copy), in batches,
+keeping each document's id. Progress is derived from which ids already exist
+in the target, so a job interrupted by a restart simply picks up the
+remaining documents. Jobs are claimed before running (services/jobs.py), so
+only one worker copies a given agent. While it runs, new documents are written to both
+collections and searches read from both (see main.search_knowledge); once
+every document is present in the target, the agent is switched over in a
+single transaction and its source vectors are removed. A failed job leaves
+the agent on its source model and removes the partial shadow copy.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+
+from database import SessionLocal
+from llm_service import OverloadedError
+from models import Agent, BackgroundJob
+from services.rate_limiter import TokenBucket
+from services.admission import llm_priority
+from services.jobs import claim_job, heartbeat, claimable_job_ids, JobTakenOver
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", 64))
+DOCS_PER_MINUTE = float(os.getenv("REEMBED_DOCS_PER_MINUTE", 600))
+
+
+def _throttle(bucket: TokenBucket, count: int):
+    for _ in range(count):
+        while True:
+            wait = bucket.try_acquire()
+            if not wait:
+                break
+            time.sleep(wait)
+
+
+def _scan(source, target, agent_id: str, state: dict) -> list:
+    """Ids still missing from the target; records total/done in state."""
+    source_ids = source.store.document_ids(agent_id)
+    done = set(target.store.document_ids(agent_id))
+    remaining = [doc_id for doc_id in source_ids if doc_id not in done]
+    state.update(total=len(source_ids), done=len(source_ids) - len(remaining))
+    return remaining
+
+
+def _drop_shadow(spaces, agent_id: str, target_spec: str):
+    """Removes the partial copy of a failed job from the target collection."""
+    if not target_spec:
+        return
+    try:
+        spaces.get(target_spec).store.delete_agent_documents(agent_id)
+    except Exception as e:
+        logger.error("Could not remove shadow vectors of agent %s: %s", agent_id, e)
+
+
+def run_reembed_job(job_id: str, spaces):
+    db = SessionLocal()
+    try:
+        if not claim_job(db, job_id):
+            logger.info("Re-embedding job %s is owned by another worker", job_id)
+            return
+        job = db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+        state = json.loads(job.detail)
+
+        source = spaces.get(state["source"])
+        target = spaces.get(state["target"])
+        agent_id = job.target_id
+        bucket = TokenBucket(rate=DOCS_PER_MINUTE / 60, capacity=BATCH_SIZE)
+
+        # The collections are listed once and the work list is kept in memory;
+        # documents added meanwhile are dual-written, so the closing re-scan
+        # normally finds nothing left
+        remaining = _scan(source, target, agent_id, state)
+        while remaining:
+            while remaining:
+                job.detail = json.dumps(state)
+                if not heartbeat(db, job_id):
+                    raise JobTakenOver()
+                db.commit()
+
+                batch = source.store.get_documents_by_id(remaining[:BATCH_SIZE])
+                _throttle(bucket, len(batch))
+                try:
+                    with llm_priority("bulk"):
+                        embeddings = target.embed([doc["text"] for doc in batch])
+                except OverloadedError as e:
+                    # Shed in favour of interactive traffic: back off and retry the batch
+                    time.sleep(e.retry_after)
+                    continue
+                target.store.add_documents([
+                    {**doc, "embedding": embedding} for doc, embedding in zip(batch, embeddings)
+                ])
+                del remaining[:BATCH_SIZE]
+                state["done"] += len(batch)
+            remaining = _scan(source, target, agent_id, state)
+
+        # Atomic switch: readers see either the old model or the new one
+        if not heartbeat(db, job_id):
+            raise JobTakenOver()
+        agent = db.query(Agent).filter(Agent.id == agent_id).first()
+        if agent:
+            agent.embedding_model = state["target"]
+            agent.embedding_target = None
+        job.status = "completed"
+        job.detail = json.dumps(state)
+        job.finished_at = datetime.utcnow().isoformat()
+        db.commit()
+
+        try:
+            source.store.delete_agent_documents(agent_id)
+        except Exception as e:
+            # The switch is committed; the old vectors are merely orphaned
+            logger.error("Could not remove source vectors of agent %s: %s", agent_id, e)
+        logger.info("Re-embedded agent", extra={"agent_id": agent_id, **state})
+    except JobTakenOver:
+        db.rollback()
+        logger.warning("Re-embedding job %s was taken over by another worker", job_id)
+    except Exception as e:
+        db.rollback()
+        logger.exception("Re-embedding job %s failed: %s", job_id, e)
+        job = db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+        if job:
+            state = json.loads(job.detail or "{}")
+            state["error"] = str(e)
+            job.status = "failed"
+            job.detail = json.dumps(state)
+            job.finished_at = datetime.utcnow().isoformat()
+            # Stop dual writes and dual reads: the agent stays on its source model
+            agent = db.query(Agent).filter(Agent.id == job.target_id).first()
+            if agent and agent.embedding_target == state.get("target"):
+                agent.embedding_target = None
+            db.commit()
+            _drop_shadow(spaces, job.target_id, state.get("target"))
+    finally:
+        db.close()
+
+
+def resume_reembed_jobs(spaces):
+    """
+    Restarts re-embedding jobs interrupted by a shutdown. Called on startup.
+    """
+    db = SessionLocal()
+    try:
+        job_ids = claimable_job_ids(db, "reembed_agent")
+    finally:
+        db.close()
+    # Every worker gets here; run_reembed_job claims each job before running it
+    for job_id in job_ids:
+        logger.info("Resuming re-embedding job %s", job_id)
+        threading.Thread(target=run_reembed_job, args=(job_id, spaces), daemon=True).start()
+    return job_ids
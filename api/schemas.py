@@ -15,7 +15,7 @@ class Agent(AgentBase):
     status: str
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class ChatRequest(BaseModel):
     agent_id: str
@@ -54,4 +54,85 @@ class SkillUpdate(BaseModel):
 
 class SkillResponse(SkillCreate):
     id: str
-    agent_id: str
\ No newline at end of file
+    agent_id: str
+
+
+# Response models: list endpoints load only these columns and FastAPI
+# serializes them straight to JSON without reflecting over ORM objects.
+
+class AgentResponse(BaseModel):
+    id: str
+    name: str
+    description: Optional[str] = None
+    status: Optional[str] = None
+    color: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class ConversationResponse(BaseModel):
+    id: str
+    title: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class ConversationPage(BaseModel):
+    items: List[ConversationResponse]
+    next_cursor: Optional[str] = None
+
+class MessageResponse(BaseModel):
+    id: str
+    conversation_id: Optional[str] = None
+    agent_id: Optional[str] = None
+    role: str
+    content: Optional[str] = None
+    timestamp: Optional[str] = None
+    rating: Optional[int] = 0
+
+class MessagePage(BaseModel):
+    items: List[MessageResponse]
+    next_cursor: Optional[str] = None
+
+class TopicResponse(BaseModel):
+    id: str
+    agent_id: str
+    name: Optional[str] = None
+    doc_count: Optional[int] = 0
+    status: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class TopicPage(BaseModel):
+    items: List[TopicResponse]
+    next_cursor: Optional[str] = None
+
+class KnowledgeGapResponse(BaseModel):
+    id: str
+    agent_id: str
+    question_text: Optional[str] = None
+    frequency: Optional[int] = 1
+    status: Optional[str] = None
+
+class KnowledgeGapPage(BaseModel):
+    items: List[KnowledgeGapResponse]
+    next_cursor: Optional[str] = None
+
+class MessageSearchHit(MessageResponse):
+    snippet: Optional[str] = None
+    score: float
+
+class MessageSearchPage(BaseModel):
+    items: List[MessageSearchHit]
+    next_cursor: Optional[str] = None
+
+class KnowledgeGapSearchHit(KnowledgeGapResponse):
+    snippet: Optional[str] = None
+    score: float
+
+class KnowledgeGapSearchPage(BaseModel):
+    items: List[KnowledgeGapSearchHit]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,156 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from services.metrics import LLM_ADMISSIONS, LLM_ADMISSION_WAIT_SECONDS
+
+# Highest priority first
+PRIORITY_CLASSES = ("interactive", "training", "bulk")
+
+# Per class: max in-flight upstream calls, max queued calls, queueing deadline (seconds).
+# Override with LLM_ADMISSION_LIMITS="bulk=2/32/120,training=4/16/60".
+DEFAULT_CLASS_LIMITS = {
+    "interactive": (16, 64, 30),
+    "training": (4, 16, 60),
+    "bulk": (2, 32, 120),
+}
+
+_priority = ContextVar("llm_priority", default="interactive")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a call is shed instead of queued."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def llm_priority(priority_class: str):
+    """
+    Runs the enclosed model calls in the given priority class.
+    """
+    if priority_class not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class: {priority_class}")
+    token = _priority.set(priority_class)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+class AdmissionController:
+    """
+    Schedules upstream model calls by priority class. A call is admitted when
+    its class is under its concurrency cap, the total is under the global cap
+    and no higher class is waiting for a slot it could use; within a class,
+    calls are served in arrival order. Calls are shed (AdmissionRejected)
+    when their class queue is full or the expected wait would exceed their
+    deadline, so overload turns into fast 503s instead of pile-ups.
+    """
+
+    def __init__(self, total_concurrency: int = None, limits: dict = None):
+        self.total_concurrency = total_concurrency or int(os.getenv("LLM_ADMISSION_TOTAL_CONCURRENCY", 16))
+        self.limits = dict(limits or _configured_limits())
+        self._cond = threading.Condition()
+        self._waiting = {name: deque() for name in PRIORITY_CLASSES}
+        self._in_flight = {name: 0 for name in PRIORITY_CLASSES}
+        self._service_seconds = {name: 1.0 for name in PRIORITY_CLASSES}  # EWMA of call duration
+        self._shed = {name: 0 for name in PRIORITY_CLASSES}
+
+    def _expected_wait(self, priority_class: str, position: int) -> float:
+        concurrency = self.limits[priority_class][0]
+        return math.ceil((position + 1) / concurrency) * self._service_seconds[priority_class]
+
+    def _can_admit(self, priority_class: str, ticket) -> bool:
+        if self._waiting[priority_class][0] is not ticket:
+            return False
+        if self._in_flight[priority_class] >= self.limits[priority_class][0]:
+            return False
+        if sum(self._in_flight.values()) >= self.total_concurrency:
+            return False
+        for higher in PRIORITY_CLASSES[:PRIORITY_CLASSES.index(priority_class)]:
+            if self._waiting[higher] and self._in_flight[higher] < self.limits[higher][0]:
+                return False
+        return True
+
+    def _reject(self, priority_class: str, reason: str, retry_after: float):
+        self._shed[priority_class] += 1
+        LLM_ADMISSIONS.inc(priority=priority_class, outcome=reason)
+        raise AdmissionRejected(
+            f"Overloaded: {priority_class} call shed ({reason})", retry_after=max(1, math.ceil(retry_after))
+        )
+
+    @contextmanager
+    def slot(self, priority_class: str = None, deadline: float = None):
+        priority_class = priority_class or current_priority()
+        max_queue, timeout = self.limits[priority_class][1], self.limits[priority_class][2]
+        start = time.monotonic()
+        deadline = min(deadline or math.inf, start + timeout)
+
+        with self._cond:
+            queue = self._waiting[priority_class]
+            expected = self._expected_wait(priority_class, len(queue))
+            if len(queue) >= max_queue:
+                self._reject(priority_class, "queue_full", expected)
+            if queue and start + expected > deadline:
+                self._reject(priority_class, "deadline", expected)
+
+            ticket = object()
+            queue.append(ticket)
+            try:
+                while not self._can_admit(priority_class, ticket):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject(priority_class, "deadline", self._expected_wait(priority_class, len(queue)))
+                    self._cond.wait(remaining)
+            finally:
+                queue.remove(ticket)
+                self._cond.notify_all()
+            self._in_flight[priority_class] += 1
+
+        admitted = time.monotonic()
+        LLM_ADMISSIONS.inc(priority=priority_class, outcome="admitted")
+        LLM_ADMISSION_WAIT_SECONDS.observe(admitted - start, priority=priority_class)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight[priority_class] -= 1
+                elapsed = time.monotonic() - admitted
+                self._service_seconds[priority_class] = 0.8 * self._service_seconds[priority_class] + 0.2 * elapsed
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                name: {
+                    "in_flight": self._in_flight[name],
+                    "queued": len(self._waiting[name]),
+                    "shed": self._shed[name],
+                    "concurrency": self.limits[name][0],
+                    "max_queue": self.limits[name][1],
+                    "timeout_seconds": self.limits[name][2],
+                    "avg_call_seconds": round(self._service_seconds[name], 3),
+                }
+                for name in PRIORITY_CLASSES
+            }
+
+
+def _configured_limits():
+    limits = dict(DEFAULT_CLASS_LIMITS)
+    for entry in os.getenv("LLM_ADMISSION_LIMITS", "").split(","):
+        if "=" in entry:
+            name, values = entry.split("=", 1)
+            concurrency, max_queue, timeout = values.split("/")
+            limits[name.strip()] = (int(concurrency), int(max_queue), float(timeout))
+    return limits
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from services.prompt_builder import count_tokens
+from services.admission import llm_priority
+
+logger = logging.getLogger(__name__)
+
+# Rejected prefixes remembered at most (oldest forgotten first)
+MAX_REJECTED = 1024
+
+
+class ContextCache:
+    """
+    Provider-side cached contents (the Gemini cachedContents API) for stable
+    prompt prefixes such as an agent's persona, instructions and tool
+    declarations. Each owner (e.g. an agent id) has at most one live entry;
+    when its prefix, tools or model change, a new entry is created and the
+    superseded one deleted. Entries are recreated shortly before they expire.
+    Prefixes below the provider's minimum cacheable size are never cached.
+    """
+
+    def __init__(self, service, ttl_seconds: int = None, min_tokens: int = None):
+        self.service = service
+        self.ttl_seconds = ttl_seconds or int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", 3600))
+        self.min_tokens = min_tokens if min_tokens is not None else int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", 2048))
+        # Stop using an entry this long before the provider expires it
+        self.refresh_margin = min(60, self.ttl_seconds / 10)
+        self._entries = {}  # owner -> {"fingerprint", "name", "expires_at"}
+        # fingerprint -> time the provider refused to cache it; retried after the TTL
+        self._rejected = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "created": 0, "rejected": 0, "invalidated": 0}
+
+    @staticmethod
+    def fingerprint(model: str, prefix: str, tools: list) -> str:
+        raw = json.dumps([model, prefix, tools], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, owner: str, model: str, prefix: str, tools: list = None):
+        """
+        Returns the cached content name to reference for this prefix,
+        creating it if needed, or None if the prefix should be sent inline.
+        """
+        if count_tokens(prefix) < self.min_tokens:
+            return None
+
+        fingerprint = self.fingerprint(model, prefix, tools)
+        with self._lock:
+            entry = self._entries.get(owner)
+            if entry and entry["fingerprint"] == fingerprint and entry["expires_at"] - self.refresh_margin > time.time():
+                self._stats["hits"] += 1
+                return entry["name"]
+            rejected_at = self._rejected.get(fingerprint)
+            if rejected_at is not None:
+                if time.time() - rejected_at < self.ttl_seconds:
+                    return None
+                del self._rejected[fingerprint]
+
+        payload = {
+            "model": f"models/{model}",
+            "displayName": f"kb-{owner}",
+            "systemInstruction": {"parts": [{"text": prefix}]},
+            "ttl": f"{self.ttl_seconds}s",
+        }
+        if tools:
+            payload["tools"] = tools
+
+        from llm_service import LLMServiceError, RateLimitedError, OverloadedError
+        try:
+            data = self.service._post(model, "cachedContents.create", payload, url=f"{self.service.api_root}/cachedContents")
+        except (RateLimitedError, OverloadedError):
+            return None
+        except LLMServiceError as e:
+            # Typically the prefix is below the model's minimum; don't retry it every turn
+            logger.warning("Context cache creation rejected: %s", e)
+            with self._lock:
+                self._rejected[fingerprint] = time.time()
+                self._rejected.move_to_end(fingerprint)
+                while len(self._rejected) > MAX_REJECTED:
+                    self._rejected.popitem(last=False)
+                self._stats["rejected"] += 1
+            return None
+
+        name = data.get("name")
+        if not name:
+            return None
+        with self._lock:
+            previous = self._entries.get(owner)
+            self._entries[owner] = {
+                "fingerprint": fingerprint, "name": name, "model": model, "expires_at": time.time() + self.ttl_seconds
+            }
+            self._stats["created"] += 1
+        if previous and previous["name"] != name:
+            self._delete(previous)
+        logger.info("Created context cache", extra={"owner": owner, "model": model, "cache": name})
+        return name
+
+    def invalidate(self, owner: str):
+        """
+        Drops the owner's entry (e.g. after its knowledge changed or the
+        provider no longer recognises it).
+        """
+        with self._lock:
+            entry = self._entries.pop(owner, None)
+            if entry:
+                self._stats["invalidated"] += 1
+        if entry:
+            self._delete(entry)
+
+    def _delete(self, entry: dict):
+        # Off the request path, through the model's rate limiter at bulk priority
+        threading.Thread(target=self._delete_entry, args=(entry,), daemon=True).start()
+
+    def _delete_entry(self, entry: dict):
+        from llm_service import LLMServiceError
+
+        try:
+            with llm_priority("bulk"):
+                self.service._post(
+                    entry["model"], "cachedContents.delete", None,
+                    url=f"{self.service.api_root}/{entry['name']}", http_method="delete"
+                )
+        except LLMServiceError as e:
+            # The entry expires on its own after the TTL
+            logger.warning("Could not delete context cache %s: %s", entry["name"], e)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "rejected_prefixes": len(self._rejected), **self._stats}
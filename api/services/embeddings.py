@@ -0,0 +1,195 @@
+import os
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingProvider:
+    """
+    Interface for embedding backends. `name`/`model` identify the vector
+    space (vectors from different providers must never share a collection)
+    and `dimension` is the length of every returned vector.
+    """
+    name = "base"
+    model = None
+    dimension = None
+
+    def embed(self, texts: list) -> list:
+        raise NotImplementedError
+
+    def embed_one(self, text: str) -> list:
+        return self.embed([text])[0]
+
+    def info(self) -> dict:
+        return {"provider": self.name, "model": self.model, "dimension": self.dimension, "spec": self.spec}
+
+    @property
+    def spec(self) -> str:
+        """
+        "provider:model" string identifying the vector space, stored on each
+        vector and on agents (see create_embedding_provider).
+        """
+        return f"{self.name}:{self.model}"
+
+    @property
+    def collection_suffix(self) -> str:
+        return re.sub(r"[^a-zA-Z0-9]+", "-", f"{self.name}-{self.model}").strip("-").lower()
+
+
+class GoogleEmbeddingProvider(EmbeddingProvider):
+    """
+    Remote text-embedding-004 via the Gemini API, sharing the service's
+    rate limiter and retry policy. With output_dimensionality, the model
+    returns truncated vectors (re-normalized here), which is a separate
+    vector space with its own spec ("google:<model>@<dimensions>").
+    """
+    name = "google"
+
+    def __init__(self, service, model: str = "text-embedding-004", dimension: int = 768, batch_size: int = 100,
+                 output_dimensionality: int = None):
+        self.service = service
+        self.model = model
+        self.output_dimensionality = output_dimensionality if output_dimensionality and output_dimensionality < dimension else None
+        self.dimension = self.output_dimensionality or dimension
+        self.batch_size = batch_size
+
+    @property
+    def spec(self) -> str:
+        if self.output_dimensionality:
+            return f"{self.name}:{self.model}@{self.output_dimensionality}"
+        return super().spec
+
+    @property
+    def collection_suffix(self) -> str:
+        if self.output_dimensionality:
+            return f"{super().collection_suffix}-{self.output_dimensionality}d"
+        return super().collection_suffix
+
+    def _request(self, text: str) -> dict:
+        request = {"model": f"models/{self.model}", "content": {"parts": [{"text": text}]}}
+        if self.output_dimensionality:
+            request["outputDimensionality"] = self.output_dimensionality
+        return request
+
+    def _normalize(self, vector: list) -> list:
+        if not self.output_dimensionality:
+            return vector
+        # Truncated vectors are not unit length; search assumes comparable norms
+        norm = sum(v * v for v in vector) ** 0.5
+        return [v / norm for v in vector] if norm else vector
+
+    def embed(self, texts: list) -> list:
+        from llm_service import LLMServiceError
+
+        if not self.service.api_key:
+            # Never index placeholder vectors; surfaces as 503 like other upstream failures
+            raise LLMServiceError("GOOGLE_API_KEY not set")
+
+        if len(texts) == 1:
+            data = self.service._post(self.model, "embedContent", self._request(texts[0]))
+            try:
+                return [self._normalize(data["embedding"]["values"])]
+            except (KeyError, TypeError):
+                raise LLMServiceError("Embedding response did not contain values")
+
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i:i + self.batch_size]
+            payload = {"requests": [self._request(text) for text in batch]}
+            data = self.service._post(self.model, "batchEmbedContents", payload)
+            try:
+                vectors.extend(self._normalize(item["values"]) for item in data["embeddings"])
+            except (KeyError, TypeError):
+                raise LLMServiceError("Batch embedding response did not contain values")
+        return vectors
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    CPU embeddings with a sentence-transformers model (optionally through its
+    ONNX backend). The model is loaded on first use; large inputs are split
+    into batches encoded on a small thread pool (inference releases the GIL).
+    """
+    name = "local"
+
+    def __init__(self, model: str = None, backend: str = None, batch_size: int = None, threads: int = None):
+        self.model = model or os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+        self.backend = backend or os.getenv("LOCAL_EMBEDDING_BACKEND", "torch")  # torch or onnx
+        self.batch_size = batch_size or int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", 32))
+        self.threads = threads or int(os.getenv("LOCAL_EMBEDDING_THREADS", 2))
+        self._encoder = None
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="embed")
+
+    def _load(self):
+        with self._lock:
+            if self._encoder is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError:
+                    raise RuntimeError(
+                        "EMBEDDING_PROVIDER=local requires the sentence-transformers package "
+                        "(pip install sentence-transformers, plus optimum[onnxruntime] for the onnx backend)"
+                    )
+                kwargs = {"device": "cpu"}
+                if self.backend != "torch":
+                    kwargs["backend"] = self.backend
+                self._encoder = SentenceTransformer(self.model, **kwargs)
+                logger.info("Loaded local embedding model", extra={"model": self.model, "backend": self.backend})
+        return self._encoder
+
+    @property
+    def dimension(self):
+        return self._load().get_sentence_embedding_dimension()
+
+    def _encode(self, batch: list) -> list:
+        vectors = self._load().encode(batch, batch_size=self.batch_size, normalize_embeddings=True)
+        return vectors.tolist()
+
+    def embed(self, texts: list) -> list:
+        if len(texts) <= self.batch_size:
+            return self._encode(texts)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        vectors = []
+        for result in self._pool.map(self._encode, batches):
+            vectors.extend(result)
+        return vectors
+
+
+def legacy_embedding_spec() -> str:
+    """
+    Vector space of agents created before each agent's embedding model was
+    recorded: google:text-embedding-004 at full dimensionality (whatever
+    EMBEDDING_DIMENSIONS now says), or the local model if EMBEDDING_PROVIDER
+    selects the local provider.
+    """
+    provider, _, model = os.getenv("EMBEDDING_PROVIDER", "google").partition(":")
+    if provider.lower() == "local":
+        return f"local:{model or os.getenv('LOCAL_EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')}"
+    return "google:text-embedding-004"
+
+
+def create_embedding_provider(service, spec: str = None) -> EmbeddingProvider:
+    """
+    Builds the provider selected by EMBEDDING_PROVIDER (google or local) and
+    EMBEDDING_DIMENSIONS, or by an explicit "provider:model" spec such as
+    "local:sentence-transformers/all-MiniLM-L6-v2" or
+    "google:text-embedding-004@256" (reduced output dimensionality).
+    """
+    provider, _, model = (spec or os.getenv("EMBEDDING_PROVIDER", "google")).partition(":")
+    model, _, dimensions = model.partition("@")
+    if not spec:
+        dimensions = os.getenv("EMBEDDING_DIMENSIONS", "")
+    provider = provider.lower()
+    if provider == "local":
+        if dimensions:
+            raise ValueError("Reduced embedding dimensions are only supported by the google provider")
+        return LocalEmbeddingProvider(model=model or None)
+    if provider != "google":
+        raise ValueError(f"Unknown embedding provider: {provider}")
+    return GoogleEmbeddingProvider(
+        service, model=model or "text-embedding-004", output_dimensionality=int(dimensions) if dimensions else None
+    )
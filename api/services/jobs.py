@@ -0,0 +1,89 @@
+"""
+Ownership of background jobs across API workers.
+
+Every worker runs the startup resume, so a job is only run after it has been
+claimed with a conditional UPDATE: the job must be pending, or running with a
+lease (heartbeat) that has expired because its owner died. A worker keeps its
+lease by heartbeating while it works and gives the job up as soon as a
+heartbeat finds another owner.
+"""
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, and_
+
+from models import BackgroundJob
+
+# Identifies this process as a job owner
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# A running job whose owner has not heartbeated for this long can be taken over
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))
+
+
+def _claimable(now: datetime):
+    stale = (now - timedelta(seconds=LEASE_SECONDS)).isoformat()
+    return or_(
+        BackgroundJob.status == "pending",
+        and_(
+            BackgroundJob.status == "running",
+            or_(BackgroundJob.heartbeat_at.is_(None), BackgroundJob.heartbeat_at < stale)
+        )
+    )
+
+
+def claim_job(db, job_id: str) -> bool:
+    """
+    Atomically takes ownership of a pending job, or of a running job whose
+    lease has expired, and marks it running. Commits. Returns False when
+    another worker owns the job or it has finished.
+    """
+    now = datetime.utcnow()
+    claimed = db.query(BackgroundJob).filter(
+        BackgroundJob.id == job_id, _claimable(now)
+    ).update({
+        BackgroundJob.status: "running",
+        BackgroundJob.owner: WORKER_ID,
+        BackgroundJob.heartbeat_at: now.isoformat(),
+    }, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def heartbeat(db, job_id: str) -> bool:
+    """
+    Renews this worker's lease on a job (the caller commits). Returns False
+    when the job has been taken over, in which case the caller must stop.
+    """
+    renewed = db.query(BackgroundJob).filter(
+        BackgroundJob.id == job_id,
+        BackgroundJob.owner == WORKER_ID,
+        BackgroundJob.status == "running"
+    ).update({BackgroundJob.heartbeat_at: datetime.utcnow().isoformat()}, synchronize_session=False)
+    return renewed == 1
+
+
+def is_stale(job) -> bool:
+    """
+    True when an unfinished job has no live owner: it was never started
+    within a lease period, or its owner stopped heartbeating.
+    """
+    stale = (datetime.utcnow() - timedelta(seconds=LEASE_SECONDS)).isoformat()
+    if job.status == "pending":
+        return (job.created_at or "") < stale
+    if job.status == "running":
+        return job.heartbeat_at is None or job.heartbeat_at < stale
+    return False
+
+
+def claimable_job_ids(db, kind: str) -> list:
+    """Jobs of one kind that are pending or whose owner's lease has expired."""
+    return [job_id for (job_id,) in db.query(BackgroundJob.id).filter(
+        BackgroundJob.kind == kind, _claimable(datetime.utcnow())
+    )]
+
+
+class JobTakenOver(Exception):
+    """The job's lease was lost to another worker."""
@@ -0,0 +1,109 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+
+
+class LLMCache:
+    """
+    Persistent generation cache keyed by a hash of (model, namespace, prompt).
+    Stored in its own SQLite file so it survives restarts and can be wiped
+    independently of the main database.
+    """
+
+    def __init__(self, path: str = None, ttl_seconds: int = None, max_entries: int = None):
+        self.path = path or os.getenv("LLM_CACHE_PATH", "./llm_cache.db")
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("LLM_CACHE_MAX_ENTRIES", 10000))
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "expired": 0}
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS generations (
+                key TEXT PRIMARY KEY,
+                namespace TEXT,
+                value TEXT,
+                created_at REAL,
+                last_access REAL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_generations_last_access ON generations (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, namespace: str, prompt: str) -> str:
+        raw = json.dumps([model, namespace, prompt], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns the cached value, or None on a miss or an expired entry.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM generations WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                self._stats["misses"] += 1
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM generations WHERE key = ?", (key,))
+                self._conn.commit()
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE generations SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key: str, namespace: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generations (key, namespace, value, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, namespace, value, now, now)
+            )
+            self._stats["writes"] += 1
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Least-recently-used eviction once the table grows past max_entries
+        if not self.max_entries:
+            return
+        count = self._conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM generations WHERE key IN (SELECT key FROM generations ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            )
+            self._stats["evictions"] += overflow
+
+    def clear(self, namespace: str = None):
+        with self._lock:
+            if namespace:
+                self._conn.execute("DELETE FROM generations WHERE namespace = ?", (namespace,))
+            else:
+                self._conn.execute("DELETE FROM generations")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,195 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            series = self._series.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', bound))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+
+CHAT_STAGE_SECONDS = Histogram(
+    "kb_chat_stage_seconds", "Time spent in each /chat pipeline stage", ["stage"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "kb_http_request_seconds", "HTTP request latency by route", ["method", "route", "status"]
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "kb_llm_request_seconds", "Latency of upstream model calls including retries", ["model", "method"]
+)
+LLM_REQUESTS = Counter(
+    "kb_llm_requests_total", "Upstream model calls by outcome", ["model", "method", "outcome"]
+)
+LLM_RETRIES = Counter(
+    "kb_llm_retries_total", "Retries of upstream model calls after 429/5xx", ["model", "status"]
+)
+LLM_TOKENS = Counter(
+    "kb_llm_tokens_total", "Tokens reported by the model usage metadata", ["model", "kind"]
+)
+LLM_CACHE_LOOKUPS = Counter(
+    "kb_llm_cache_lookups_total", "Generation cache lookups", ["task", "result"]
+)
+LLM_COALESCED = Counter(
+    "kb_llm_coalesced_total", "Calls served by an identical in-flight upstream call", ["model", "method"]
+)
+LLM_ADMISSIONS = Counter(
+    "kb_llm_admissions_total", "Admission decisions for upstream model calls", ["priority", "outcome"]
+)
+LLM_ADMISSION_WAIT_SECONDS = Histogram(
+    "kb_llm_admission_wait_seconds", "Time model calls spent queued for admission", ["priority"]
+)
+
+REGISTRY = [
+    CHAT_STAGE_SECONDS,
+    HTTP_REQUEST_SECONDS,
+    LLM_REQUEST_SECONDS,
+    LLM_REQUESTS,
+    LLM_RETRIES,
+    LLM_TOKENS,
+    LLM_CACHE_LOOKUPS,
+    LLM_COALESCED,
+    LLM_ADMISSIONS,
+    LLM_ADMISSION_WAIT_SECONDS,
+]
+
+
+def render_metrics() -> str:
+    """
+    Renders every registered metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# OpenTelemetry is optional: spans are only emitted when OTEL_ENABLED=true and
+# opentelemetry-sdk plus an OTLP exporter are installed. Unless the host process
+# already installed a tracer provider (e.g. opentelemetry-instrument), one is
+# set up here that batches spans to the OTLP exporter, which is configured by
+# the standard OTEL_* variables (OTEL_EXPORTER_OTLP_ENDPOINT, OTEL_SERVICE_NAME...).
+def _init_tracer():
+    try:
+        from opentelemetry import trace as otel_trace
+    except ImportError:
+        logger.warning("OTEL_ENABLED is set but opentelemetry-api is not installed; tracing disabled")
+        return None
+
+    if isinstance(otel_trace.get_tracer_provider(), otel_trace.ProxyTracerProvider):
+        protocol = os.getenv("OTEL_EXPORTER_OTLP_TRACES_PROTOCOL") or os.getenv("OTEL_EXPORTER_OTLP_PROTOCOL", "http/protobuf")
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            if protocol == "grpc":
+                from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+            else:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError as e:
+            logger.warning("Tracing disabled: %s (install opentelemetry-sdk and opentelemetry-exporter-otlp)", e)
+            return None
+        resource = Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "knowledge-buddy-api")})
+        provider = TracerProvider(resource=resource)
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        otel_trace.set_tracer_provider(provider)
+    return otel_trace.get_tracer("knowledge_buddy")
+
+
+_tracer = _init_tracer() if os.getenv("OTEL_ENABLED", "false").lower() == "true" else None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Opens an OpenTelemetry span when tracing is enabled; otherwise a no-op.
+    """
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name) as current:
+        for key, value in attributes.items():
+            current.set_attribute(key, value)
+        yield current
+
+
+@contextmanager
+def chat_stage(stage: str):
+    """
+    Times one /chat stage into CHAT_STAGE_SECONDS and wraps it in a span.
+    """
+    start = time.perf_counter()
+    with span(f"chat.{stage}"):
+        try:
+            yield
+        finally:
+            CHAT_STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
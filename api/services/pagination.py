@@ -0,0 +1,80 @@
+import json
+import base64
+from sqlalchemy import and_, or_, false
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> list:
+    """
+    Decodes an opaque cursor. Raises ValueError on malformed input.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _equal(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+def _beyond(column, value, descending: bool):
+    # NULLs sort first ascending and last descending (see paginate's ordering)
+    if value is None:
+        return false() if descending else column.isnot(None)
+    if descending:
+        return or_(column < value, column.is_(None))
+    return column > value
+
+
+def keyset_after(columns: list, values: list, descending: bool = False):
+    """
+    Builds the WHERE clause selecting rows strictly after `values` in the
+    ordering given by `columns` (all ascending or all descending), with NULLs
+    first when ascending and last when descending. NULL sort keys are
+    compared with IS NULL rather than =/<, which never match them.
+    Expanded as (a > x) OR (a = x AND b > y) ... so it works on any backend.
+    """
+    if len(columns) != len(values):
+        raise ValueError("Invalid cursor")
+    clauses = []
+    for i, column in enumerate(columns):
+        equal_prefix = [_equal(columns[j], values[j]) for j in range(i)]
+        clauses.append(and_(*equal_prefix, _beyond(column, values[i], descending)))
+    return or_(*clauses)
+
+
+def paginate(query, columns: list, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE, descending: bool = False):
+    """
+    Applies keyset pagination to a query ordered on `columns`, whose last
+    column must be unique (e.g. the primary key) so the ordering is stable.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    limit = clamp_limit(limit)
+    if cursor:
+        query = query.filter(keyset_after(columns, decode_cursor(cursor), descending))
+
+    # Explicit NULL placement (SQLite's default) so keyset_after matches on any backend
+    order = [c.desc().nulls_last() if descending else c.asc().nulls_first() for c in columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, c.key) for c in columns])
+    return rows, next_cursor
@@ -0,0 +1,187 @@
+import os
+import math
+
+# Rough characters-per-token ratio for Gemini models on English text.
+CHARS_PER_TOKEN = 4
+
+# Stable per-agent part of the chat prompt. It can be cached provider-side
+# (see services/context_cache.py), so nothing turn-specific goes in here.
+CHAT_PREFIX_TEMPLATE = """{system_prompt}
+
+### INSTRUCTIONS:
+1. **BE CONCISE.** Start with a high-level summary (2-3 sentences max).
+2. Do NOT dump all the details immediately.
+3. Only provide deep technical details if the user specifically asks for "details", "more info", or "full explanation".
+4. Use the provided Knowledge Base to answer.
+5. Use the Conversation History to understand follow-up questions (e.g., if user says "Tell me more about that").
+6. **CRITICAL**: If you cannot find the answer in the Knowledge Base below, you MUST respond with EXACTLY this phrase: "I don't have that information in my knowledge base." Do NOT guess or make up information.
+{knowledge_pack}"""
+
+KNOWLEDGE_PACK_TEMPLATE = """
+### KNOWLEDGE BASE (Core Reference Material):
+{documents}
+"""
+
+CHAT_TURN_TEMPLATE = """
+### KNOWLEDGE BASE (Reference Material):
+{context_text}
+
+### CONVERSATION HISTORY (Context):
+{history_text}
+
+### CURRENT USER MESSAGE:
+USER: {message}
+CONTEXT FROM UPLOADED FILE:
+{file_context}
+
+YOUR RESPONSE:"""
+
+CHAT_PROMPT_TEMPLATE = CHAT_PREFIX_TEMPLATE + CHAT_TURN_TEMPLATE
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimates the token count of a string without calling the API.
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Trims text to roughly max_tokens, marking the cut.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    return text[:max_tokens * CHARS_PER_TOKEN].rstrip() + "\n[...truncated]"
+
+
+def format_message(msg) -> str:
+    return f"{msg.role.upper()}: {msg.content}"
+
+
+class PromptBuilder:
+    """
+    Assembles the chat prompt within a fixed token budget shared between
+    retrieved knowledge, conversation history and uploaded file context.
+    """
+
+    def __init__(self, total_budget: int = None):
+        self.total_budget = total_budget or int(os.getenv("PROMPT_TOKEN_BUDGET", 8000))
+        self.shares = {
+            "knowledge": float(os.getenv("PROMPT_KNOWLEDGE_SHARE", 0.5)),
+            "history": float(os.getenv("PROMPT_HISTORY_SHARE", 0.3)),
+            "file": float(os.getenv("PROMPT_FILE_SHARE", 0.2)),
+        }
+
+    def allocate(self, needs: dict, budget: int) -> dict:
+        """
+        Splits budget across sections by share. Sections that need less than
+        their share hand the remainder to the sections that need more.
+        """
+        allocation = {name: 0 for name in needs}
+        remaining = budget
+        pending = {name: need for name, need in needs.items() if need > 0}
+
+        while pending and remaining > 0:
+            total_share = sum(self.shares[name] for name in pending)
+            round_budget = remaining
+            satisfied = []
+            for name, need in pending.items():
+                grant = int(round_budget * self.shares[name] / total_share)
+                take = min(grant, need - allocation[name])
+                allocation[name] += take
+                remaining -= take
+                if allocation[name] >= need:
+                    satisfied.append(name)
+            if not satisfied:
+                break
+            for name in satisfied:
+                pending.pop(name)
+
+        return allocation
+
+    def split_history(self, messages: list, max_tokens: int):
+        """
+        Keeps the newest messages that fit in max_tokens.
+        Returns (kept, overflow) in chronological order; overflow holds the
+        older messages that should be folded into the conversation summary.
+        """
+        kept = []
+        used = 0
+        for msg in reversed(messages):
+            cost = count_tokens(format_message(msg))
+            if used + cost > max_tokens:
+                break
+            kept.append(msg)
+            used += cost
+        kept.reverse()
+        overflow = messages[:len(messages) - len(kept)]
+        return kept, overflow
+
+    def history_budget(self, knowledge_docs: list, history_messages: list, summary: str, file_context: str, message: str, system_prompt: str) -> int:
+        """
+        Returns the token budget available for raw history messages.
+        """
+        allocation = self._allocate_sections(knowledge_docs, history_messages, summary, file_context, message, system_prompt)
+        return max(allocation["history"] - count_tokens(summary), 0)
+
+    def _allocate_sections(self, knowledge_docs, history_messages, summary, file_context, message, system_prompt):
+        # The knowledge pack, if any, is outside the budget: it is bounded by its own limit
+        fixed = count_tokens(CHAT_PROMPT_TEMPLATE) + count_tokens(system_prompt) + count_tokens(message)
+        budget = max(self.total_budget - fixed, 0)
+        needs = {
+            "knowledge": sum(count_tokens(doc) for doc in knowledge_docs),
+            "history": count_tokens(summary) + sum(count_tokens(format_message(m)) for m in history_messages),
+            "file": count_tokens(file_context),
+        }
+        return self.allocate(needs, budget)
+
+    def build_chat_prefix(self, system_prompt: str, knowledge_pack: list = None) -> str:
+        """
+        Persona, instructions and the optional always-on knowledge pack.
+        """
+        pack = KNOWLEDGE_PACK_TEMPLATE.format(documents="\n\n".join(knowledge_pack)) if knowledge_pack else ""
+        return CHAT_PREFIX_TEMPLATE.format(system_prompt=system_prompt, knowledge_pack=pack)
+
+    def build_chat_prompt(self, system_prompt: str, knowledge_docs: list, summary: str, history_messages: list, message: str, file_context: str = None) -> str:
+        return self.build_chat_prefix(system_prompt) + self.build_chat_turn(
+            system_prompt, knowledge_docs, summary, history_messages, message, file_context
+        )
+
+    def build_chat_turn(self, system_prompt: str, knowledge_docs: list, summary: str, history_messages: list, message: str, file_context: str = None) -> str:
+        """
+        The turn-specific part of the prompt, following build_chat_prefix.
+        """
+        allocation = self._allocate_sections(knowledge_docs, history_messages, summary, file_context, message, system_prompt)
+
+        # Knowledge: most relevant documents first, last one trimmed to fit
+        docs = []
+        remaining = allocation["knowledge"]
+        for doc in knowledge_docs:
+            if remaining <= 0:
+                break
+            trimmed = truncate_to_tokens(doc, remaining)
+            docs.append(trimmed)
+            remaining -= count_tokens(trimmed)
+        context_text = "\n\n".join(docs) if docs else "No specific knowledge found."
+
+        # History: rolling summary of older turns followed by the recent raw messages
+        history_parts = []
+        if summary:
+            history_parts.append(f"SUMMARY OF EARLIER CONVERSATION: {summary}")
+        kept, _ = self.split_history(history_messages, max(allocation["history"] - count_tokens(summary), 0))
+        history_parts.extend(format_message(msg) for msg in kept)
+        history_text = "\n".join(history_parts)
+
+        file_text = truncate_to_tokens(file_context, allocation["file"]) if file_context else "None"
+
+        return CHAT_TURN_TEMPLATE.format(
+            context_text=context_text,
+            history_text=history_text,
+            message=message,
+            file_context=file_text,
+        )
@@ -0,0 +1,236 @@
+import os
+import time
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+# Requests per minute allowed per model unless overridden by LLM_RATE_LIMITS
+DEFAULT_RATE_LIMITS = {
+    "gemini-2.5-pro": 60,
+    "gemini-2.5-flash": 300,
+    "text-embedding-004": 1500,
+}
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a call cannot be admitted before its deadline."""
+
+
+class TokenBucket:
+    """
+    In-process token bucket refilled continuously at `rate` tokens per second.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """
+        Takes a token if available. Returns 0 on success, otherwise the number
+        of seconds until the next token is due.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class SQLiteTokenBucket:
+    """
+    Token bucket whose state lives in a SQLite file, so every uvicorn worker
+    on the host draws from the same budget.
+    """
+
+    def __init__(self, key: str, rate: float, capacity: float, path: str):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated_at REAL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                (key, capacity, time.time())
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def try_acquire(self) -> float:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            tokens, updated_at = conn.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE key = ?", (self.key,)
+            ).fetchone()
+            now = time.time()
+            tokens = min(self.capacity, tokens + max(now - updated_at, 0) * self.rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            conn.execute(
+                "UPDATE buckets SET tokens = ?, updated_at = ? WHERE key = ?", (tokens, now, self.key)
+            )
+            conn.execute("COMMIT")
+            return wait
+        finally:
+            conn.close()
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit: grows by roughly one slot per window of successful
+    calls and halves whenever the upstream throttles us.
+    """
+
+    def __init__(self, initial: int, maximum: int):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, deadline: float):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RateLimitTimeout("Timed out waiting for a concurrency slot")
+                self._cond.wait(remaining)
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        with self._cond:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self):
+        with self._cond:
+            self.limit = max(1.0, self.limit / 2)
+
+
+class ModelRateLimiter:
+    """
+    Admission for one model: a token bucket for request rate plus an
+    adaptive concurrency limit. Callers queue until both admit them or
+    their deadline passes.
+    """
+
+    def __init__(self, model: str, requests_per_minute: float, max_concurrency: int, backend: str = "memory", path: str = None):
+        self.model = model
+        rate = requests_per_minute / 60.0
+        capacity = max(1.0, rate * 5)  # allow short bursts of ~5 seconds worth
+        if backend == "sqlite":
+            self.bucket = SQLiteTokenBucket(model, rate, capacity, path)
+        else:
+            self.bucket = TokenBucket(rate, capacity)
+        self.concurrency = AdaptiveConcurrency(initial=max(1, max_concurrency // 2), maximum=max_concurrency)
+        self.throttled = 0
+
+    @contextmanager
+    def slot(self, deadline: float):
+        self.concurrency.acquire(deadline)
+        try:
+            while True:
+                wait = self.bucket.try_acquire()
+                if wait == 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    raise RateLimitTimeout(f"Rate limit for {self.model} exceeded the queue deadline")
+                time.sleep(wait)
+            yield
+        finally:
+            self.concurrency.release()
+
+    def on_success(self):
+        self.concurrency.on_success()
+
+    def on_throttle(self):
+        self.throttled += 1
+        self.concurrency.on_throttle()
+
+    def stats(self):
+        return {
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "throttled": self.throttled,
+        }
+
+
+def parse_retry_after(value: str):
+    """
+    Parses a Retry-After header given either as seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: float = None, base: float = 1.0, cap: float = 30.0) -> float:
+    """
+    Full-jitter exponential backoff. A server-provided Retry-After wins, with
+    a little jitter so waiting callers don't all retry at the same instant.
+    """
+    if retry_after is not None:
+        return retry_after + random.uniform(0, base)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _configured_limits():
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for entry in os.getenv("LLM_RATE_LIMITS", "").split(","):
+        if "=" in entry:
+            model, rpm = entry.split("=", 1)
+            limits[model.strip()] = float(rpm)
+    return limits
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(model: str) -> ModelRateLimiter:
+    """
+    Returns the process-wide limiter for a model, creating it on first use.
+    """
+    with _limiters_lock:
+        if model not in _limiters:
+            limits = _configured_limits()
+            _limiters[model] = ModelRateLimiter(
+                model,
+                requests_per_minute=limits.get(model, 60),
+                max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", 8)),
+                backend=os.getenv("LLM_RATE_LIMIT_BACKEND", "memory"),
+                path=os.getenv("LLM_RATE_LIMIT_PATH", "./rate_limits.db"),
+            )
+        return _limiters[model]
+
+
+def limiter_stats():
+    with _limiters_lock:
+        return {model: limiter.stats() for model, limiter in _limiters.items()}
@@ -0,0 +1,74 @@
+import re
+import html
+from sqlalchemy import text
+
+from services.pagination import clamp_limit, encode_cursor, decode_cursor
+
+# Source columns returned with each hit, per indexed table (see database.FTS_INDEXES)
+RESULT_COLUMNS = {
+    "chat_messages": ["id", "conversation_id", "agent_id", "role", "content", "timestamp", "rating"],
+    "knowledge_gaps": ["id", "agent_id", "question_text", "frequency", "status"],
+}
+
+
+# Highlight markers that cannot occur in escaped text; swapped for <mark> tags
+# once the snippet has been HTML-escaped
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+
+def fts_query(query: str) -> str:
+    """
+    Turns free text into an FTS5 query: every word must match, the last one
+    as a prefix. Words are quoted so user input is never parsed as FTS syntax.
+    """
+    terms = [f'"{term}"' for term in re.findall(r"\w+", query)]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(db, table: str, query: str, filters: dict = None, limit: int = None, cursor: str = None):
+    """
+    Ranked full-text search over one indexed table, best match (BM25) first.
+    `filters` are equality conditions on the source columns; None values are
+    ignored. Returns (hits, next_cursor); each hit has the result columns
+    plus a `snippet` (HTML-escaped text with matches in <mark> tags) and a
+    `score` (higher is better).
+    Raises ValueError on a malformed cursor.
+    """
+    limit = clamp_limit(limit)
+    offset = 0
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 1 or not isinstance(values[0], int) or values[0] < 0:
+            raise ValueError("Invalid cursor")
+        offset = values[0]
+
+    match = fts_query(query)
+    if not match:
+        return [], None
+
+    fts = f"{table}_fts"
+    params = {"match": match, "limit": limit + 1, "offset": offset, "mark_start": _MARK_START, "mark_end": _MARK_END}
+    conditions = [f"{fts} MATCH :match"]
+    for column, value in (filters or {}).items():
+        if value is not None:
+            conditions.append(f"src.{column} = :{column}")
+            params[column] = value
+    columns = ", ".join(f"src.{column}" for column in RESULT_COLUMNS[table])
+    rows = db.execute(text(
+        f"SELECT {columns}, snippet({fts}, 0, :mark_start, :mark_end, '…', 24) AS snippet, "
+        f"bm25({fts}) AS rank "
+        f"FROM {fts} JOIN {table} AS src ON src.id = {fts}.id "
+        f"WHERE {' AND '.join(conditions)} "
+        f"ORDER BY rank LIMIT :limit OFFSET :offset"
+    ), params).mappings().all()
+
+    next_cursor = encode_cursor([offset + limit]) if len(rows) > limit else None
+    hits = []
+    for row in rows[:limit]:
+        hit = {column: row[column] for column in RESULT_COLUMNS[table]}
+        hit["snippet"] = html.escape(row["snippet"] or "").replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+        hit["score"] = round(-row["rank"], 4)  # bm25() is lower-is-better
+        hits.append(hit)
+    return hits, next_cursor
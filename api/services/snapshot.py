@@ -0,0 +1,97 @@
+import sys
+import json
+import zlib
+import struct
+from array import array
+
+# Layout: header | zlib(JSON manifest) | count x dim float32 (little-endian)
+MAGIC = b"KBSNAP"
+VERSION = 2
+PREFIX = struct.Struct("<6sH")  # magic, version
+# magic, version, dimension, document count, manifest bytes, CRC32 of everything after the header
+HEADER = struct.Struct("<6sHIIII")
+HEADER_V1 = struct.Struct("<6sHIII")  # version 1 had no checksum
+MANIFEST_FIELDS = {"embedding": dict, "agent": dict, "topics": list, "skills": list, "documents": list}
+
+
+def encode_snapshot(agent: dict, topics: list, skills: list, documents: list, embedding_info: dict) -> bytes:
+    """
+    Packs an agent's knowledge into a compact binary snapshot. `documents` are
+    vector store items ({topic_id, text, raw_text, embedding}); text goes into
+    the compressed manifest and embeddings into one packed float array.
+    """
+    dimension = len(documents[0]["embedding"]) if documents else int(embedding_info.get("dimension") or 0)
+    vectors = array("f")
+    manifest_docs = []
+    for doc in documents:
+        if len(doc["embedding"]) != dimension:
+            raise ValueError("All embeddings in a snapshot must have the same dimension")
+        vectors.extend(doc["embedding"])
+        entry = {"topic_id": doc["topic_id"], "text": doc["text"]}
+        if doc.get("raw_text") and doc["raw_text"] != doc["text"]:
+            entry["raw_text"] = doc["raw_text"]  # Omitted when identical to the stored text
+        manifest_docs.append(entry)
+    if sys.byteorder != "little":
+        vectors.byteswap()
+
+    manifest = zlib.compress(json.dumps({
+        "embedding": embedding_info,
+        "agent": agent,
+        "topics": topics,
+        "skills": skills,
+        "documents": manifest_docs
+    }, separators=(",", ":")).encode("utf-8"), 9)
+
+    payload = manifest + vectors.tobytes()
+    header = HEADER.pack(MAGIC, VERSION, dimension, len(documents), len(manifest), zlib.crc32(payload))
+    return header + payload
+
+
+def decode_snapshot(data: bytes) -> dict:
+    """
+    Inverse of encode_snapshot. Returns the manifest with each document's
+    embedding restored. Raises ValueError for anything that isn't a complete,
+    unmodified snapshot.
+    """
+    if len(data) < PREFIX.size:
+        raise ValueError("Not a knowledge snapshot")
+    magic, version = PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a knowledge snapshot")
+    if version not in (1, VERSION):
+        raise ValueError(f"Unsupported snapshot version {version}")
+    header = HEADER if version == VERSION else HEADER_V1
+    if len(data) < header.size:
+        raise ValueError("Truncated snapshot")
+    _, _, dimension, count, manifest_size, *checksum = header.unpack_from(data)
+
+    offset = header.size
+    vectors = array("f")
+    size = offset + manifest_size + count * dimension * vectors.itemsize
+    if len(data) < size:
+        raise ValueError("Truncated snapshot")
+    if len(data) > size:
+        raise ValueError("Corrupt snapshot: unexpected trailing data")
+    if checksum and zlib.crc32(data[offset:]) != checksum[0]:
+        raise ValueError("Corrupt snapshot: checksum mismatch")
+
+    try:
+        manifest = json.loads(zlib.decompress(data[offset:offset + manifest_size]))
+    except (zlib.error, ValueError):
+        raise ValueError("Corrupt snapshot manifest")
+    if not isinstance(manifest, dict) or any(
+        not isinstance(manifest.get(key), kind) for key, kind in MANIFEST_FIELDS.items()
+    ):
+        raise ValueError("Corrupt snapshot manifest")
+    offset += manifest_size
+
+    vectors.frombytes(data[offset:size])
+    if len(manifest["documents"]) != count:
+        raise ValueError("Corrupt snapshot: document count mismatch")
+    if sys.byteorder != "little":
+        vectors.byteswap()
+
+    for i, doc in enumerate(manifest["documents"]):
+        doc.setdefault("raw_text", doc["text"])
+        doc["embedding"] = vectors[i * dimension:(i + 1) * dimension].tolist()
+    return manifest
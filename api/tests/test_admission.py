@@ -0,0 +1,147 @@
+"""
+Priority admission of upstream calls (services/admission.py): higher
+classes go first, and calls are shed when their class queue is full or
+their deadline cannot be met.
+
+Run from the api directory: python -m pytest tests
+"""
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.admission import AdmissionController, AdmissionRejected
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for condition"
+        time.sleep(0.005)
+
+
+class Background:
+    """Runs fn in a thread and keeps its result or exception."""
+
+    def __init__(self, fn, *args):
+        self.result = self.error = None
+        self.thread = threading.Thread(target=self._run, args=(fn, *args), daemon=True)
+        self.thread.start()
+
+    def _run(self, fn, *args):
+        try:
+            self.result = fn(*args)
+        except Exception as e:
+            self.error = e
+
+    def join(self):
+        self.thread.join(2)
+        assert not self.thread.is_alive()
+        return self
+
+
+def hold(controller, priority_class, admitted, release, deadline=None):
+    with controller.slot(priority_class, deadline):
+        admitted.append(priority_class)
+        release.wait(2)
+
+
+def test_waiting_higher_classes_are_admitted_first():
+    controller = AdmissionController(total_concurrency=1, limits={
+        "interactive": (1, 8, 5), "training": (1, 8, 5), "bulk": (1, 8, 5),
+    })
+    admitted, release = [], threading.Event()
+    first = Background(hold, controller, "bulk", admitted, release)
+    wait_until(lambda: admitted == ["bulk"])
+
+    # Queued in arrival order bulk, training, interactive
+    step = threading.Semaphore(0)
+
+    def one_at_a_time(priority_class):
+        with controller.slot(priority_class):
+            admitted.append(priority_class)
+            step.acquire(timeout=2)
+
+    waiters = []
+    for priority_class in ("bulk", "training", "interactive"):
+        waiters.append(Background(one_at_a_time, priority_class))
+        wait_until(lambda: controller.stats()[priority_class]["queued"] == 1)
+
+    release.set()
+    first.join()
+    for expected in ("interactive", "training", "bulk"):
+        wait_until(lambda: admitted[-1] == expected)
+        step.release()
+    for waiter in waiters:
+        waiter.join()
+    assert admitted == ["bulk", "interactive", "training", "bulk"]
+
+
+def test_full_queue_sheds_the_call_with_retry_after():
+    controller = AdmissionController(total_concurrency=4, limits={
+        "interactive": (2, 4, 5), "training": (1, 1, 5), "bulk": (1, 1, 5),
+    })
+    admitted, release = [], threading.Event()
+    running = Background(hold, controller, "bulk", admitted, release)
+    wait_until(lambda: admitted == ["bulk"])
+    queued = Background(hold, controller, "bulk", admitted, release)
+    wait_until(lambda: controller.stats()["bulk"]["queued"] == 1)
+
+    with pytest.raises(AdmissionRejected) as shed:
+        with controller.slot("bulk"):
+            pass
+    assert shed.value.retry_after >= 1
+    assert controller.stats()["bulk"]["shed"] == 1
+
+    # Other classes are unaffected by the bulk backlog
+    with controller.slot("interactive"):
+        pass
+    release.set()
+    running.join()
+    queued.join()
+    assert admitted == ["bulk", "bulk"]
+
+
+def test_bulk_is_shed_at_its_deadline_while_interactive_traffic_proceeds():
+    controller = AdmissionController(total_concurrency=1, limits={
+        "interactive": (1, 8, 5), "training": (1, 8, 5), "bulk": (1, 8, 5),
+    })
+    admitted, release = [], threading.Event()
+    running = Background(hold, controller, "interactive", admitted, release)
+    wait_until(lambda: admitted == ["interactive"])
+
+    bulk = Background(hold, controller, "bulk", admitted, release, time.monotonic() + 0.1)
+    interactive = Background(hold, controller, "interactive", admitted, release)
+    wait_until(lambda: controller.stats()["interactive"]["queued"] == 1)
+
+    assert isinstance(bulk.join().error, AdmissionRejected)
+    assert controller.stats()["bulk"]["shed"] == 1
+    release.set()
+    running.join()
+    assert interactive.join().error is None
+    assert admitted == ["interactive", "interactive"]
+
+
+def test_call_is_shed_up_front_when_the_expected_wait_exceeds_its_deadline():
+    controller = AdmissionController(total_concurrency=2, limits={
+        "interactive": (1, 8, 5), "training": (1, 8, 5), "bulk": (1, 8, 5),
+    })
+    admitted, release = [], threading.Event()
+    running = Background(hold, controller, "training", admitted, release)
+    wait_until(lambda: admitted == ["training"])
+    queued = Background(hold, controller, "training", admitted, release)
+    wait_until(lambda: controller.stats()["training"]["queued"] == 1)
+
+    # One call ahead in the queue at ~1s each cannot finish within 0.5s
+    start = time.monotonic()
+    with pytest.raises(AdmissionRejected):
+        with controller.slot("training", deadline=start + 0.5):
+            pass
+    assert time.monotonic() - start < 0.25  # rejected without waiting
+    release.set()
+    running.join()
+    queued.join()
@@ -0,0 +1,197 @@
+"""
+Bulk ingestion (ingest.py) against a throwaway SQLite database and an
+in-memory vector store: resume after an interrupted run, chunk
+deduplication across files, skipping unchanged files, and files whose
+enrichment fails.
+
+Run from the api directory: python -m pytest tests
+"""
+import os
+import sys
+import json
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import ingest
+from database import Base, SessionLocal
+from llm_service import LLMServiceError
+from models import Agent, Topic, IngestedFile
+
+
+class MemoryStore:
+    """The parts of the VectorStore interface ingest.py uses."""
+
+    def __init__(self):
+        self.docs = {}
+        self.fail_after = None  # raise once this many more documents are stored
+
+    def document_ids(self, agent_id):
+        return [doc_id for doc_id, doc in self.docs.items() if doc["agent_id"] == agent_id]
+
+    def get_documents_by_id(self, doc_ids):
+        return [{"id": doc_id, **self.docs[doc_id]} for doc_id in doc_ids if doc_id in self.docs]
+
+    def add_documents(self, items):
+        for item in items:
+            if self.fail_after is not None:
+                if self.fail_after == 0:
+                    self.fail_after = None
+                    raise ConnectionError("vector store went away")
+                self.fail_after -= 1
+            self.docs[item["id"]] = item
+        return [item["id"] for item in items]
+
+
+class MemorySpace:
+    spec = "test:memory"
+
+    def __init__(self):
+        self.store = MemoryStore()
+
+    def embed(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class MemorySpaces:
+    def __init__(self):
+        self.space = MemorySpace()
+
+    def for_agent(self, embedding_model=None, embedding_target=None):
+        return [self.space]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    original = database.engine
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    monkeypatch.setattr(database, "engine", engine)
+    SessionLocal.configure(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    session.add(Agent(id="agent-1", name="Agent", status="active"))
+    session.commit()
+    yield session
+    session.close()
+    SessionLocal.configure(bind=original)
+    engine.dispose()
+
+
+def write_files(root, files: dict):
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+
+class Enricher:
+    """enrich_knowledge that fails for chunks containing `failing`."""
+
+    def __init__(self, failing=None):
+        self.failing = failing
+
+    def enrich_knowledge(self, text):
+        if self.failing and self.failing in text:
+            raise LLMServiceError("model unavailable")
+        return "enriched " + text
+
+
+def run(root, spaces, llm_service=None, **kwargs):
+    entries = ingest.directory_entries(str(root), "agent-1", "general")
+    return ingest.ingest(entries, spaces, llm_service, f"{root}#agent-1", workers=1, **kwargs)
+
+
+def paragraphs(prefix: str, count: int) -> str:
+    # Each paragraph fills a chunk on its own
+    return "\n\n".join(f"{prefix} paragraph {i} " + "word " * 250 for i in range(count))
+
+
+def topic_counts(db):
+    db.expire_all()
+    return {topic.name: topic.doc_count for topic in db.query(Topic)}
+
+
+def test_interrupted_run_resumes_without_double_counting(db, tmp_path):
+    root = tmp_path / "docs"
+    write_files(root, {"a.txt": paragraphs("alpha", 4), "sub/b.txt": paragraphs("beta", 3)})
+    spaces = MemorySpaces()
+    store = spaces.space.store
+
+    # Dies after part of the group's chunks were stored
+    store.fail_after = 3
+    with pytest.raises(ConnectionError):
+        run(root, spaces, group_size=10)
+    assert len(store.docs) == 3
+    db.expire_all()
+    assert {record.status for record in db.query(IngestedFile)} == {"pending"}
+    assert topic_counts(db) == {"general": 0, "sub": 0}
+
+    result = run(root, spaces, group_size=10)
+    assert result["ingested"] == 2
+    assert result["chunks"] == 7
+    assert len(store.docs) == 7
+    assert topic_counts(db) == {"general": 4, "sub": 3}
+    records = db.query(IngestedFile).all()
+    assert {record.status for record in records} == {"done"}
+    assert sorted(doc_id for record in records for doc_id in json.loads(record.doc_ids)) == sorted(store.docs)
+
+
+def test_duplicate_chunks_across_files_are_stored_once(db, tmp_path):
+    root = tmp_path / "docs"
+    shared = "shared paragraph " + "word " * 250
+    write_files(root, {
+        "a.txt": shared + "\n\n" + paragraphs("alpha", 1),
+        "b.txt": paragraphs("beta", 1) + "\n\n" + shared.upper(),  # same text after normalization
+    })
+    spaces = MemorySpaces()
+
+    result = run(root, spaces)
+    assert result["duplicate_chunks"] == 1
+    assert result["chunks"] == 3
+    assert len(spaces.space.store.docs) == 3
+    assert topic_counts(db) == {"general": 3}
+
+
+def test_unchanged_files_are_skipped(db, tmp_path):
+    root = tmp_path / "docs"
+    write_files(root, {"a.txt": paragraphs("alpha", 2), "b.txt": paragraphs("beta", 2)})
+    spaces = MemorySpaces()
+    run(root, spaces)
+
+    # Only the modified file is ingested again
+    write_files(root, {"b.txt": paragraphs("beta", 2) + "\n\nnew paragraph"})
+    result = run(root, spaces)
+    assert result["unchanged"] == 1
+    assert result["ingested"] == 1
+
+    result = run(root, spaces)
+    assert result["unchanged"] == 2
+    assert result["ingested"] == 0
+    assert topic_counts(db)["general"] == len(spaces.space.store.docs)
+
+
+def test_failed_enrichment_marks_file_failed_and_resumes(db, tmp_path):
+    root = tmp_path / "docs"
+    write_files(root, {"a.txt": paragraphs("alpha", 2), "b.txt": paragraphs("beta", 2)})
+    spaces = MemorySpaces()
+    store = spaces.space.store
+
+    result = run(root, spaces, Enricher(failing="beta paragraph 1"), enrich=True)
+    assert result["ingested"] == 1
+    assert result["failed"] == 1
+    assert all(doc["text"].startswith("enriched ") for doc in store.docs.values())
+    assert len(store.docs) == 2
+    db.expire_all()
+    failed = db.query(IngestedFile).filter(IngestedFile.status == "failed").one()
+    assert failed.path.endswith("b.txt")
+    assert "model unavailable" in failed.error
+    assert topic_counts(db) == {"general": 2}
+
+    result = run(root, spaces, Enricher(), enrich=True)
+    assert result["unchanged"] == 1
+    assert result["ingested"] == 1
+    assert len(store.docs) == 4
+    assert topic_counts(db) == {"general": 4}
@@ -0,0 +1,175 @@
+"""
+Per-model rate limiting (services/rate_limiter.py): token bucket refill and
+bursts, the AIMD concurrency limit reacting to 429s, and queue deadlines.
+Time is simulated, so the tests do not sleep.
+
+Run from the api directory: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_service
+from llm_service import GoogleLLMService, RateLimitedError
+from services import rate_limiter
+from services.rate_limiter import (
+    AdaptiveConcurrency, ModelRateLimiter, RateLimitTimeout, SQLiteTokenBucket, TokenBucket
+)
+
+
+class FakeClock:
+    """Stands in for the time module; sleeping advances the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", fake)
+    return fake
+
+
+def drain(bucket) -> int:
+    taken = 0
+    while bucket.try_acquire() == 0:
+        taken += 1
+    return taken
+
+
+def test_token_bucket_allows_a_burst_then_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=5)
+    assert drain(bucket) == 5
+    # Empty: the next token is due in 1 / rate seconds
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+    clock.now += 1.0
+    assert drain(bucket) == 2
+
+    # Refill never exceeds the burst capacity
+    clock.now += 60
+    assert drain(bucket) == 5
+
+
+def test_sqlite_token_bucket_is_shared_between_instances(clock, tmp_path):
+    path = str(tmp_path / "limits.db")
+    first = SQLiteTokenBucket("model", rate=1, capacity=3, path=path)
+    second = SQLiteTokenBucket("model", rate=1, capacity=3, path=path)
+    assert first.try_acquire() == 0
+    assert second.try_acquire() == 0
+    assert first.try_acquire() == 0
+    assert second.try_acquire() == pytest.approx(1.0)
+
+    clock.now += 2
+    assert drain(second) == 2
+
+
+def test_concurrency_halves_on_throttle_and_recovers_on_success():
+    concurrency = AdaptiveConcurrency(initial=8, maximum=8)
+    concurrency.on_throttle()
+    assert concurrency.limit == 4
+    concurrency.on_throttle()
+    concurrency.on_throttle()
+    concurrency.on_throttle()
+    assert concurrency.limit == 1  # never below one slot
+
+    # Additive increase: about one slot per window of successes
+    for _ in range(3):
+        concurrency.on_success()
+    assert concurrency.limit == pytest.approx(2.9)
+    for _ in range(100):
+        concurrency.on_success()
+    assert concurrency.limit == 8
+
+
+def test_slot_times_out_when_the_bucket_wait_exceeds_the_deadline(clock):
+    limiter = ModelRateLimiter("model", requests_per_minute=60, max_concurrency=4)
+    for _ in range(5):  # the burst
+        with limiter.slot(deadline=clock.now + 10):
+            pass
+    # The next token is due in one second
+    with pytest.raises(RateLimitTimeout):
+        with limiter.slot(deadline=clock.now + 0.5):
+            pass
+    assert clock.slept == []
+    assert limiter.concurrency.in_flight == 0
+
+    with limiter.slot(deadline=clock.now + 2):
+        pass
+    assert clock.slept == [pytest.approx(1.0)]
+
+
+def test_slot_times_out_waiting_for_concurrency(clock):
+    limiter = ModelRateLimiter("model", requests_per_minute=600, max_concurrency=2)
+    with limiter.slot(deadline=clock.now + 1):
+        with pytest.raises(RateLimitTimeout):
+            with limiter.slot(deadline=clock.now):
+                pass
+    assert limiter.concurrency.in_flight == 0
+
+
+class Response:
+    def __init__(self, status_code, body=b"{}", headers=None):
+        self.status_code = status_code
+        self.content = body
+        self.headers = headers or {}
+
+    def json(self):
+        return {"ok": True}
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "8")
+    monkeypatch.setattr(llm_service, "backoff_delay", lambda attempt, retry_after=None: 0)
+    monkeypatch.setattr(rate_limiter, "_limiters", {})
+    return GoogleLLMService(base_url="http://upstream.invalid/v1beta/models")
+
+
+def test_429_responses_shrink_the_limit_and_are_retried(service, monkeypatch):
+    responses = [Response(429), Response(429), Response(200)]
+    monkeypatch.setattr(llm_service.requests, "request", lambda *args, **kwargs: responses.pop(0))
+
+    assert service._post_with_retries("model-a", "generateContent", {}) == {"ok": True}
+    limiter = rate_limiter.get_limiter("model-a")
+    assert limiter.throttled == 2
+    # 4 halved twice to 1, then one success adds 1 / limit
+    assert limiter.concurrency.limit == pytest.approx(2)
+
+
+def test_persistent_429s_raise_rate_limited(service, monkeypatch):
+    monkeypatch.setattr(llm_service.requests, "request", lambda *args, **kwargs: Response(429))
+    with pytest.raises(RateLimitedError):
+        service._post_with_retries("model-b", "generateContent", {})
+    assert rate_limiter.get_limiter("model-b").throttled == service.max_retries
+
+
+def test_queue_deadline_raises_rate_limited(service, monkeypatch, clock):
+    monkeypatch.setattr(llm_service, "time", clock)
+    service.queue_timeout = 0.5
+    monkeypatch.setattr(llm_service.requests, "request", lambda *args, **kwargs: Response(200))
+    limiter = rate_limiter.get_limiter("model-c")
+    drain(limiter.bucket)
+    with pytest.raises(RateLimitedError):
+        service._post_with_retries("model-c", "generateContent", {})
+    assert clock.slept == []
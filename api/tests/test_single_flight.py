@@ -0,0 +1,157 @@
+"""
+Single-flight coalescing of identical upstream calls (services/single_flight.py
+and its use in GoogleLLMService._post): shared results and errors, follower
+timeouts, and keeping priority classes apart.
+
+Run from the api directory: python -m pytest tests
+"""
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_service import GoogleLLMService, RateLimitedError
+from services.admission import llm_priority
+from services.single_flight import SingleFlight
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for condition"
+        time.sleep(0.005)
+
+
+class Background:
+    """Runs fn in a thread and keeps its result or exception."""
+
+    def __init__(self, fn, *args):
+        self.result = self.error = None
+        self.thread = threading.Thread(target=self._run, args=(fn, *args), daemon=True)
+        self.thread.start()
+
+    def _run(self, fn, *args):
+        try:
+            self.result = fn(*args)
+        except Exception as e:
+            self.error = e
+
+    def join(self):
+        self.thread.join(2)
+        assert not self.thread.is_alive()
+        return self
+
+
+def test_identical_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(2)
+        return "answer"
+
+    leader = Background(flight.do, "key", fn)
+    wait_until(lambda: flight.in_flight() == 1)
+    followers = [Background(flight.do, "key", fn) for _ in range(3)]
+    wait_until(lambda: flight._calls["key"].waiters == 3)
+    release.set()
+
+    assert leader.join().result == ("answer", False)
+    assert [f.join().result for f in followers] == [("answer", True)] * 3
+    assert calls == [1]
+    assert flight.in_flight() == 0
+
+
+def test_followers_receive_the_leaders_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait(2)
+        raise ValueError("upstream failed")
+
+    leader = Background(flight.do, "key", fn)
+    wait_until(lambda: flight.in_flight() == 1)
+    follower = Background(flight.do, "key", fn)
+    wait_until(lambda: flight._calls["key"].waiters == 1)
+    release.set()
+
+    assert isinstance(leader.join().error, ValueError)
+    assert isinstance(follower.join().error, ValueError)
+
+
+def test_follower_times_out_and_the_leader_carries_on():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait(2)
+        return "late answer"
+
+    leader = Background(flight.do, "key", fn)
+    wait_until(lambda: flight.in_flight() == 1)
+    with pytest.raises(TimeoutError):
+        flight.do("key", fn, timeout=0.05)
+    assert flight._calls["key"].waiters == 0
+
+    release.set()
+    assert leader.join().result == ("late answer", False)
+    assert flight.in_flight() == 0
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+    monkeypatch.setenv("LLM_ADMISSION_ENABLED", "false")
+    service = GoogleLLMService(base_url="http://upstream.invalid/v1beta/models")
+    service.release = threading.Event()
+    service.upstream_calls = []
+
+    def post_upstream(model, method, payload, url=None, http_method="post"):
+        service.upstream_calls.append(payload)
+        service.release.wait(2)
+        return {"echo": payload}
+
+    monkeypatch.setattr(service, "_post_upstream", post_upstream)
+    return service
+
+
+def post_at(service, priority_class, payload):
+    with llm_priority(priority_class):
+        return service._post("model", "generateContent", payload)
+
+
+def test_calls_coalesce_only_within_a_priority_class(service):
+    payload = {"contents": "same prompt"}
+    bulk = Background(post_at, service, "bulk", payload)
+    wait_until(lambda: len(service.upstream_calls) == 1)
+    bulk_follower = Background(post_at, service, "bulk", payload)
+    # An interactive caller must not queue behind the bulk call
+    interactive = Background(post_at, service, "interactive", payload)
+    wait_until(lambda: len(service.upstream_calls) == 2)
+    wait_until(lambda: sorted(call.waiters for call in service.single_flight._calls.values()) == [0, 1])
+    service.release.set()
+
+    for caller in (bulk, bulk_follower, interactive):
+        assert caller.join().result == {"echo": payload}
+    assert len(service.upstream_calls) == 2
+
+
+def test_follower_timeout_surfaces_as_rate_limited(service):
+    service.queue_timeout = 0.05
+    payload = {"contents": "slow prompt"}
+    leader = Background(post_at, service, "interactive", payload)
+    wait_until(lambda: len(service.upstream_calls) == 1)
+    with pytest.raises(RateLimitedError):
+        post_at(service, "interactive", payload)
+
+    service.release.set()
+    assert leader.join().result == {"echo": payload}
+    assert len(service.upstream_calls) == 1
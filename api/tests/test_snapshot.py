@@ -0,0 +1,177 @@
+"""
+Agent snapshots (services/snapshot.py and the export/import endpoints): an
+agent exported from one database and Chroma collection and imported into
+fresh ones comes back identical, and truncated or modified snapshots are
+rejected before anything is written.
+
+Run from the api directory: python -m pytest tests
+"""
+import io
+import os
+import sys
+import zlib
+
+import pytest
+from chromadb.api.client import SharedSystemClient
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from database import Base
+from models import Agent, Topic, AgentSkill
+from services.snapshot import HEADER, HEADER_V1, MAGIC, decode_snapshot, encode_snapshot
+from vector_store import VectorStore
+
+EMBEDDING_INFO = {"provider": "test", "model": "snapshot", "dimension": 4, "spec": "test:snapshot"}
+
+
+class Embedder:
+    spec = EMBEDDING_INFO["spec"]
+
+    def info(self):
+        return dict(EMBEDDING_INFO)
+
+
+class Space:
+    embedder = Embedder()
+    spec = Embedder.spec
+
+    def __init__(self, store):
+        self.store = store
+
+
+class Spaces:
+    def __init__(self, store):
+        self.default = Space(store)
+
+    def for_agent(self, embedding_model=None, embedding_target=None):
+        return [self.default]
+
+
+class Service:
+    embedder = Embedder()
+
+
+def open_site(root, name):
+    """A database and Chroma collection of their own, as on another server."""
+    engine = create_engine(f"sqlite:///{root / name}.db")
+    Base.metadata.create_all(bind=engine)
+    store = VectorStore(embedding_info=EMBEDDING_INFO, collection_name=name)
+    return sessionmaker(bind=engine)(), store
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # VectorStore opens ./chroma_db
+    # Chroma caches clients by path, and "./chroma_db" now names another directory
+    SharedSystemClient.clear_system_cache()
+    db, store = open_site(tmp_path, "source")
+    db.add(Agent(id="agent-1", name="Support", description="Answers tickets", color="bg-red-500", status="active"))
+    db.add_all([
+        Topic(id="topic-1", agent_id="agent-1", name="VPN", doc_count=2, status="active"),
+        Topic(id="topic-2", agent_id="agent-1", name="Billing", doc_count=1, status="active"),
+    ])
+    db.add(AgentSkill(id="skill-1", agent_id="agent-1", name="lookup", description="Looks up a ticket",
+                      code="def run(ticket): return ticket", parameters='{"ticket": {"type": "STRING"}}'))
+    db.commit()
+    store.add_documents([
+        {"agent_id": "agent-1", "topic_id": "topic-1", "text": "Enriched VPN setup", "raw_text": "vpn setup",
+         "embedding": [0.1, 0.2, 0.3, 0.4]},
+        {"agent_id": "agent-1", "topic_id": "topic-1", "text": "Reset the VPN token", "embedding": [0.5, 0.25, 0.125, 1.0]},
+        {"agent_id": "agent-1", "topic_id": "topic-2", "text": "Invoices go out monthly", "embedding": [1.0, 0.0, -1.0, 0.5]},
+    ])
+    yield db, store
+    db.close()
+
+
+def export(db, store, monkeypatch) -> bytes:
+    monkeypatch.setattr(main, "embedding_spaces", Spaces(store))
+    return main.export_agent_snapshot("agent-1", db).body
+
+
+def import_into(db, store, data: bytes, monkeypatch, as_copy=False) -> dict:
+    monkeypatch.setattr(main, "embedding_spaces", Spaces(store))
+    monkeypatch.setattr(main, "llm_service", Service())
+    return main.import_agent_snapshot(UploadFile(io.BytesIO(data), filename="agent.kbsnap"), as_copy, db)
+
+
+def contents(db, store, agent_id):
+    agent = db.query(Agent).filter(Agent.id == agent_id).one()
+    topics = {t.id: (t.name, t.doc_count) for t in db.query(Topic).filter(Topic.agent_id == agent_id)}
+    skills = {(s.name, s.description, s.code, s.parameters) for s in db.query(AgentSkill).filter(AgentSkill.agent_id == agent_id)}
+    documents = sorted(
+        (topics[doc["topic_id"]][0], doc["text"], doc["raw_text"], tuple(round(v, 6) for v in doc["embedding"]))
+        for doc in store.export_documents(agent_id)
+    )
+    return (agent.name, agent.description, agent.color), sorted(topics.values()), skills, documents
+
+
+def test_round_trip_into_a_fresh_site(source, tmp_path, monkeypatch):
+    source_db, source_store = source
+    data = export(source_db, source_store, monkeypatch)
+
+    target_db, target_store = open_site(tmp_path, "target")
+    result = import_into(target_db, target_store, data, monkeypatch)
+    assert result["agent_id"] == "agent-1"
+    assert (result["topics"], result["skills"], result["documents"]) == (2, 1, 3)
+    assert contents(target_db, target_store, "agent-1") == contents(source_db, source_store, "agent-1")
+    assert target_db.query(Agent).one().embedding_model == EMBEDDING_INFO["spec"]
+
+    # Same ids again conflict; as a copy everything gets new ids
+    with pytest.raises(HTTPException) as conflict:
+        import_into(target_db, target_store, data, monkeypatch)
+    assert conflict.value.status_code == 409
+    copy = import_into(target_db, target_store, data, monkeypatch, as_copy=True)
+    assert copy["agent_id"] != "agent-1"
+    assert contents(target_db, target_store, copy["agent_id"]) == contents(source_db, source_store, "agent-1")
+    target_db.close()
+
+
+def test_version_1_snapshots_still_decode():
+    data = encode_snapshot({"id": "a"}, [], [], [{"topic_id": "t", "text": "x", "embedding": [1.0, 2.0]}], EMBEDDING_INFO)
+    header = HEADER.unpack_from(data)
+    legacy = HEADER_V1.pack(MAGIC, 1, *header[2:5]) + data[HEADER.size:]
+    assert decode_snapshot(legacy)["documents"][0]["embedding"] == [1.0, 2.0]
+
+
+def tampered(data: bytes):
+    payload_start = HEADER.size
+    yield "truncated header", data[:HEADER.size - 1]
+    yield "truncated manifest", data[:payload_start + 10]
+    yield "truncated vectors", data[:-1]
+    yield "trailing bytes", data + b"\x00"
+    yield "not a snapshot", b"PK\x03\x04" + data[4:]
+    yield "future version", data[:6] + b"\x09\x00" + data[8:]
+    flipped = bytearray(data)
+    flipped[-3] ^= 0x40  # inside the last embedding
+    yield "modified vector", bytes(flipped)
+    flipped = bytearray(data)
+    flipped[payload_start + 5] ^= 0x01  # inside the compressed manifest
+    yield "modified manifest", bytes(flipped)
+    # A consistent header around a manifest that lies about the document count
+    _, _, dimension, count, manifest_size, _ = HEADER.unpack_from(data)
+    manifest = zlib.compress(zlib.decompress(data[payload_start:payload_start + manifest_size]).replace(
+        b'"documents":[', b'"documents":[{"topic_id":"topic-1","text":"injected"},', 1))
+    payload = manifest + data[payload_start + manifest_size:]
+    yield "document count mismatch", HEADER.pack(MAGIC, 2, dimension, count, len(manifest), zlib.crc32(payload)) + payload
+
+
+def test_truncated_or_tampered_snapshots_are_rejected(source, tmp_path, monkeypatch):
+    source_db, source_store = source
+    data = export(source_db, source_store, monkeypatch)
+    target_db, target_store = open_site(tmp_path, "target")
+
+    for case, bad in tampered(data):
+        with pytest.raises(ValueError):
+            decode_snapshot(bad)
+        with pytest.raises(HTTPException) as rejected:
+            import_into(target_db, target_store, bad, monkeypatch)
+        assert rejected.value.status_code == 400, case
+
+    # Nothing was written
+    assert target_db.query(Agent).count() == 0
+    assert target_store.export_documents("agent-1") == []
+    target_db.close()
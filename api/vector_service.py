@@ -0,0 +1,275 @@
+"""
+Shared vector store service.
+
+Chroma's PersistentClient is not safe to open from several processes at
+once, so when the API runs with multiple workers (uvicorn --workers N,
+gunicorn) one instance of this service owns ./chroma_db and every worker
+talks to it over HTTP (set VECTOR_STORE_URL, see vector_store.RemoteVectorStore).
+
+Concurrent adds are coalesced: requests arriving within VECTOR_SERVICE_BATCH_MS
+of each other (up to VECTOR_SERVICE_BATCH_SIZE documents) are written with a
+single collection.add call.
+
+Run (from the api directory):
+    uvicorn vector_service:app --port 8100 --workers 1
+"""
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from services.logging_config import configure_logging
+from vector_store import create_vector_store
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+BATCH_WINDOW_MS = float(os.getenv("VECTOR_SERVICE_BATCH_MS", 5))
+MAX_BATCH_SIZE = int(os.getenv("VECTOR_SERVICE_BATCH_SIZE", 256))
+
+
+class WriteBatcher:
+    """
+    Collects add requests for one collection and flushes them as one write.
+    Writes (adds and deletes) to a collection are serialised through `lock`.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = asyncio.Lock()
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def add(self, items: list) -> list:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((items, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            pending = [await self.queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + BATCH_WINDOW_MS / 1000
+            while size < MAX_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(entry)
+                size += len(entry[0])
+            await self._flush(pending)
+
+    async def _flush(self, pending: list):
+        items = [item for batch, _ in pending for item in batch]
+        try:
+            async with self.lock:
+                ids = await run_in_threadpool(self.store.add_documents, items)
+        except Exception as e:
+            if len(pending) == 1:
+                self._resolve(pending[0][1], exception=e)
+            else:
+                # One bad request must not fail the others it was merged with
+                logger.warning("Batched add of %d requests failed, retrying them one by one: %s", len(pending), e)
+                await self._flush_each(pending)
+            return
+        offset = 0
+        for batch, future in pending:
+            self._resolve(future, result=ids[offset:offset + len(batch)])
+            offset += len(batch)
+
+    async def _flush_each(self, pending: list):
+        for batch, future in pending:
+            try:
+                async with self.lock:
+                    ids = await run_in_threadpool(self.store.add_documents, batch)
+            except Exception as e:
+                self._resolve(future, exception=e)
+            else:
+                self._resolve(future, result=ids)
+
+    @staticmethod
+    def _resolve(future, result=None, exception=None):
+        if future.done():  # the caller went away
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    async def close(self):
+        self.task.cancel()
+
+
+collections = {}
+open_lock = asyncio.Lock()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    for batcher in collections.values():
+        await batcher.close()
+
+
+app = FastAPI(title="Knowledge Buddy Vector Store", lifespan=lifespan)
+
+
+class CollectionRequest(BaseModel):
+    name: str
+    embedding_info: dict = {}
+
+
+class Document(BaseModel):
+    agent_id: str
+    topic_id: str
+    text: str
+    embedding: List[float]
+    raw_text: Optional[str] = None
+    id: Optional[str] = None
+
+
+class AddRequest(BaseModel):
+    items: List[Document]
+
+
+class LookupRequest(BaseModel):
+    ids: List[str]
+
+
+class IndexRequest(BaseModel):
+    ef_search: int
+
+
+class SearchRequest(BaseModel):
+    agent_id: str
+    query_embedding: List[float]
+    n_results: int = 3
+
+
+def get_batcher(name: str) -> WriteBatcher:
+    if name not in collections:
+        raise HTTPException(status_code=404, detail=f"Unknown collection '{name}'")
+    return collections[name]
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "collections": list(collections)}
+
+
+@app.post("/collections")
+async def open_collection(request: CollectionRequest):
+    """
+    Opens (creating if needed) a collection. Each API worker calls this on
+    startup; a dimension mismatch is reported as 400.
+    """
+    async with open_lock:
+        if request.name not in collections:
+            try:
+                store = await run_in_threadpool(
+                    create_vector_store, request.embedding_info or None, request.name, False
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            collections[request.name] = WriteBatcher(store)
+            logger.info("Opened collection", extra={"collection": request.name})
+
+    store = collections[request.name].store
+    dimension = request.embedding_info.get("dimension")
+    if store.dimension and dimension and store.dimension != dimension:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Collection '{request.name}' holds {store.dimension}-d vectors but the embedding "
+                   f"provider produces {dimension}-d vectors"
+        )
+    return {"name": request.name, "dimension": store.dimension}
+
+
+@app.post("/collections/{name}/documents")
+async def add_documents(name: str, request: AddRequest):
+    batcher = get_batcher(name)
+    try:
+        ids = await batcher.add([item.model_dump() for item in request.items])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ids": ids}
+
+
+@app.post("/collections/{name}/search")
+async def search(name: str, request: SearchRequest):
+    store = get_batcher(name).store
+    documents = await run_in_threadpool(store.search, request.agent_id, request.query_embedding, request.n_results)
+    return {"documents": documents}
+
+
+@app.get("/collections/{name}/agents/{agent_id}/topics/{topic_id}")
+async def get_documents(name: str, agent_id: str, topic_id: str):
+    store = get_batcher(name).store
+    return {"documents": await run_in_threadpool(store.get_documents, agent_id, topic_id)}
+
+
+@app.get("/collections/{name}/agents/{agent_id}/export")
+async def export_documents(name: str, agent_id: str):
+    store = get_batcher(name).store
+    return {"documents": await run_in_threadpool(store.export_documents, agent_id)}
+
+
+@app.get("/collections/{name}/agents/{agent_id}/ids")
+async def document_ids(name: str, agent_id: str):
+    store = get_batcher(name).store
+    return {"ids": await run_in_threadpool(store.document_ids, agent_id)}
+
+
+@app.post("/collections/{name}/documents/lookup")
+async def get_documents_by_id(name: str, request: LookupRequest):
+    store = get_batcher(name).store
+    return {"documents": await run_in_threadpool(store.get_documents_by_id, request.ids)}
+
+
+@app.get("/collections/{name}/index")
+async def index_params(name: str):
+    store = get_batcher(name).store
+    return await run_in_threadpool(store.index_params)
+
+
+@app.put("/collections/{name}/index")
+async def set_search_ef(name: str, request: IndexRequest):
+    """
+    Records a new HNSW ef_search; it takes effect when the service restarts.
+    """
+    store = get_batcher(name).store
+    await run_in_threadpool(store.set_search_ef, request.ef_search)
+    return await run_in_threadpool(store.index_params)
+
+
+@app.delete("/collections/{name}/agents/{agent_id}/topics/{topic_id}")
+async def delete_documents(name: str, agent_id: str, topic_id: str):
+    batcher = get_batcher(name)
+    async with batcher.lock:
+        await run_in_threadpool(batcher.store.delete_documents, agent_id, topic_id)
+    return {"status": "deleted"}
+
+
+@app.post("/collections/{name}/agents/{agent_id}/documents/delete")
+async def delete_documents_by_id(name: str, agent_id: str, request: LookupRequest):
+    batcher = get_batcher(name)
+    async with batcher.lock:
+        await run_in_threadpool(batcher.store.delete_documents_by_id, agent_id, request.ids)
+    return {"status": "deleted"}
+
+
+@app.delete("/collections/{name}/agents/{agent_id}")
+async def delete_agent_documents(name: str, agent_id: str):
+    batcher = get_batcher(name)
+    async with batcher.lock:
+        await run_in_threadpool(batcher.store.delete_agent_documents, agent_id)
+    return {"status": "deleted"}
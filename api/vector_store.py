@@ -1,29 +1,146 @@
-import chromadb
-from chromadb.config import Settings
+import os
 import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTION = "knowledge_base"
+
+# HNSW parameters -> Chroma collection metadata keys
+HNSW_METADATA_KEYS = {"M": "hnsw:M", "ef_construction": "hnsw:construction_ef", "ef_search": "hnsw:search_ef"}
+
+
+def configured_index_params() -> dict:
+    """
+    HNSW parameters for new collections from VECTOR_HNSW_M,
+    VECTOR_HNSW_EF_CONSTRUCTION and VECTOR_HNSW_EF_SEARCH (unset ones keep
+    Chroma's defaults).
+    """
+    params = {}
+    for name, env in (("M", "VECTOR_HNSW_M"), ("ef_construction", "VECTOR_HNSW_EF_CONSTRUCTION"),
+                      ("ef_search", "VECTOR_HNSW_EF_SEARCH")):
+        if os.getenv(env):
+            params[name] = int(os.getenv(env))
+    return params
+
+
+def index_params_of(collection) -> dict:
+    config = (getattr(collection, "configuration_json", None) or {}).get("hnsw") or {}
+    metadata = collection.metadata or {}
+    return {
+        "M": config.get("max_neighbors") or metadata.get("hnsw:M"),
+        "ef_construction": config.get("ef_construction") or metadata.get("hnsw:construction_ef"),
+        "ef_search": config.get("ef_search") or metadata.get("hnsw:search_ef"),
+    }
+
+
+def set_search_ef(collection, ef_search: int):
+    """
+    Changes a collection's HNSW ef_search (the only parameter that can change
+    after the index is built). Chroma reads it when it loads the index, so an
+    index already loaded by a running process keeps its previous value.
+    """
+    try:
+        collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+    except TypeError:
+        pass  # Chroma < 1.0 reads it from the metadata below
+    collection.modify(metadata={**(collection.metadata or {}), "hnsw:search_ef": ef_search})
 
 class VectorStore:
-    def __init__(self):
+    def __init__(self, embedding_info: dict = None, collection_name: str = None, index_params: dict = None):
+        """
+        embedding_info describes the embedding space ({"provider", "model",
+        "dimension", "spec"}). It is recorded in the collection metadata, and
+        vectors of any other dimension are rejected. index_params (M, ef_construction,
+        ef_search; default configured_index_params()) apply when the
+        collection is created; ef_search is also applied to an existing one.
+        """
+        import chromadb  # heavy import, deferred until a store is created
+
         # Persistent storage in ./chroma_db
         self.client = chromadb.PersistentClient(path="./chroma_db")
-        self.collection = self.client.get_or_create_collection(name="knowledge_base")
+        self.embedding_info = embedding_info or {}
+        index_params = configured_index_params() if index_params is None else index_params
+        metadata = {k: v for k, v in self.embedding_info.items() if v is not None}
+        index_metadata = {HNSW_METADATA_KEYS[k]: v for k, v in index_params.items()}
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name or DEFAULT_COLLECTION,
+            metadata={**metadata, **index_metadata} or None
+        )
+
+        current = self.index_params()
+        if index_params.get("ef_search") and current["ef_search"] != index_params["ef_search"]:
+            self.set_search_ef(index_params["ef_search"])
+        for name in ("M", "ef_construction"):
+            if index_params.get(name) and current[name] and current[name] != index_params[name]:
+                logger.warning(
+                    "Collection '%s' was built with %s=%s; the configured %s only applies to new collections",
+                    self.collection.name, name, current[name], index_params[name]
+                )
+
+        recorded = (self.collection.metadata or {}).get("dimension")
+        if not recorded and metadata:
+            # Collection created before dimensions were recorded
+            self.collection.modify(metadata={**(self.collection.metadata or {}), **metadata})
+        if recorded and self.embedding_info.get("dimension") and recorded != self.embedding_info["dimension"]:
+            raise ValueError(
+                f"Collection '{self.collection.name}' holds {recorded}-d vectors but the embedding "
+                f"provider produces {self.embedding_info['dimension']}-d vectors"
+            )
+        self.dimension = recorded or self.embedding_info.get("dimension")
+        # Every vector records the embedding space (spec) that produced it
+        spec = self.embedding_info.get("spec")
+        if not spec and self.embedding_info.get("provider"):
+            spec = f"{self.embedding_info['provider']}:{self.embedding_info['model']}"
+        self._embedding_metadata = {"embedding_model": spec} if spec else {}
+
+    def index_params(self) -> dict:
+        """
+        The collection's HNSW parameters ({"M", "ef_construction", "ef_search"}).
+        """
+        return index_params_of(self.collection)
+
+    def set_search_ef(self, ef_search: int):
+        set_search_ef(self.collection, ef_search)
+
+    def _check_dimension(self, embedding: list):
+        if self.dimension and len(embedding) != self.dimension:
+            raise ValueError(f"Expected a {self.dimension}-d embedding, got {len(embedding)}")
 
     def add_document(self, agent_id: str, topic_id: str, text: str, embedding: list, raw_text: str = None):
         """
         Adds a document to the vector store with both raw and enriched versions.
         """
-        doc_id = str(uuid.uuid4())
+        return self.add_documents([{
+            "agent_id": agent_id,
+            "topic_id": topic_id,
+            "text": text,
+            "embedding": embedding,
+            "raw_text": raw_text
+        }])[0]
+
+    def add_documents(self, items: list):
+        """
+        Adds several documents in one write. Each item is a dict with
+        agent_id, topic_id, text, embedding and optional raw_text and id
+        (re-embedding keeps a document's id across collections).
+        Returns the document ids in order.
+        """
+        for item in items:
+            self._check_dimension(item["embedding"])
+        doc_ids = [item.get("id") or str(uuid.uuid4()) for item in items]
         self.collection.add(
-            documents=[text],  # Store enriched version as main document
-            embeddings=[embedding],
+            documents=[item["text"] for item in items],  # Store enriched version as main document
+            embeddings=[item["embedding"] for item in items],
             metadatas=[{
-                "agent_id": agent_id, 
-                "topic_id": topic_id,
-                "raw_text": raw_text or text  # Store raw version in metadata
-            }],
-            ids=[doc_id]
+                "agent_id": item["agent_id"],
+                "topic_id": item["topic_id"],
+                "raw_text": item.get("raw_text") or item["text"],  # Store raw version in metadata
+                **self._embedding_metadata
+            } for item in items],
+            ids=doc_ids
         )
-        return doc_id
+        return doc_ids
 
     def search(self, agent_id: str, query_embedding: list, n_results: int = 3):
         """
@@ -48,6 +165,19 @@ class VectorStore:
             where={"$and": [{"agent_id": agent_id}, {"topic_id": topic_id}]}
         )
 
+    def delete_agent_documents(self, agent_id: str):
+        """
+        Deletes every document belonging to an agent in a single call.
+        """
+        self.collection.delete(where={"agent_id": agent_id})
+
+    def delete_documents_by_id(self, agent_id: str, doc_ids: list):
+        """
+        Deletes specific documents of an agent (ids of other agents are ignored).
+        """
+        if doc_ids:
+            self.collection.delete(ids=doc_ids, where={"agent_id": agent_id})
+
     def get_documents(self, agent_id: str, topic_id: str):
         """
         Retrieves all documents for a specific topic.
@@ -59,3 +189,159 @@ class VectorStore:
         if results["documents"]:
             return results["documents"]
         return []
+
+    def export_documents(self, agent_id: str):
+        """
+        Returns every document of an agent with its embedding, in the item
+        format accepted by add_documents (minus agent_id).
+        """
+        results = self.collection.get(
+            where={"agent_id": agent_id},
+            include=["documents", "metadatas", "embeddings"]
+        )
+        return [
+            {
+                "topic_id": meta.get("topic_id"),
+                "text": document,
+                "raw_text": meta.get("raw_text"),
+                "embedding": [float(v) for v in embedding]
+            }
+            for document, meta, embedding in zip(results["documents"], results["metadatas"], results["embeddings"])
+        ]
+
+    def document_ids(self, agent_id: str):
+        """
+        Ids of every document belonging to an agent.
+        """
+        return self.collection.get(where={"agent_id": agent_id}, include=[])["ids"]
+
+    def get_documents_by_id(self, doc_ids: list):
+        """
+        Documents (without embeddings) as add_documents items, keyed by id.
+        """
+        results = self.collection.get(ids=doc_ids, include=["documents", "metadatas"])
+        return [
+            {
+                "id": doc_id,
+                "agent_id": meta.get("agent_id"),
+                "topic_id": meta.get("topic_id"),
+                "text": document,
+                "raw_text": meta.get("raw_text")
+            }
+            for doc_id, document, meta in zip(results["ids"], results["documents"], results["metadatas"])
+        ]
+
+def collection_name_for(provider) -> str:
+    """
+    The original remote embeddings keep using the existing collection; every
+    other provider/model gets its own, since vector spaces cannot be mixed.
+    """
+    if provider.name == "google" and provider.model == "text-embedding-004" and provider.dimension == 768:
+        return DEFAULT_COLLECTION
+    return f"{DEFAULT_COLLECTION}__{provider.collection_suffix}"
+
+
+class RemoteVectorStore:
+    """
+    Client for the shared vector store service (vector_service.py), with the
+    same interface as VectorStore. Lets several API workers use one Chroma
+    directory without opening it in every process. Connections are pooled
+    and reused across calls.
+    """
+
+    def __init__(self, base_url: str, embedding_info: dict = None, collection_name: str = None, timeout: float = None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = base_url.rstrip("/")
+        self.collection_name = collection_name or DEFAULT_COLLECTION
+        self.timeout = timeout or float(os.getenv("VECTOR_STORE_TIMEOUT", 10))
+        pool_size = int(os.getenv("VECTOR_STORE_POOL_SIZE", 16))
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+        self.session.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+
+        # Creates the collection on first use and validates the embedding space
+        info = self._request("post", "/collections", json={
+            "name": self.collection_name,
+            "embedding_info": embedding_info or {}
+        })
+        self.embedding_info = embedding_info or {}
+        self.dimension = info.get("dimension")
+
+    def _request(self, method: str, path: str, **kwargs):
+        response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        if response.status_code == 400:
+            raise ValueError(response.json().get("detail", response.text))
+        response.raise_for_status()
+        return response.json()
+
+    def _path(self, suffix: str = "") -> str:
+        return f"/collections/{self.collection_name}{suffix}"
+
+    def add_document(self, agent_id: str, topic_id: str, text: str, embedding: list, raw_text: str = None):
+        return self.add_documents([{
+            "agent_id": agent_id,
+            "topic_id": topic_id,
+            "text": text,
+            "embedding": embedding,
+            "raw_text": raw_text
+        }])[0]
+
+    def add_documents(self, items: list):
+        return self._request("post", self._path("/documents"), json={"items": items})["ids"]
+
+    def search(self, agent_id: str, query_embedding: list, n_results: int = 3):
+        return self._request("post", self._path("/search"), json={
+            "agent_id": agent_id,
+            "query_embedding": query_embedding,
+            "n_results": n_results
+        })["documents"]
+
+    def delete_documents(self, agent_id: str, topic_id: str):
+        self._request("delete", self._path(f"/agents/{agent_id}/topics/{topic_id}"))
+
+    def delete_agent_documents(self, agent_id: str):
+        self._request("delete", self._path(f"/agents/{agent_id}"))
+
+    def delete_documents_by_id(self, agent_id: str, doc_ids: list):
+        if doc_ids:
+            self._request("post", self._path(f"/agents/{agent_id}/documents/delete"), json={"ids": doc_ids})
+
+    def get_documents(self, agent_id: str, topic_id: str):
+        return self._request("get", self._path(f"/agents/{agent_id}/topics/{topic_id}"))["documents"]
+
+    def export_documents(self, agent_id: str):
+        return self._request("get", self._path(f"/agents/{agent_id}/export"))["documents"]
+
+    def document_ids(self, agent_id: str):
+        return self._request("get", self._path(f"/agents/{agent_id}/ids"))["ids"]
+
+    def get_documents_by_id(self, doc_ids: list):
+        return self._request("post", self._path("/documents/lookup"), json={"ids": doc_ids})["documents"]
+
+    def index_params(self) -> dict:
+        return self._request("get", self._path("/index"))
+
+    def set_search_ef(self, ef_search: int):
+        self._request("put", self._path("/index"), json={"ef_search": ef_search})
+
+
+def create_vector_store(embedding_info: dict = None, collection_name: str = None, remote: bool = True):
+    """
+    Builds the vector store selected by VECTOR_BACKEND (chroma or numpy).
+    When VECTOR_STORE_URL is set (and remote is allowed), returns a client
+    for the shared vector store service instead of opening Chroma in-process.
+    """
+    url = os.getenv("VECTOR_STORE_URL")
+    if url and remote:
+        return RemoteVectorStore(url, embedding_info=embedding_info, collection_name=collection_name or DEFAULT_COLLECTION)
+
+    store = VectorStore(embedding_info=embedding_info, collection_name=collection_name)
+    backend = os.getenv("VECTOR_BACKEND", "chroma").lower()
+    if backend == "numpy":
+        from numpy_vector_store import NumpyVectorStore
+        return NumpyVectorStore(store)
+    if backend != "chroma":
+        raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")
+    return store
@@ -10,6 +10,7 @@ import { Button } from '@/components/ui/button';
 
 export default function ChatPage() {
     const [conversations, setConversations] = useState<any[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
     const [activeConversation, setActiveConversation] = useState<any>(null);
     const [selectedAgent, setSelectedAgent] = useState<any>(null);
     const [agents, setAgents] = useState<any[]>([]);
@@ -21,7 +22,15 @@ export default function ChatPage() {
 
     const loadConversations = async () => {
         const data = await api.getConversations();
-        setConversations(data);
+        setConversations(data.items);
+        setNextCursor(data.next_cursor);
+    };
+
+    const loadMoreConversations = async () => {
+        if (!nextCursor) return;
+        const data = await api.getConversations(nextCursor);
+        setConversations((prev) => [...prev, ...data.items]);
+        setNextCursor(data.next_cursor);
     };
 
     const loadAgents = async () => {
@@ -67,6 +76,8 @@ export default function ChatPage() {
                     conversations={conversations}
                     activeConversation={activeConversation}
                     onSelectConversation={setActiveConversation}
+                    hasMore={!!nextCursor}
+                    onLoadMore={loadMoreConversations}
                     onConversationDeleted={() => {
                         loadConversations();
                         setActiveConversation(null);
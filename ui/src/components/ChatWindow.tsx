@@ -31,6 +31,14 @@ interface ChatWindowProps {
   onMessageSent?: () => void;
 }
 
+const toMessage = (msg: any): Message => ({
+  id: msg.id,
+  role: msg.role,
+  content: msg.content,
+  timestamp: new Date(msg.timestamp),
+  rating: msg.rating // Load existing rating from DB
+});
+
 export function ChatWindow({
   agentId,
   agentName,
@@ -49,6 +57,11 @@ export function ChatWindow({
   const [loading, setLoading] = useState(false);
   const scrollRef = useRef<HTMLDivElement>(null);
 
+  // Older history is loaded a page at a time
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  const preserveScrollRef = useRef<number | null>(null);
+
   // Training State
   const [confidence, setConfidence] = useState(0);
   const [accumulatedContext, setAccumulatedContext] = useState("");
@@ -65,19 +78,15 @@ export function ChatWindow({
 
   useEffect(() => {
     const loadInitialMessage = async () => {
+      setHistoryCursor(null);
       if (mode === 'chat') {
         if (conversationId) {
-          const history = await api.getConversationMessages(conversationId);
+          const page = await api.getConversationMessages(conversationId);
+          const history = page.items;
+          setHistoryCursor(page.next_cursor);
 
           if (history && history.length > 0) {
-            const historyMessages = history.map((msg: any) => ({
-              id: msg.id,
-              role: msg.role,
-              content: msg.content,
-              timestamp: new Date(msg.timestamp),
-              rating: msg.rating // Load existing rating from DB
-            }));
-            setMessages(historyMessages);
+            setMessages(history.map(toMessage));
           } else {
             setMessages([{
               id: "welcome",
@@ -120,11 +129,34 @@ export function ChatWindow({
   }, [mode, topicName, topicId, conversationId]); // agentId removed to prevent full reload on switch
 
   useEffect(() => {
-    if (scrollRef.current) {
+    if (!scrollRef.current) return;
+    if (preserveScrollRef.current !== null) {
+      // Older messages were prepended: keep the viewport on the same message
+      scrollRef.current.scrollTop = scrollRef.current.scrollHeight - preserveScrollRef.current;
+      preserveScrollRef.current = null;
+    } else {
       scrollRef.current.scrollTop = scrollRef.current.scrollHeight;
     }
   }, [messages]);
 
+  const loadOlderMessages = async () => {
+    if (!conversationId || !historyCursor || loadingOlder) return;
+    setLoadingOlder(true);
+    const page = await api.getConversationMessages(conversationId, historyCursor);
+    if (scrollRef.current) {
+      preserveScrollRef.current = scrollRef.current.scrollHeight - scrollRef.current.scrollTop;
+    }
+    setMessages((prev) => [...page.items.map(toMessage), ...prev]);
+    setHistoryCursor(page.next_cursor);
+    setLoadingOlder(false);
+  };
+
+  const handleHistoryScroll = (e: React.UIEvent<HTMLDivElement>) => {
+    if (e.currentTarget.scrollTop < 50) {
+      loadOlderMessages();
+    }
+  };
+
   const handleSend = async () => {
     if (!input.trim() || loading) return;
 
@@ -340,7 +372,18 @@ export function ChatWindow({
       </div>
 
       {/* Messages */}
-      <div className="flex-1 overflow-y-auto p-4 space-y-4" ref={scrollRef}>
+      <div className="flex-1 overflow-y-auto p-4 space-y-4" ref={scrollRef} onScroll={handleHistoryScroll}>
+        {mode === 'chat' && historyCursor && (
+          <div className="flex justify-center">
+            <button
+              onClick={loadOlderMessages}
+              className="text-xs text-slate-500 hover:text-slate-800 flex items-center gap-1"
+            >
+              {loadingOlder && <Loader2 className="animate-spin" size={12} />}
+              Load earlier messages
+            </button>
+          </div>
+        )}
         {loadingSummary && (
           <div className="flex items-center justify-center py-8">
             <Loader2 className="animate-spin text-blue-500" size={32} />
@@ -1,4 +1,5 @@
 "use client";
+import { useState } from 'react';
 import { MessageSquare, Clock, Trash2 } from 'lucide-react';
 import { cn } from '@/lib/utils';
 import { api } from '@/lib/api';
@@ -8,9 +9,23 @@ interface ConversationListProps {
     activeConversation: any;
     onSelectConversation: (conversation: any) => void;
     onConversationDeleted?: () => void;
+    hasMore?: boolean;
+    onLoadMore?: () => Promise<void>;
 }
 
-export function ConversationList({ conversations, activeConversation, onSelectConversation, onConversationDeleted }: ConversationListProps) {
+export function ConversationList({ conversations, activeConversation, onSelectConversation, onConversationDeleted, hasMore, onLoadMore }: ConversationListProps) {
+    const [loadingMore, setLoadingMore] = useState(false);
+
+    // Fetch the next page when the list is scrolled near the bottom
+    const handleScroll = async (e: React.UIEvent<HTMLDivElement>) => {
+        const el = e.currentTarget;
+        if (!hasMore || loadingMore || !onLoadMore) return;
+        if (el.scrollHeight - el.scrollTop - el.clientHeight < 100) {
+            setLoadingMore(true);
+            await onLoadMore();
+            setLoadingMore(false);
+        }
+    };
 
     // ... keep formatTime function ...
     const formatTime = (timestamp: string) => {
@@ -43,7 +58,7 @@ export function ConversationList({ conversations, activeConversation, onSelectCo
     };
 
     return (
-        <div className="flex-1 overflow-y-auto">
+        <div className="flex-1 overflow-y-auto" onScroll={handleScroll}>
             {conversations.length === 0 ? (
                 <div className="p-8 text-center text-slate-400">
                     <MessageSquare size={48} className="mx-auto mb-2 opacity-50" />
@@ -82,6 +97,19 @@ export function ConversationList({ conversations, activeConversation, onSelectCo
                     </div>
                 ))
             )}
+            {hasMore && (
+                <button
+                    onClick={async () => {
+                        if (!onLoadMore || loadingMore) return;
+                        setLoadingMore(true);
+                        await onLoadMore();
+                        setLoadingMore(false);
+                    }}
+                    className="w-full p-3 text-xs text-slate-500 hover:bg-slate-50"
+                >
+                    {loadingMore ? 'Loading...' : 'Load more'}
+                </button>
+            )}
         </div>
     );
 }
\ No newline at end of file
@@ -3,6 +3,20 @@ import axios from 'axios';
 
 const API_URL = 'http://localhost:8000';
 
+// Loads every page of a paginated list endpoint ({ items, next_cursor })
+const fetchAllPages = async (url: string) => {
+  const items: any[] = [];
+  let cursor: string | null = null;
+  do {
+    const params: Record<string, any> = { limit: 200 };
+    if (cursor) params.cursor = cursor;
+    const response: any = await axios.get(url, { params });
+    items.push(...response.data.items);
+    cursor = response.data.next_cursor;
+  } while (cursor);
+  return items;
+};
+
 export const api = {
   // ... keep existing getAgents, getAgentById, createAgent, deleteAgent ...
 
@@ -82,8 +96,7 @@ export const api = {
 
   getKnowledgeGaps: async (agentId: string) => {
     try {
-      const response = await axios.get(`${API_URL}/agents/${agentId}/gaps`);
-      return response.data;
+      return await fetchAllPages(`${API_URL}/agents/${agentId}/gaps`);
     } catch (error) {
       console.error("Error fetching gaps:", error);
       return [];
@@ -92,8 +105,7 @@ export const api = {
 
   getTopics: async (agentId: string) => {
     try {
-      const response = await axios.get(`${API_URL}/agents/${agentId}/topics`);
-      return response.data;
+      return await fetchAllPages(`${API_URL}/agents/${agentId}/topics`);
     } catch (error) {
       console.error("Error fetching topics:", error);
       return [];
@@ -184,13 +196,14 @@ export const api = {
     }
   },
 
-  getChatHistory: async (agentId: string) => {
+  // Paginated: returns { items, next_cursor }; pass next_cursor to load older messages
+  getChatHistory: async (agentId: string, cursor?: string) => {
     try {
-      const response = await axios.get(`${API_URL}/agents/${agentId}/chat/history`);
+      const response = await axios.get(`${API_URL}/agents/${agentId}/chat/history`, { params: { cursor } });
       return response.data;
     } catch (error) {
       console.error("Error fetching chat history:", error);
-      return [];
+      return { items: [], next_cursor: null };
     }
   },
 
@@ -204,23 +217,25 @@ export const api = {
     }
   },
 
-  getConversations: async () => {
+  // Paginated: returns { items, next_cursor }; pass next_cursor to load the next page
+  getConversations: async (cursor?: string) => {
     try {
-      const response = await axios.get(`${API_URL}/conversations`);
+      const response = await axios.get(`${API_URL}/conversations`, { params: { cursor } });
       return response.data;
     } catch (error) {
       console.error("Error fetching conversations:", error);
-      return [];
+      return { items: [], next_cursor: null };
     }
   },
 
-  getConversationMessages: async (conversationId: string) => {
+  // Paginated: newest page first, messages chronological within a page
+  getConversationMessages: async (conversationId: string, cursor?: string) => {
     try {
-      const response = await axios.get(`${API_URL}/conversations/${conversationId}/messages`);
+      const response = await axios.get(`${API_URL}/conversations/${conversationId}/messages`, { params: { cursor } });
       return response.data;
     } catch (error) {
       console.error("Error fetching conversation messages:", error);
-      return [];
+      return { items: [], next_cursor: null };
     }
   },
 